@@ -0,0 +1,364 @@
+"""
+Benchmarks of gurps_dice hot paths.
+python benchmarks.py                          -> print JSON results
+python benchmarks.py --output base.json       -> save results
+python benchmarks.py --baseline base.json     -> compare with saved results
+python benchmarks.py --group roll --group parse
+"""
+import os
+import sys
+import random
+import itertools
+import json
+import time
+import timeit
+import argparse
+import platform
+import tempfile
+import subprocess
+import pickle
+import tracemalloc
+from array import array
+
+import gurps_dice
+import gurps_dice_instrumentation
+import gurps_dice_damage
+import gurps_dice_approximate
+import gurps_dice_table
+import gurps_dice_success
+import gurps_dice_bulk
+import gurps_dice_codec
+import gurps_dice_journal
+from gurps_dice import Dice, GurpsDice
+from gurps_dice_frozen import FrozenGurpsDice
+from gurps_dice_handful import HandfulDice
+
+BENCHMARK_GROUPS = {}
+
+
+def benchmark_group(name):
+    """
+    Register function which yields (case name, callable, operations per call)
+    """
+    def register(cases):
+        BENCHMARK_GROUPS[name] = cases
+        return cases
+    return register
+
+
+@benchmark_group('parse')
+def parse_cases():
+    for dice_str in ("1d6", "3d6+2", "100d6-10"):
+        yield "GurpsDice({!r}) cached".format(dice_str), lambda: GurpsDice(dice_str), 1
+
+        def uncached(dice_str=dice_str):
+            gurps_dice.clear_parse_cache()
+            GurpsDice(dice_str)
+        yield "GurpsDice({!r}) uncached".format(dice_str), uncached, 1
+        yield "GurpsDice.search_dice_in_str({!r})".format(dice_str), lambda: GurpsDice.search_dice_in_str(dice_str), 1
+
+
+@benchmark_group('roll')
+def roll_cases():
+    for count in (1, 3, 10, 50):
+        for face in (6, 20):
+            dice = Dice(count, face)
+            yield "Dice({:d}, {:d}).roll()".format(count, face), dice.roll, 1
+    dice = GurpsDice("3d6+2")
+    yield "GurpsDice('3d6+2').roll()", dice.roll, 1
+
+
+@benchmark_group('roll_many')
+def roll_many_cases():
+    for count in (3, 10):
+        for n in (1000, 100000):
+            dice = GurpsDice(count, 2)
+            yield "GurpsDice({:d}, 2).roll_many({:d})".format(count, n), lambda: dice.roll_many(n), n
+    handful = HandfulDice(Dice("2d6"), Dice("1d8"), Dice("3d4"), bonus=1)
+    yield "HandfulDice(2d6+1d8+3d4+1).roll_many(100000)", lambda: handful.roll_many(100000), 100000
+
+
+@benchmark_group('arithmetic')
+def arithmetic_cases():
+    dice1, dice2 = GurpsDice("3d6+2"), GurpsDice("1d6-1")
+    yield "GurpsDice + GurpsDice", lambda: dice1 + dice2, 1
+    yield "GurpsDice + int", lambda: dice1 + 1, 1
+    frozen1, frozen2 = FrozenGurpsDice("3d6+2"), FrozenGurpsDice("1d6-1")
+    yield "FrozenGurpsDice + FrozenGurpsDice", lambda: frozen1 + frozen2, 1
+    yield "FrozenGurpsDice + int", lambda: frozen1 + 1, 1
+    handful1 = HandfulDice(Dice("2d6"), Dice("1d8"), bonus=1)
+    handful2 = HandfulDice(Dice("1d8"), Dice("1d20"), bonus=-3)
+    yield "HandfulDice + HandfulDice", lambda: handful1 + handful2, 1
+    yield "HandfulDice + Dice", lambda: handful1 + dice2, 1
+    dices = [Dice(1, face) for face in (4, 6, 8, 10, 12, 20)] * 500
+
+    def accumulate():
+        handful = HandfulDice()
+        handful.extend(dices)
+    yield "HandfulDice().extend(3000 x Dice)", accumulate, len(dices)
+
+
+@benchmark_group('rounding')
+def rounding_cases():
+    for bonus in (3, 30, 300, -30):
+        for round_seven in (True, False):
+            def round_dice(bonus=bonus, round_seven=round_seven):
+                GurpsDice(100, bonus).round(round_seven)
+            yield "GurpsDice(100, {:d}).round(round_seven={})".format(bonus, round_seven), round_dice, 1
+        dice = GurpsDice(100, bonus)
+        yield "GurpsDice(100, {:d}).rounded()".format(bonus), dice.rounded, 1
+
+
+@benchmark_group('roll_engine')
+def roll_engine_cases():
+    rng = random.Random(1)
+    max_outcomes = gurps_dice.ALIAS_MAX_OUTCOMES
+    for engine in gurps_dice.ROLL_ENGINES:
+        for count in (1, 3, 10, 50):
+            dice = Dice(count, 6)
+
+            def roll(dice=dice, engine=engine):
+                gurps_dice.set_roll_engine(engine)
+                gurps_dice.ALIAS_MAX_OUTCOMES = 0
+                dice.roll(rng)
+            yield "{} Dice({:d}, 6).roll()".format(engine, count), roll, 1
+
+        def roll_batch(engine=engine):
+            gurps_dice.set_roll_engine(engine)
+            gurps_dice.ALIAS_MAX_OUTCOMES = 0
+            gurps_dice.roll_many(3, 6, 100000, rng=rng)
+        yield "{} roll_many(3, 6, 100000) by random.Random".format(engine), roll_batch, 100000
+    gurps_dice.set_roll_engine('randint')
+    gurps_dice.ALIAS_MAX_OUTCOMES = max_outcomes
+
+
+@benchmark_group('alias')
+def alias_cases():
+    rng = random.Random(1)
+    max_outcomes = gurps_dice.ALIAS_MAX_OUTCOMES
+    for sampler, outcomes in (('alias', max_outcomes), ('dices', 0)):
+        for count in (3, 10, 50):
+            dice = GurpsDice(count, 2)
+
+            def roll(dice=dice, outcomes=outcomes):
+                gurps_dice.ALIAS_MAX_OUTCOMES = outcomes
+                dice.roll(rng)
+            yield "{} GurpsDice({:d}, 2).roll()".format(sampler, count), roll, 1
+
+            def roll_batch(dice=dice, outcomes=outcomes):
+                gurps_dice.ALIAS_MAX_OUTCOMES = outcomes
+                dice.roll_many(100000)
+            yield "{} GurpsDice({:d}, 2).roll_many(100000)".format(sampler, count), roll_batch, 100000
+    gurps_dice.ALIAS_MAX_OUTCOMES = max_outcomes
+
+
+@benchmark_group('approximate')
+def approximate_cases():
+    dice = Dice("1000d6")
+    yield "exact Dice('1000d6').roll()", dice.roll, 1
+    yield "exact Dice('1000d6').roll_many(1000)", lambda: dice.roll_many(1000), 1000
+    with gurps_dice_approximate.approximated():
+        yield "approximate Dice('1000d6').roll()", dice.roll, 1
+        yield "approximate Dice('1000d6').roll_many(1000)", lambda: dice.roll_many(1000), 1000
+
+
+@benchmark_group('table')
+def table_cases():
+    def convolve():
+        gurps_dice.clear_distribution_cache()
+        gurps_dice.get_distribution(100, 6)
+    yield "get_distribution(100, 6) convolved", convolve, 1
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dice.table")
+        gurps_dice_table.write_table(path, range(1, 101), [6, 20])
+        yield "DistributionTable() of 200 distributions", lambda: gurps_dice_table.DistributionTable(path).close(), 1
+        table = gurps_dice_table.load(path)
+        yield "get_distribution(100, 6) mapped", convolve, 1
+        yield "mapped get_distribution(100, 6).cdf(350)", lambda: gurps_dice.get_distribution(100, 6).cdf(350), 1
+        gurps_dice_table.unload()
+        table.close()
+
+
+@benchmark_group('cli_startup')
+def cli_startup_cases():
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gurps_dice_cli.py')
+    dice_lines = "3d6+2\n1d20\n2d6+1d8-3\n"
+    for args in (['validate'], ['summarize'], ['roll'], ['roll', '--times', '1000']):
+        def start(args=args):
+            subprocess.run([sys.executable, cli] + args, input=dice_lines, stdout=subprocess.DEVNULL, universal_newlines=True, check=True)
+        yield "python gurps_dice_cli.py {}".format(' '.join(args)), start, 1
+    yield "python -c 'import gurps_dice'", lambda: subprocess.run([sys.executable, '-c', 'import gurps_dice'], cwd=os.path.dirname(cli), check=True), 1
+
+
+@benchmark_group('contest')
+def contest_cases():
+    n = 10000
+    skills1, skills2 = [12, 14, 9, 16] * (n // 4), [10, 13, 11, 15] * (n // 4)
+    dice = GurpsDice("3d6")
+
+    def object_loop():
+        for skill1, skill2 in zip(skills1, skills2):
+            margin = (skill1 - dice.roll()) - (skill2 - dice.roll())
+    yield "GurpsDice('3d6').roll() pairs x {:d}".format(n), object_loop, n
+    yield "quick_contest() of {:d} pairs".format(n), lambda: gurps_dice_success.quick_contest(skills1, skills2), n
+    yield "regular_contest() of {:d} pairs".format(n), lambda: gurps_dice_success.regular_contest(skills1, skills2), n
+    yield "win_probability(12, 10)", lambda: gurps_dice_success.win_probability(12, 10), 1
+
+
+@benchmark_group('modifiers')
+def modifiers_cases():
+    rng = random.Random(1)
+    for dice_str in ("4d6kh3", "10d6kh3", "10d6r2!"):
+        dice = Dice(dice_str)
+        yield "Dice('{}').roll()".format(dice_str), lambda dice=dice: dice.roll(rng), 1
+        yield "Dice('{}').roll_many(100000)".format(dice_str), lambda dice=dice: dice.roll_many(100000), 100000
+
+    def keep_distribution(count):
+        gurps_dice.clear_distribution_cache()
+        Dice(count, 6, keep_highest=3).distribution()
+    yield "Dice('10d6kh3').distribution() by dynamic programming", lambda: keep_distribution(10), 1
+    yield "Dice('100d6kh3').distribution() by dynamic programming", lambda: keep_distribution(100), 1
+    faces = range(1, 7)
+    yield "enumeration of 6 ** 6 outcomes of 6d6kh3", lambda: [sum(sorted(dices)[-3:]) for dices in itertools.product(faces, repeat=6)], 1
+
+
+@benchmark_group('codec')
+def codec_cases():
+    n = 1000
+    dices = [GurpsDice(count % 10 + 1, count % 7 - 3) for count in range(n)]
+    text = '\n'.join(map(str, dices))
+    binary = bytes(gurps_dice_codec.encode_many(dices))
+    yield "str form of {:d} GurpsDice ({:d} bytes)".format(n, len(text.encode())), lambda: '\n'.join(map(str, dices)), n
+    yield "binary form of {:d} GurpsDice ({:d} bytes)".format(n, len(binary)), lambda: gurps_dice_codec.encode_many(dices), n
+    yield "GurpsDice() of {:d} str".format(n), lambda: [GurpsDice(dice_str) for dice_str in text.split('\n')], n
+    yield "decode_many() of {:d} binary GurpsDice".format(n), lambda: gurps_dice_codec.decode_many(binary), n
+    yield "parse_many() of {:d} str".format(n), lambda: gurps_dice_bulk.parse_many(text.split('\n')), n
+    yield "decode_columns() of {:d} binary GurpsDice".format(n), lambda: gurps_dice_codec.decode_columns(binary), n
+    yield "pickle of {:d} GurpsDice ({:d} bytes)".format(n, len(pickle.dumps(dices))), lambda: pickle.loads(pickle.dumps(dices)), n
+    results = gurps_dice.roll_many(3, 6, 100000)
+    text = ' '.join(map(str, results))
+    yield "str form of 100000 roll results", lambda: array('q', map(int, text.split())), 100000
+    yield "binary form of 100000 roll results", lambda: gurps_dice_codec.decode_results(gurps_dice_codec.encode_results(results)), 100000
+
+
+@benchmark_group('journal')
+def journal_cases():
+    dice = GurpsDice("3d6+2")
+    n = 100000
+    yield "GurpsDice('3d6+2').roll() not journaled", dice.roll, 1
+    with tempfile.TemporaryDirectory() as directory:
+        journal = gurps_dice_journal.RollJournal(directory)
+        with gurps_dice_journal.journaled(journal):
+            yield "GurpsDice('3d6+2').roll() journaled", dice.roll, 1
+            for i in range(n):
+                dice.roll()
+        journal.close()
+        with tempfile.TemporaryFile('w') as log:
+            def text_log():
+                roll_result = dice.roll()
+                log.write("{:.6f}\t{}\t{:d}\n".format(time.time(), dice, roll_result))
+            yield "GurpsDice('3d6+2').roll() logged as text line", text_log, 1
+        yield "iter_records() of {:d} records".format(n), lambda: sum(1 for record in gurps_dice_journal.iter_records(directory)), n
+        yield "iter_records(dice='1d6') of {:d} records".format(n), lambda: sum(1 for record in gurps_dice_journal.iter_records(directory, dice='1d6')), n
+        if gurps_dice._import_numpy() is not None:
+            yield "read_array(dice='3d6+2') of {:d} records".format(n), lambda: gurps_dice_journal.read_array(directory, dice='3d6+2'), n
+        yield "replay() of {:d} records".format(n), lambda: gurps_dice_journal.replay(directory), n
+
+
+@benchmark_group('damage')
+def damage_cases():
+    yield "GurpsDice('2d6+1') parsed", lambda: GurpsDice("2d6+1"), 1
+    yield "swing(15) lookup", lambda: gurps_dice_damage.swing(15), 1
+    yield "damage(15, 'sw', 2)", lambda: gurps_dice_damage.damage(15, gurps_dice_damage.SWING, 2), 1
+
+
+@benchmark_group('instrumentation')
+def instrumentation_cases():
+    dice = GurpsDice("3d6+2")
+    yield "GurpsDice('3d6+2').roll() disabled", lambda: dice.roll(), 1
+    with gurps_dice_instrumentation.instrumented():
+        yield "GurpsDice('3d6+2').roll() enabled", lambda: dice.roll(), 1
+    gurps_dice_instrumentation.reset()
+
+
+def measure(func, ops, min_time=0.2):
+    """
+    Return dict with ops/sec, ns/op and peak memory of func
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    runs = [elapsed]
+    while sum(runs) < min_time:
+        runs.append(timer.timeit(number))
+    best = min(runs) / number
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'ops_per_sec': ops / best,
+        'ns_per_op': best * 1e9 / ops,
+        'peak_memory': peak,
+    }
+
+
+def run(groups=None, min_time=0.2):
+    """
+    Run benchmark groups and return results dict
+    """
+    results = {}
+    for group, cases in BENCHMARK_GROUPS.items():
+        if groups and group not in groups:
+            continue
+        for name, func, ops in cases():
+            results["{}: {}".format(group, name)] = measure(func, ops, min_time=min_time)
+    return {
+        'python': platform.python_version(),
+        'numpy': gurps_dice._import_numpy() is not None,
+        'time': time.time(),
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Return list of (case, baseline ns/op, ns/op, ratio) slower than baseline by threshold
+    """
+    regressions = []
+    for name, current in results['results'].items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        ratio = current['ns_per_op'] / previous['ns_per_op']
+        if ratio > 1 + threshold:
+            regressions.append((name, previous['ns_per_op'], current['ns_per_op'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of gurps_dice hot paths")
+    parser.add_argument('--group', action='append', choices=sorted(BENCHMARK_GROUPS), help="run only this group")
+    parser.add_argument('--output', help="save JSON results to file")
+    parser.add_argument('--baseline', help="compare with JSON results from file")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed slowdown against baseline")
+    parser.add_argument('--min-time', type=float, default=0.2, help="minimal time to run every case, sec")
+    args = parser.parse_args(argv)
+
+    results = run(args.group, min_time=args.min_time)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), threshold=args.threshold)
+        for name, previous, current, ratio in regressions:
+            sys.stderr.write("{}: {:.1f} ns/op -> {:.1f} ns/op ({:+.0%})\n".format(name, previous, current, ratio - 1))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
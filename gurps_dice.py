@@ -1,5 +1,32 @@
 import re
+import sys
+import math
 import random
+import operator
+import functools
+from array import array
+from collections import namedtuple
+
+# numpy is imported by _import_numpy() on the first vectorized use,
+# so processes which never roll vectorized start without it.
+# It's None before that and if it's not installed
+numpy = None
+_numpy_imported = False
+
+
+def _import_numpy():
+    """
+    Return numpy module or None if it's not installed, it's imported once
+    """
+    global numpy, _numpy_imported
+    if not _numpy_imported:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+        _numpy_imported = True
+    return numpy
 
 
 class DiceError(Exception):
@@ -22,6 +49,811 @@ class DiceBonusError(DiceError):
     pass
 
 
+class DiceModifierError(DiceError):
+    pass
+
+
+class DiceDistribution(object):
+    """
+    Exact probability distribution of the sum of dices.
+    cumulative[i] is the number of outcomes which give not more than minimum + i,
+    total is the number of all outcomes, ways are computed from cumulative.
+    The table is shared, so shift() is cheap.
+    DiceDistribution.pmf(value) -> P(X == value)
+    DiceDistribution.cdf(value) -> P(X <= value)
+    """
+
+    def __init__(self, ways=None, minimum=0, cumulative=None):
+        if cumulative is None:
+            cumulative = _accumulate(ways)
+        self.minimum = minimum
+        self.cumulative = cumulative
+        self.total = cumulative[-1]
+
+    def __repr__(self):
+        return "DiceDistribution({:d}..{:d})".format(self.minimum, self.maximum)
+
+    def __len__(self):
+        return len(self.cumulative)
+
+    def __iter__(self):
+        previous = 0
+        for i, running in enumerate(self.cumulative):
+            yield self.minimum + i, (running - previous) / self.total
+            previous = running
+
+    @property
+    def maximum(self):
+        return self.minimum + len(self.cumulative) - 1
+
+    @property
+    def ways(self):
+        """
+        Return tuple where ways[i] is the number of outcomes which give minimum + i
+        """
+        cumulative = self.cumulative
+        return (cumulative[0],) + tuple(map(operator.sub, cumulative[1:], cumulative[:-1]))
+
+    def shift(self, bonus):
+        """
+        Return the same distribution moved by bonus
+        """
+        return DiceDistribution(minimum=self.minimum + bonus, cumulative=self.cumulative)
+
+    def pmf(self, value):
+        """
+        Return the probability that the sum is equal to value
+        """
+        index = value - self.minimum
+        if 0 <= index < len(self.cumulative):
+            return (self.cumulative[index] - (self.cumulative[index - 1] if index else 0)) / self.total
+        return 0.0
+
+    def cdf(self, value):
+        """
+        Return the probability that the sum is less than or equal to value
+        """
+        index = value - self.minimum
+        if index < 0:
+            return 0.0
+        if index >= len(self.cumulative):
+            return 1.0
+        return self.cumulative[index] / self.total
+
+    def sf(self, value):
+        """
+        Return the probability that the sum is greater than value
+        """
+        index = value - self.minimum
+        if index < 0:
+            return 1.0
+        if index >= len(self.cumulative):
+            return 0.0
+        return (self.total - self.cumulative[index]) / self.total
+
+    def probability_at_least(self, value):
+        """
+        Return the probability that the sum is greater than or equal to value
+        """
+        return self.sf(value - 1)
+
+    def probability_at_most(self, value):
+        """
+        Return the probability that the sum is less than or equal to value
+        """
+        return self.cdf(value)
+
+    def mean(self):
+        """
+        Return the expected value of the sum
+        """
+        total = self.total
+        return sum(total - running for running in self.cumulative[:-1]) / total + self.minimum
+
+
+def _accumulate(ways):
+    cumulative = []
+    running = 0
+    for w in ways:
+        running += w
+        cumulative.append(running)
+    return tuple(cumulative)
+
+
+def _add_die(ways, face):
+    """
+    Convolve ways with one more <face> dice by the running window sum
+    """
+    result = []
+    window = 0
+    for i in range(len(ways) + face - 1):
+        if i < len(ways):
+            window += ways[i]
+        if i >= face:
+            window -= ways[i - face]
+        result.append(window)
+    return result
+
+
+DISTRIBUTION_CACHE_SIZE = 256
+# DistributionTable of precomputed distributions, it's set by gurps_dice_table.load()
+_distribution_table = None
+
+
+@functools.lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def get_distribution(count, face):
+    """
+    Return DiceDistribution of the sum of <count>d<face>.
+    It's taken from the loaded distribution table if it's there,
+    otherwise it's computed by convolution. It's memoized per (count, face),
+    at most DISTRIBUTION_CACHE_SIZE distributions are kept
+    """
+    if not count or not face:
+        return DiceDistribution((1,), minimum=0)
+    if _distribution_table is not None:
+        distribution = _distribution_table.get(count, face)
+        if distribution is not None:
+            return distribution
+    ways = [1]
+    for i in range(count):
+        ways = _add_die(ways, face)
+    return DiceDistribution(ways, minimum=count)
+
+
+def clear_distribution_cache():
+    """
+    Forget all memoized distributions and alias tables
+    """
+    get_distribution.cache_clear()
+    get_modified_distribution.cache_clear()
+    _numpy_alias_table.cache_clear()
+    _modified_die.cache_clear()
+    _alias_table.cache_clear()
+
+
+_ROLL_CHUNK = 1 << 20
+
+# Roll engines of random.Random: 'randint' makes one randint call per dice,
+# 'bits' makes one getrandbits call per roll or per several rolls of roll_many
+ROLL_ENGINES = ('randint', 'bits')
+_roll_engine = 'randint'
+# Largest table of digit sums of the bits engine
+_DIGIT_TABLE_SIZE = 1 << 16
+# Longest draw of the bits engine when several rolls are packed to one getrandbits call
+_BATCH_BITS = 64
+# Longest draw of the bits engine for one roll, more dices are drawn by blocks
+_DRAW_BITS = 1024
+_digit_tables = {}
+_batch_plans = {}
+
+
+def set_roll_engine(engine):
+    """
+    Select how dices are rolled by random.Random, it's 'randint' or 'bits'.
+    numpy.random.Generator always rolls vectorized
+    """
+    global _roll_engine
+    if engine not in ROLL_ENGINES:
+        raise ValueError("roll engine should be one of {}".format(ROLL_ENGINES))
+    _roll_engine = engine
+
+
+def get_roll_engine():
+    return _roll_engine
+
+
+def _digit_table(face):
+    """
+    Return (base, table) where table[i] is sum of base <face> digits of i < base,
+    table is None for faces bigger than _DIGIT_TABLE_SIZE
+    """
+    digit_table = _digit_tables.get(face)
+    if digit_table is None:
+        if face > _DIGIT_TABLE_SIZE:
+            return face, None
+        base = face
+        while base * face <= _DIGIT_TABLE_SIZE:
+            base *= face
+        table = array('q', [0]) * base
+        for i in range(1, base):
+            table[i] = table[i // face] + i % face
+        digit_table = _digit_tables[face] = base, table
+    return digit_table
+
+
+def _uniform(n, getrandbits):
+    """
+    Return uniform int from range(n) by rejection of getrandbits draws
+    """
+    bits = (n - 1).bit_length()
+    value = getrandbits(bits)
+    while value >= n:
+        value = getrandbits(bits)
+    return value
+
+
+def _digit_sum(value, face):
+    """
+    Return sum of base <face> digits of value
+    """
+    base, table = _digit_table(face)
+    digit_sum = 0
+    if table is None:
+        while value:
+            value, digit = divmod(value, face)
+            digit_sum += digit
+        return digit_sum
+    while value:
+        value, digits = divmod(value, base)
+        digit_sum += table[digits]
+    return digit_sum
+
+
+def _roll_sum_bits(count, face, rng):
+    """
+    Roll <count>d<face> by uniform draws from range(face ** dices) for blocks of dices,
+    base <face> digits of the draw are the dices minus one
+    """
+    if face == 1:
+        return count
+    getrandbits = rng.getrandbits
+    outcomes = face ** count
+    bits = (outcomes - 1).bit_length()
+    if bits <= _DRAW_BITS:
+        value = getrandbits(bits)
+        while value >= outcomes:
+            value = getrandbits(bits)
+        base, table = _digit_table(face)
+        if value < base and table is not None:
+            return table[value] + count
+        return _digit_sum(value, face) + count
+    block = max(1, _DRAW_BITS // face.bit_length())
+    roll_result = count
+    for start in range(0, count, block):
+        dices = min(block, count - start)
+        roll_result += _digit_sum(_uniform(face ** dices, getrandbits), face)
+    return roll_result
+
+
+def _batch_plan(count, face):
+    """
+    Return (number of rolls by draw, face ** count) for roll_many of bits engine.
+    Number of rolls is chosen for the most rolls by getrandbits call
+    with rejected draws
+    """
+    plan = _batch_plans.get((count, face))
+    if plan is None:
+        outcomes = face ** count
+        best_rolls, best_rate = 1, 0.0
+        rolls = 1
+        while rolls == 1 or (outcomes ** rolls - 1).bit_length() <= _BATCH_BITS:
+            draw = outcomes ** rolls
+            rate = rolls * draw / (1 << (draw - 1).bit_length())
+            if rate > best_rate:
+                best_rolls, best_rate = rolls, rate
+            rolls += 1
+        plan = _batch_plans[(count, face)] = best_rolls, outcomes
+    return plan
+
+
+def _roll_many_bits(count, face, n, bonus, rng):
+    """
+    Roll <count>d<face>+<bonus> n times and return array of results,
+    several rolls are decoded from one uniform draw
+    """
+    if face == 1:
+        return array('q', [count + bonus]) * n
+    if (face ** count).bit_length() > _BATCH_BITS:
+        return array('q', [_roll_sum_bits(count, face, rng) + bonus for i in range(n)])
+    rolls_by_draw, outcomes = _batch_plan(count, face)
+    draw = outcomes ** rolls_by_draw
+    bits = (draw - 1).bit_length()
+    getrandbits = rng.getrandbits
+    base, table = _digit_table(face)
+    bonus += count
+    results = array('q')
+    append = results.append
+    for start in range(0, n, rolls_by_draw):
+        value = getrandbits(bits)
+        while value >= draw:
+            value = getrandbits(bits)
+        if table is not None and outcomes <= base:
+            for i in range(min(rolls_by_draw, n - start)):
+                value, roll = divmod(value, outcomes)
+                append(table[roll] + bonus)
+        else:
+            for i in range(min(rolls_by_draw, n - start)):
+                value, roll = divmod(value, outcomes)
+                append(_digit_sum(roll, face) + bonus)
+    return results
+
+
+def _is_numpy_rng(rng):
+    # numpy.random.Generator of the caller means numpy is imported even if gurps_dice did not import it
+    module = numpy or sys.modules.get('numpy')
+    return module is not None and isinstance(rng, module.random.Generator)
+
+
+# Alias tables sample the sum of <count>d<face> by one uniform draw whatever count is.
+# A table is built from the distribution when expected rolls cover its outcomes:
+# n for roll_many, ALIAS_EXPECTED_ROLLS for single rolls which are repeated by callers.
+# Roll engines roll the rest, ALIAS_MAX_OUTCOMES = 0 turns alias tables off
+ALIAS_CACHE_SIZE = 128
+ALIAS_EXPECTED_ROLLS = 256
+ALIAS_MAX_OUTCOMES = 4096
+
+
+def _use_alias(count, face, n):
+    """
+    Return True if n rolls of <count>d<face> are worth an alias table
+    """
+    if count < 2 or face < 2:
+        return False
+    outcomes = count * (face - 1) + 1
+    return outcomes <= ALIAS_MAX_OUTCOMES and outcomes <= max(n, ALIAS_EXPECTED_ROLLS)
+
+
+@functools.lru_cache(maxsize=ALIAS_CACHE_SIZE)
+def _alias_table(count, face):
+    """
+    Return (probabilities, aliases) of Vose alias method for the sum of <count>d<face> minus count.
+    Table is paired by exact ints, so only float rounding of probabilities is left
+    """
+    distribution = get_distribution(count, face)
+    total = distribution.total
+    size = len(distribution)
+    scaled = [ways * size for ways in distribution.ways]
+    probabilities = array('d', [1.0]) * size
+    aliases = array('q', range(size))
+    small = [i for i in range(size) if scaled[i] < total]
+    large = [i for i in range(size) if scaled[i] >= total]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less] = scaled[less] / total
+        aliases[less] = more
+        scaled[more] -= total - scaled[less]
+        (small if scaled[more] < total else large).append(more)
+    return probabilities, aliases
+
+
+@functools.lru_cache(maxsize=ALIAS_CACHE_SIZE)
+def _numpy_alias_table(count, face):
+    """
+    Return alias table of <count>d<face> as numpy arrays which share the memory of _alias_table()
+    """
+    probabilities, aliases = _alias_table(count, face)
+    return numpy.frombuffer(probabilities), numpy.frombuffer(aliases, dtype=numpy.int64)
+
+
+def _roll_sum_alias(count, face, rng):
+    """
+    Roll <count>d<face> once by alias table and one uniform float
+    """
+    probabilities, aliases = _alias_table(count, face)
+    draw = rng.random() * len(probabilities)
+    i = int(draw)
+    return count + (i if draw - i < probabilities[i] else aliases[i])
+
+
+def _roll_many_alias(count, face, n, bonus, rng):
+    """
+    Roll <count>d<face>+<bonus> n times by alias table and return array of results
+    """
+    probabilities, aliases = _alias_table(count, face)
+    size = len(probabilities)
+    bonus += count
+    if (rng is None or _is_numpy_rng(rng)) and _import_numpy() is not None:
+        numpy_probabilities, numpy_aliases = _numpy_alias_table(count, face)
+        integers = rng.integers if rng is not None else numpy.random.randint
+        uniform = rng.random if rng is not None else numpy.random.random_sample
+        draws = integers(0, size, size=n)
+        results = numpy.where(uniform(n) < numpy_probabilities[draws], draws, numpy_aliases[draws])
+        results += bonus
+        return results
+    uniform = (rng or random).random
+    results = array('q')
+    append = results.append
+    for j in range(n):
+        draw = uniform() * size
+        i = int(draw)
+        append((i if draw - i < probabilities[i] else aliases[i]) + bonus)
+    return results
+
+
+# (min count, roll_sum, roll_many) of approximate sampler, it's set by gurps_dice_approximate.enable()
+_approximation = None
+# RollJournal which records Dice.roll() and GurpsDice.roll(), it's set by gurps_dice_journal.enable()
+_journal = None
+
+
+def roll_sum(count, face, rng=None):
+    """
+    Roll <count>d<face> once and return the sum.
+    rng is random.Random or numpy.random.Generator,
+    module random is used by default
+    """
+    roll_result = 0
+    if face and count:
+        if _approximation is not None and count >= _approximation[0]:
+            return _approximation[1](count, face, rng)
+        if _use_alias(count, face, 1):
+            return _roll_sum_alias(count, face, rng or random)
+        if _is_numpy_rng(rng):
+            return int(rng.integers(1, face + 1, size=count).sum())
+        if _roll_engine == 'bits':
+            return _roll_sum_bits(count, face, rng or random)
+        randint = (rng or random).randint
+        for i in range(count):
+            roll_result += randint(1, face)
+    return roll_result
+
+
+def _check_roll_times(n):
+    if not isinstance(n, int):
+        raise TypeError("unsupported type for number of rolls: '{}'".format(type(n)))
+    elif n < 0:
+        raise ValueError("number of rolls can not be less than zero")
+
+
+def roll_many(count, face, n, bonus=0, rng=None):
+    """
+    Roll <count>d<face>+<bonus> n times and return array of results.
+    It's vectorized by numpy if it's installed and rng is None
+    or numpy.random.Generator, otherwise it's array('q') filled by one
+    choices call per chunk of random.Random (module random by default),
+    or by the bits engine if it's selected by set_roll_engine().
+    Sums of several dices are drawn from cached alias table
+    when n rolls are worth building it
+    """
+    _check_roll_times(n)
+    if _approximation is not None and face and count >= _approximation[0]:
+        return _approximation[2](count, face, n, bonus, rng)
+    if _use_alias(count, face, n):
+        return _roll_many_alias(count, face, n, bonus, rng)
+    if (rng is None or _is_numpy_rng(rng)) and _import_numpy() is not None:
+        if not count or not face:
+            return numpy.full(n, bonus, dtype=numpy.int64)
+        integers = rng.integers if rng is not None else numpy.random.randint
+        results = numpy.empty(n, dtype=numpy.int64)
+        rows = max(1, _ROLL_CHUNK // count)
+        for start in range(0, n, rows):
+            stop = min(start + rows, n)
+            draws = integers(1, face + 1, size=(stop - start, count))
+            numpy.sum(draws, axis=1, out=results[start:stop])
+        results += bonus
+        return results
+    if not count or not face:
+        return array('q', [bonus]) * n
+    if _roll_engine == 'bits':
+        return _roll_many_bits(count, face, n, bonus, rng or random)
+    results = array('q')
+    faces = range(1, face + 1)
+    choices = (rng or random).choices
+    rows = max(1, _ROLL_CHUNK // count)
+    for start in range(0, n, rows):
+        draws = choices(faces, k=min(rows, n - start) * count)
+        if count == 1:
+            results.extend([draw + bonus for draw in draws] if bonus else draws)
+        else:
+            results.extend([sum(draws[i:i + count]) + bonus for i in range(0, len(draws), count)])
+    return results
+
+
+def add_rolls(results, other):
+    """
+    Add two arrays of roll results element by element
+    """
+    if numpy is not None:
+        return numpy.add(results, other)
+    return array('q', map(operator.add, results, other))
+
+
+# Dice modifiers
+# Exploding dices are rolled again on the max face and the rolls are added,
+# a dice explodes at most MAX_EXPLOSIONS times, so distributions are exact and finite
+MAX_EXPLOSIONS = 10
+
+
+class DiceModifiers(namedtuple('DiceModifiers', ['explode', 'reroll', 'keep_highest', 'keep_lowest'])):
+    """
+    Modifiers of Dice, they are applied to every dice in this order:
+    reroll: dice less than reroll is rolled once again and the second roll stays,
+    explode: dice with the max face is rolled again and added,
+    keep_highest, keep_lowest: only so many highest (lowest) dices are summed.
+    str(DiceModifiers(explode=True, keep_highest=3)) -> "!kh3"
+    """
+    __slots__ = ()
+
+    def __new__(cls, explode=False, reroll=0, keep_highest=0, keep_lowest=0):
+        return super(DiceModifiers, cls).__new__(cls, explode, reroll, keep_highest, keep_lowest)
+
+    def __bool__(self):
+        return bool(self.explode or self.reroll or self.keep_highest or self.keep_lowest)
+
+    def __str__(self):
+        modifiers_str = "r{:d}".format(self.reroll) if self.reroll else ''
+        if self.explode:
+            modifiers_str += '!'
+        if self.keep_highest:
+            modifiers_str += "kh{:d}".format(self.keep_highest)
+        elif self.keep_lowest:
+            modifiers_str += "kl{:d}".format(self.keep_lowest)
+        return modifiers_str
+
+    @property
+    def keep(self):
+        return self.keep_highest or self.keep_lowest
+
+
+NO_MODIFIERS = DiceModifiers()
+
+
+def _check_modifiers(count, face, modifiers):
+    """
+    Check modifiers of <count>d<face>.
+    Return True if it's Ok
+    Rise error's if something not Ok
+    """
+    if not isinstance(modifiers.explode, bool):
+        raise DiceModifierError("unsupported type for dice explode: '%s'" % type(modifiers.explode))
+    for name in ('reroll', 'keep_highest', 'keep_lowest'):
+        value = getattr(modifiers, name)
+        if not isinstance(value, int):
+            raise DiceModifierError("unsupported type for dice {}: '{}'".format(name, type(value)))
+        elif value < 0:
+            raise DiceModifierError("dice {} can not be less than zero".format(name))
+    if modifiers.explode and face == 1:
+        raise DiceModifierError("dice with one face can not explode")
+    if modifiers.reroll > face:
+        raise DiceModifierError("dice reroll can not be more than dice face")
+    if modifiers.keep_highest and modifiers.keep_lowest:
+        raise DiceModifierError("dice can not keep both highest and lowest")
+    if modifiers.keep > count:
+        raise DiceModifierError("dice can not keep more than dice count")
+    return True
+
+
+def _explode_once(first, rest):
+    """
+    Return ways of one roll with ways first of values 1..face
+    followed by the roll with ways rest when it's the max face
+    """
+    total = sum(rest)
+    return [w * total for w in first[:-1]] + [0] + [first[-1] * w for w in rest]
+
+
+@functools.lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def _modified_die(face, reroll, explode):
+    """
+    Return tuple where ways[i] is the number of outcomes which give 1 + i
+    for one <face> dice with reroll and explode
+    """
+    if reroll > 1:
+        # face * face outcomes of two rolls, the second one counts only after a reroll
+        ways = [face * (value >= reroll) + reroll - 1 for value in range(1, face + 1)]
+    else:
+        ways = [1] * face
+    if explode and MAX_EXPLOSIONS:
+        rest = [1] * face
+        for i in range(MAX_EXPLOSIONS - 1):
+            rest = _explode_once([1] * face, rest)
+        ways = _explode_once(ways, rest)
+    return tuple(ways)
+
+
+def _convolve(ways, other):
+    result = [0] * (len(ways) + len(other) - 1)
+    for i, w in enumerate(ways):
+        if w:
+            for j, v in enumerate(other):
+                result[i + j] += w * v
+    return result
+
+
+def _keep_ways(die, count, keep, highest):
+    """
+    Return (ways, minimum) of the sum of keep highest (lowest) of count dices with ways die.
+    Values are taken from the highest (lowest) with states {(dices taken, kept sum): ways},
+    comb(count - taken, m) * w ** m ways put m more dices on the value,
+    so it's values * count ** 2 * sums steps instead of outcomes ** count
+    """
+    states = {0: {0: 1}}
+    values = range(len(die), 0, -1) if highest else range(1, len(die) + 1)
+    for value in values:
+        w = die[value - 1]
+        if not w:
+            continue
+        next_states = {}
+        for taken, sums in states.items():
+            power = 1
+            for m in range(count - taken + 1):
+                ways = math.comb(count - taken, m) * power
+                kept = (min(taken + m, keep) - min(taken, keep)) * value
+                target = next_states.setdefault(taken + m, {})
+                for kept_sum, sum_ways in sums.items():
+                    target[kept_sum + kept] = target.get(kept_sum + kept, 0) + sum_ways * ways
+                power *= w
+        states = next_states
+    sums = states[count]
+    minimum = min(sums)
+    return [sums.get(kept_sum, 0) for kept_sum in range(minimum, max(sums) + 1)], minimum
+
+
+@functools.lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def get_modified_distribution(count, face, modifiers=NO_MODIFIERS):
+    """
+    Return exact DiceDistribution of the sum of <count>d<face> with DiceModifiers.
+    It's computed by dynamic programming over the values of one dice,
+    not by enumeration of outcomes, and memoized per (count, face, modifiers)
+    """
+    if not modifiers:
+        return get_distribution(count, face)
+    if not count or not face:
+        return DiceDistribution((1,), minimum=0)
+    die = _modified_die(face, modifiers.reroll, modifiers.explode)
+    keep = modifiers.keep
+    if keep and keep < count:
+        ways, minimum = _keep_ways(die, count, keep, bool(modifiers.keep_highest))
+        return DiceDistribution(ways, minimum=minimum)
+    ways = [1]
+    for i in range(count):
+        ways = _convolve(ways, die)
+    return DiceDistribution(ways, minimum=count)
+
+
+def _roll_modified_sum(count, face, modifiers, rng):
+    """
+    Roll <count>d<face> with DiceModifiers once by random.Random, dices are plain ints
+    """
+    dices = rng.choices(range(1, face + 1), k=count)
+    randint = rng.randint
+    reroll = modifiers.reroll
+    if reroll > 1:
+        dices = [dice if dice >= reroll else randint(1, face) for dice in dices]
+    if modifiers.explode:
+        for i, dice in enumerate(dices):
+            explosions = 0
+            while dice == face and explosions < MAX_EXPLOSIONS:
+                dice = randint(1, face)
+                dices[i] += dice
+                explosions += 1
+    keep = modifiers.keep
+    if keep and keep < count:
+        dices.sort()
+        return sum(dices[-keep:] if modifiers.keep_highest else dices[:keep])
+    return sum(dices)
+
+
+def _roll_many_modified_numpy(count, face, modifiers, n, bonus, rng):
+    """
+    Roll <count>d<face> with DiceModifiers n times by matrices of numpy
+    """
+    integers = rng.integers if rng is not None else numpy.random.randint
+    keep = modifiers.keep if modifiers.keep and modifiers.keep < count else 0
+    results = numpy.empty(n, dtype=numpy.int64)
+    rows = max(1, _ROLL_CHUNK // count)
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        draws = integers(1, face + 1, size=(stop - start, count))
+        if modifiers.reroll > 1:
+            rerolled = draws < modifiers.reroll
+            draws[rerolled] = integers(1, face + 1, size=int(rerolled.sum()))
+        if modifiers.explode:
+            flat = draws.reshape(-1)
+            exploding = numpy.flatnonzero(flat == face)
+            for i in range(MAX_EXPLOSIONS):
+                if not len(exploding):
+                    break
+                extra = integers(1, face + 1, size=len(exploding))
+                flat[exploding] += extra
+                exploding = exploding[extra == face]
+        if keep:
+            draws.sort(axis=1)
+            draws = draws[:, -keep:] if modifiers.keep_highest else draws[:, :keep]
+        numpy.sum(draws, axis=1, out=results[start:stop])
+    results += bonus
+    return results
+
+
+def roll_modified_sum(count, face, modifiers, rng=None):
+    """
+    Roll <count>d<face> with DiceModifiers once and return the sum
+    """
+    if not modifiers:
+        return roll_sum(count, face, rng)
+    if not count or not face:
+        return 0
+    if _is_numpy_rng(rng):
+        return int(_roll_many_modified_numpy(count, face, modifiers, 1, 0, rng)[0])
+    return _roll_modified_sum(count, face, modifiers, rng or random)
+
+
+def roll_many_modified(count, face, modifiers, n, bonus=0, rng=None):
+    """
+    Roll <count>d<face>+<bonus> with DiceModifiers n times and return array of results.
+    It's vectorized by numpy like roll_many()
+    """
+    if not modifiers:
+        return roll_many(count, face, n, bonus, rng)
+    _check_roll_times(n)
+    if (rng is None or _is_numpy_rng(rng)) and _import_numpy() is not None:
+        if not count or not face:
+            return numpy.full(n, bonus, dtype=numpy.int64)
+        return _roll_many_modified_numpy(count, face, modifiers, n, bonus, rng)
+    if not count or not face:
+        return array('q', [bonus]) * n
+    rng = rng or random
+    return array('q', [_roll_modified_sum(count, face, modifiers, rng) + bonus for i in range(n)])
+
+
+# Parsing
+PARSE_CACHE_SIZE = 4096
+
+_DICE_PATTERN = re.compile(
+    r"^(?P<count>\d+)d(?P<face>\d+)(?:r(?P<reroll>\d+))?(?P<explode>!)?(?:k(?P<keep>[hl]?)(?P<keep_count>\d+))?$")
+_GURPS_DICE_PATTERN = re.compile(r"^(?P<count>\d+)d(?P<face>[6])(?P<bonus>[-+]\d+)?$")
+
+
+def _dice_str(dice_str):
+    if not isinstance(dice_str, str):
+        try:
+            dice_str = str(dice_str)
+        except TypeError:
+            raise TypeError("unsupported operand type for search_dice_in_str: '{}'".format(type(dice_str)))
+    return dice_str
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_dice(dice_str):
+    """
+    Return (count, face, DiceModifiers) from "<count>d<face>[r<reroll>][!][k[h|l]<keep>]",
+    k<keep> keeps the highest dices, "<count>d<face>" has NO_MODIFIERS
+    """
+    dice_search = _DICE_PATTERN.match(dice_str)
+    if dice_search:
+        # there are no groups of modifiers after count and face
+        if dice_search.lastindex == 2:
+            return int(dice_search.group('count')), int(dice_search.group('face')), NO_MODIFIERS
+        keep_count = int(dice_search.group('keep_count') or 0)
+        lowest = dice_search.group('keep') == 'l'
+        modifiers = DiceModifiers(explode=bool(dice_search.group('explode')),
+                                  reroll=int(dice_search.group('reroll') or 0),
+                                  keep_highest=0 if lowest else keep_count,
+                                  keep_lowest=keep_count if lowest else 0)
+        return int(dice_search.group('count')), int(dice_search.group('face')), modifiers
+    raise EmptyDiceError("there is no correct dice param in str")
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_gurps_dice(dice_str):
+    """
+    Return (count, face, bonus) from "<count>d6±<bonus>"
+    """
+    dice_search = _GURPS_DICE_PATTERN.match(dice_str)
+    if dice_search:
+        count, face, bonus = dice_search.groups()
+        return int(count), int(face), int(bonus or 0)
+    raise EmptyDiceError("there is no correct dice param in str")
+
+
+def parse_cache_info():
+    """
+    Return hits and misses statistics of dice str parsers
+    """
+    return {
+        'dice': _parse_dice.cache_info()._asdict(),
+        'gurps_dice': _parse_gurps_dice.cache_info()._asdict(),
+    }
+
+
+def clear_parse_cache():
+    """
+    Forget all parsed dice str
+    """
+    _parse_dice.cache_clear()
+    _parse_gurps_dice.cache_clear()
+
+
 class Dice(object):
     """
     It makes it possible to operate with dices with same face.
@@ -29,33 +861,60 @@ class Dice(object):
     You can stack the Dice with the same face.
     Dice("1d6") + Dice("2d6") -> Dice("3d6")
     Dice("3d6") + Dice("1d6") -> Dice("2d6")
+    Dice can have DiceModifiers: reroll below N, explode, keep highest or lowest K.
+    Dice("4d6kh3") -> Dice(4d6kh3)
+    Dice(10, 6, explode=True, reroll=2) -> Dice(10d6r2!)
     """
+    modifiers = NO_MODIFIERS
 
-    def __init__(self, count=0, face=0):
+    def __init__(self, count=0, face=0, explode=False, reroll=0, keep_highest=0, keep_lowest=0):
         if not isinstance(count, int):
-            dice_dict = self.search_dice_in_str(count)
+            count, face, modifiers = self._parse_modified_dice_str(count)
         else:
-            dice_dict = {'count': count, 'face': face}
-        if self._is_count_valid(count=dice_dict['count']):
-            self.count = dice_dict['count']
-        if self._is_face_valid(face=dice_dict['face']):
-            self.face = dice_dict['face']
+            modifiers = DiceModifiers(explode, reroll, keep_highest, keep_lowest)
+        if self._is_count_valid(count=count):
+            self.count = count
+        if self._is_face_valid(face=face):
+            self.face = face
+        if modifiers and self._is_modifiers_valid(count, face, modifiers):
+            self.modifiers = modifiers
 
     def __call__(self):
         return self.roll()
 
     def __str__(self):
-        dice_str = "{:d}d{:d}".format(self.count, self.face)
+        dice_str = "{:d}d{:d}{}".format(self.count, self.face, self.modifiers)
         return dice_str
 
     def __repr__(self):
         return "Dice({})".format(self.__str__())
 
+    def __reduce_ex__(self, protocol):
+        """
+        Pickle Dice and GurpsDice by their binary form of gurps_dice_codec,
+        dices which do not fit it are pickled by default
+        """
+        import gurps_dice_codec
+        if self.__class__ in gurps_dice_codec.KINDS:
+            try:
+                return gurps_dice_codec.decode, (gurps_dice_codec.encode(self),)
+            except gurps_dice_codec.DiceCodecError:
+                pass
+        return super(Dice, self).__reduce_ex__(protocol)
+
+    def _stack_modifiers(self, other):
+        """
+        Return the same modifiers of both Dice, kept dices can not be stacked
+        """
+        if self.modifiers != other.modifiers or self.modifiers.keep:
+            raise DiceModifierError("there are different dice modifiers or kept dices")
+        return self.modifiers._asdict()
+
     def __add__(self, other):
         if isinstance(other, self.__class__):
             if self.face != other.face:
                 raise DiceFaceError("there is different dice face")
-            dice = Dice(count=self.count + other.count, face=self.face)
+            dice = Dice(count=self.count + other.count, face=self.face, **self._stack_modifiers(other))
             return dice
         else:
             raise TypeError("unsupported operand type(s) for +: '{}' and '{}'".format(self.__class__, type(other)))
@@ -64,30 +923,47 @@ class Dice(object):
         if isinstance(other, self.__class__):
             if self.face != other.face:
                 raise DiceFaceError("there is different dice face")
-            dice = Dice(count=self.count - other.count, face=self.face)
+            dice = Dice(count=self.count - other.count, face=self.face, **self._stack_modifiers(other))
             return dice
         else:
             raise TypeError("unsupported operand type(s) for -: '{}' and '{}'".format(self.__class__, type(other)))
 
     # Setting
     @staticmethod
-    def search_dice_in_str(dice_str):
-        if not isinstance(dice_str, str):
-            try:
-                dice_str = str(dice_str)
-            except TypeError:
-                raise TypeError("unsupported operand type for search_dice_in_str: '{}'".format(type(dice_str)))
-        dice_search = re.match(r"^(?P<count>\d+)d(?P<face>\d+)$", dice_str)
-        if dice_search:
-            return {k: int(v) for k, v in dice_search.groupdict().items()}
-        else:
+    def _parse_dice_str(dice_str):
+        count, face, modifiers = _parse_dice(_dice_str(dice_str))
+        if modifiers:
             raise EmptyDiceError("there is no correct dice param in str")
+        return count, face
+
+    @staticmethod
+    def _parse_modified_dice_str(dice_str):
+        return _parse_dice(_dice_str(dice_str))
+
+    @classmethod
+    def search_dice_in_str(cls, dice_str):
+        """
+        Return dict of count, face and the modifiers which are set in dice_str.
+        Dice.search_dice_in_str("4d6kh3") -> {'count': 4, 'face': 6, 'keep_highest': 3}
+        """
+        count, face, modifiers = cls._parse_modified_dice_str(dice_str)
+        dice_params = {'count': count, 'face': face}
+        dice_params.update((name, value) for name, value in modifiers._asdict().items() if value)
+        return dice_params
 
-    def set_dice(self, count, face=0):
+    def set_dice(self, count, face=0, **modifiers):
         """
         Run init for set Dice
         """
-        self.__init__(count=count, face=face)
+        self.__init__(count=count, face=face, **modifiers)
+
+    def set_modifiers(self, explode=False, reroll=0, keep_highest=0, keep_lowest=0):
+        """
+        Set DiceModifiers for Dice
+        """
+        modifiers = DiceModifiers(explode, reroll, keep_highest, keep_lowest)
+        if self._is_modifiers_valid(self.count, self.face, modifiers):
+            self.modifiers = modifiers
 
     def set_face(self, face=0):
         """
@@ -136,41 +1012,126 @@ class Dice(object):
     def _is_self_face_valid(self):
         return self._is_face_valid(face=self.face)
 
+    @staticmethod
+    def _is_modifiers_valid(count, face, modifiers):
+        """
+        Check Dice for validity by dice modifiers.
+        Return True if it's Ok
+        Rise error's if something not Ok
+        """
+        return _check_modifiers(count, face, modifiers)
+
+    def _is_self_modifiers_valid(self):
+        return not self.modifiers or self._is_modifiers_valid(self.count, self.face, self.modifiers)
+
     def _is_dice_valid(self):
         """
         Check Dice for whole validity.
         Return True if it's Ok
         Rise error's if something not Ok
         """
-        if self._is_self_count_valid() and self._is_self_face_valid():
+        if self._is_self_count_valid() and self._is_self_face_valid() and self._is_self_modifiers_valid():
             return True
 
     # Dice roll functionality
-    def roll(self):
+    def roll(self, rng=None):
         """
-        Roll Dice and return result
+        Roll Dice and return result.
+        rng is random.Random or numpy.random.Generator to roll with
         """
         if self._is_dice_valid():
-            roll_result = 0
-            if self.face:
-                for i in range(self.count):
-                    roll_result += random.randint(1, self.face)
-            return roll_result
+            if _journal is not None:
+                return _journal(self, rng)
+            return self._roll(rng)
+
+    def _roll(self, rng):
+        """
+        Return roll result of valid Dice, it's not journaled
+        """
+        if self.modifiers:
+            return roll_modified_sum(self.count, self.face, self.modifiers, rng)
+        return roll_sum(self.count, self.face, rng)
+
+    def roll_many(self, n, rng=None):
+        """
+        Roll Dice n times and return array of results
+        """
+        if self._is_dice_valid():
+            if self.modifiers:
+                return roll_many_modified(self.count, self.face, self.modifiers, n, rng=rng)
+            return roll_many(self.count, self.face, n, rng=rng)
 
     def max(self):
         """
         Return the maximum value which can be
         """
         if self._is_dice_valid():
-            return self.face * self.count
+            face = self.face * (1 + MAX_EXPLOSIONS) if self.modifiers.explode else self.face
+            return face * min(self.modifiers.keep or self.count, self.count)
 
     def min(self):
         """
         Return the minimum value which can be
         """
         if self._is_dice_valid():
+            if self.modifiers.keep and self.face:
+                return min(self.modifiers.keep, self.count)
             return self.count if self.face else 0
 
+    def distribution(self):
+        """
+        Return exact DiceDistribution of the roll result
+        """
+        if self._is_dice_valid():
+            if self.modifiers:
+                return get_modified_distribution(self.count, self.face, self.modifiers)
+            return get_distribution(self.count, self.face)
+
+
+# GurpsDice rounding
+ROUND_CACHE_SIZE = 4096
+
+
+def _round_up(count, bonus, round_seven=True):
+    """
+    Return (count, bonus) like after GurpsDice.round_up_step() until bonus is small.
+    Every step adds one dice for 4 bonus, or for 3 bonus with round_seven
+    if bonus % 7 <= 3. So with round_seven bonus % 7 == 3 takes one step
+    to 0, and then every two steps add two dice for 7 bonus and keep bonus % 7
+    """
+    if not round_seven:
+        if bonus < 4:
+            return count, bonus
+        return count + bonus // 4, bonus % 4
+    if bonus < 3:
+        return count, bonus
+    if bonus % 7 == 3:
+        count, bonus = count + 1, bonus - 3
+    pairs = max(0, bonus // 7 - 1)
+    count, bonus = count + 2 * pairs, bonus - 7 * pairs
+    while bonus >= 3:
+        count, bonus = count + 1, bonus - (3 if bonus % 7 <= 3 else 4)
+    return count, bonus
+
+
+def _round_down(count, bonus):
+    """
+    Return (count, bonus) like after GurpsDice.round_down_step() until bonus is not less than -2.
+    Every step removes one dice for 4 bonus, but the last dice stays
+    """
+    if bonus <= -2 and count > 1:
+        steps = min(count - 1, (2 - bonus) // 4)
+        return count - steps, bonus + 4 * steps
+    return count, bonus
+
+
+@functools.lru_cache(maxsize=ROUND_CACHE_SIZE)
+def _rounded(count, bonus, round_seven=True):
+    """
+    Return (count, bonus) of rounded GurpsDice
+    """
+    return _round_down(*_round_up(count, bonus, round_seven))
+
 
 class GurpsDice(Dice):
     """
@@ -187,8 +1148,9 @@ class GurpsDice(Dice):
     """
 
     def __init__(self, count=1, bonus=0):
+        if not isinstance(count, int):
+            count, _, bonus = self._parse_dice_str(count)
         super(GurpsDice, self).__init__(count=count, face=6)
-        bonus = bonus if isinstance(count, int) else self.search_dice_in_str(count)['bonus']
         if self._is_bonus_valid(bonus=bonus):
             self.bonus = bonus
 
@@ -221,20 +1183,12 @@ class GurpsDice(Dice):
 
     # Setting
     @staticmethod
-    def search_dice_in_str(dice_str):
-        if not isinstance(dice_str, str):
-            try:
-                dice_str = str(dice_str)
-            except TypeError:
-                raise TypeError("unsupported operand type for search_dice_in_str: '{}'".format(type(dice_str)))
-        dice_search = re.match(
-            r"^(?P<count>\d+)d(?P<face>[6])(?P<bonus>[-,+]\d+)?$",
-            dice_str
-        )
-        if dice_search:
-            return {k: int(v or 0) for k, v in dice_search.groupdict().items()}
-        else:
-            raise EmptyDiceError("there is no correct dice param in str")
+    def _parse_dice_str(dice_str):
+        return _parse_gurps_dice(_dice_str(dice_str))
+
+    @classmethod
+    def search_dice_in_str(cls, dice_str):
+        return dict(zip(('count', 'face', 'bonus'), cls._parse_dice_str(dice_str)))
 
     def set_dice(self, count, bonus=0):
         """
@@ -248,6 +1202,12 @@ class GurpsDice(Dice):
         """
         raise DiceFaceError("dice face can not be changed")
 
+    def set_modifiers(self, *args, **kwargs):
+        """
+        Removed method for GurpsDice
+        """
+        raise DiceModifierError("GurpsDice can not have dice modifiers")
+
     def set_count(self, count=1):
         """
         Set count of dice for GurpsDice
@@ -300,7 +1260,7 @@ class GurpsDice(Dice):
         if face_and_count_valid and self._is_self_bonus_valid():
             return True
 
-    # GurpsDise rounding
+    # GurpsDice rounding
     def _add_gurps_dice(self, round_seven=True):
         """
         Added one dice to GurpsDice and balance it
@@ -327,7 +1287,7 @@ class GurpsDice(Dice):
         It's round up GurpsDice
         """
         if self._is_dice_valid():
-            if self.bonus >= 3 if round_seven else 4:
+            if self.bonus >= (3 if round_seven else 4):
                 self._add_gurps_dice(round_seven)
 
     def round_up_max(self, round_seven=True):
@@ -336,8 +1296,7 @@ class GurpsDice(Dice):
         It's round max up GurpsDice
         """
         if self._is_dice_valid():
-            while self.bonus >= 3 if round_seven else 4:
-                self._add_gurps_dice(round_seven)
+            self.count, self.bonus = _round_up(self.count, self.bonus, round_seven)
 
     def round_down_step(self, round_seven=True):
         """
@@ -354,24 +1313,41 @@ class GurpsDice(Dice):
         It's round max down GurpsDice
         """
         if self._is_dice_valid():
-            while self.bonus <= -2 and self.count > 1:
-                self._remove_gurps_dice(round_seven)
+            self.count, self.bonus = _round_down(self.count, self.bonus)
 
     def round(self, round_seven=True):
         """
         Make GurpsDice absolute equivalenting
         It's round max up and down GurpsDice
         """
-        self.round_up_max(round_seven)
-        self.round_down_max(round_seven)
+        if self._is_dice_valid():
+            self.count, self.bonus = _rounded(self.count, self.bonus, round_seven)
+
+    def rounded(self, round_seven=True):
+        """
+        Return new GurpsDice which is rounded like round(),
+        GurpsDice stays the same
+        """
+        if self._is_dice_valid():
+            count, bonus = _rounded(self.count, self.bonus, round_seven)
+            return GurpsDice(count=count, bonus=bonus)
 
     # GurpsDice roll functionality
-    def roll(self):
+    def roll(self, rng=None):
         """
         Roll GurpsDice and return result
         """
-        roll_result = super(GurpsDice, self).roll()
-        return roll_result + self.bonus
+        return super(GurpsDice, self).roll(rng)
+
+    def _roll(self, rng):
+        return super(GurpsDice, self)._roll(rng) + self.bonus
+
+    def roll_many(self, n, rng=None):
+        """
+        Roll GurpsDice n times and return array of results
+        """
+        if self._is_dice_valid():
+            return roll_many(self.count, self.face, n, bonus=self.bonus, rng=rng)
 
     def max(self):
         """
@@ -386,3 +1362,10 @@ class GurpsDice(Dice):
         """
         min_result = super(GurpsDice, self).min()
         return min_result + self.bonus
+
+    def distribution(self):
+        """
+        Return exact DiceDistribution of the roll result
+        """
+        dice_distribution = super(GurpsDice, self).distribution()
+        return dice_distribution.shift(self.bonus)
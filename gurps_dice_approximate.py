@@ -0,0 +1,198 @@
+"""
+Opt-in approximate rolls of big dice pools.
+enable() makes Dice, GurpsDice, HandfulDice and the rest roll pools of at least
+min_count dices by Cornish-Fisher expansion of the normal distribution
+(normal with the kurtosis correction, sums of dices have no skew),
+rounded and clamped to the true min() and max(). disable() goes back to exact rolls,
+which are the default.
+gurps_dice_approximate.enable(min_count=100)
+Dice("1000d6").roll() -> 3512
+gurps_dice_approximate.approximation_error(1000, 6) -> 3.4e-06
+gurps_dice_approximate.disable()
+"""
+import math
+import random
+import functools
+import contextlib
+from array import array
+
+import gurps_dice
+from gurps_dice import get_distribution, _import_numpy, _is_numpy_rng
+
+APPROXIMATE_MIN_COUNT = 100
+PARAMETERS_CACHE_SIZE = 256
+# Berry-Esseen constant for identically distributed summands (Shevtsova, 2011)
+BERRY_ESSEEN = 0.4748
+# Points per unit of the standard normal to search the biggest Cornish-Fisher correction
+_GRID = 1000
+
+
+def _check_min_count(min_count):
+    if not isinstance(min_count, int):
+        raise TypeError("unsupported type for min count: '{}'".format(type(min_count)))
+    if min_count < 2:
+        raise ValueError("min count of approximate rolls can not be less than 2")
+
+
+def enable(min_count=APPROXIMATE_MIN_COUNT):
+    """
+    Roll pools of at least min_count dices by approximation
+    """
+    _check_min_count(min_count)
+    gurps_dice._approximation = (min_count, roll_sum, roll_many)
+
+
+def disable():
+    """
+    Roll all pools exactly
+    """
+    gurps_dice._approximation = None
+
+
+def is_enabled():
+    return gurps_dice._approximation is not None
+
+
+def get_min_count():
+    """
+    Return min count of approximate rolls or None if they are disabled
+    """
+    return gurps_dice._approximation[0] if gurps_dice._approximation is not None else None
+
+
+@contextlib.contextmanager
+def approximated(min_count=APPROXIMATE_MIN_COUNT):
+    """
+    Enable approximate rolls inside with block
+    """
+    approximation = gurps_dice._approximation
+    enable(min_count)
+    try:
+        yield
+    finally:
+        gurps_dice._approximation = approximation
+
+
+@functools.lru_cache(maxsize=PARAMETERS_CACHE_SIZE)
+def _parameters(count, face):
+    """
+    Return (mean, standard deviation, kurtosis term, biggest |z|) of <count>d<face>.
+    z + term * (z ** 3 - 3 * z) is increasing while |z| <= biggest |z|
+    """
+    mean = count * (face + 1) / 2
+    deviation = math.sqrt(count * (face * face - 1) / 12)
+    if face < 2:
+        return mean, 0.0, 0.0, 0.0
+    # Excess kurtosis of the sum of count discrete uniform dices
+    kurtosis = -6 * (face * face + 1) / (5 * (face * face - 1) * count)
+    term = kurtosis / 24
+    return mean, deviation, term, math.sqrt(1 - 1 / (3 * term))
+
+
+def _normal_cdf(z):
+    return 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+def roll_sum(count, face, rng=None):
+    """
+    Roll <count>d<face> once by approximation and return the sum
+    """
+    mean, deviation, term, z_max = _parameters(count, face)
+    if _is_numpy_rng(rng):
+        z = float(rng.standard_normal())
+    else:
+        z = (rng or random).gauss(0.0, 1.0)
+    z = min(max(z, -z_max), z_max)
+    roll_result = math.floor(mean + deviation * (z + term * (z * z * z - 3 * z)) + 0.5)
+    return min(max(roll_result, count), count * face)
+
+
+def roll_many(count, face, n, bonus=0, rng=None):
+    """
+    Roll <count>d<face>+<bonus> n times by approximation and return array of results
+    """
+    mean, deviation, term, z_max = _parameters(count, face)
+    numpy = _import_numpy() if rng is None or _is_numpy_rng(rng) else None
+    if numpy is not None:
+        z = rng.standard_normal(n) if rng is not None else numpy.random.standard_normal(n)
+        numpy.clip(z, -z_max, z_max, out=z)
+        values = numpy.floor(mean + deviation * (z + term * (z ** 3 - 3 * z)) + 0.5)
+        results = numpy.clip(values, count, count * face).astype(numpy.int64)
+        results += bonus
+        return results
+    gauss = (rng or random).gauss
+    floor = math.floor
+    results = array('q')
+    append = results.append
+    low, high = count, count * face
+    for i in range(n):
+        z = min(max(gauss(0.0, 1.0), -z_max), z_max)
+        roll_result = floor(mean + deviation * (z + term * (z * z * z - 3 * z)) + 0.5)
+        append(min(max(roll_result, low), high) + bonus)
+    return results
+
+
+def _inverse(t, term, z_max):
+    """
+    Return z of standard normal which is transformed to t, z is in [-z_max, z_max]
+    """
+    low, high = -z_max, z_max
+    for i in range(100):
+        middle = (low + high) / 2
+        if middle + term * (middle ** 3 - 3 * middle) < t:
+            low = middle
+        else:
+            high = middle
+        if high - low < 1e-15:
+            break
+    return (low + high) / 2
+
+
+def approximate_cdf(count, face, value):
+    """
+    Return the probability that approximate roll of <count>d<face> is not more than value
+    """
+    if value < count:
+        return 0.0
+    if value >= count * face:
+        return 1.0
+    mean, deviation, term, z_max = _parameters(count, face)
+    if not deviation:
+        return 1.0
+    t = (value + 0.5 - mean) / deviation
+    if t < -z_max + term * (3 * z_max - z_max ** 3):
+        return 0.0
+    if t >= z_max + term * (z_max ** 3 - 3 * z_max):
+        return 1.0
+    return _normal_cdf(_inverse(t, term, z_max))
+
+
+def approximation_error(count, face):
+    """
+    Return the biggest difference between approximate and exact cdf of <count>d<face>
+    (Kolmogorov distance). It's exact, so it costs the exact distribution
+    """
+    distribution = get_distribution(count, face)
+    return max([abs(distribution.cdf(value) - approximate_cdf(count, face, value))
+                for value in range(distribution.minimum, distribution.maximum)] or [0.0])
+
+
+@functools.lru_cache(maxsize=PARAMETERS_CACHE_SIZE)
+def approximation_error_bound(count, face):
+    """
+    Return upper bound of approximation_error(count, face) without the exact distribution.
+    It's Berry-Esseen bound of the normal approximation
+    plus the biggest change made by the kurtosis correction, so it's far from tight
+    """
+    if face < 2:
+        return 0.0
+    mean, deviation, term, z_max = _parameters(count, face)
+    center = (face + 1) / 2
+    third_moment = sum(abs(value - center) ** 3 for value in range(1, face + 1)) / face
+    berry_esseen = BERRY_ESSEEN * third_moment / (deviation / math.sqrt(count)) ** 3 / math.sqrt(count)
+    correction = 0.0
+    steps = int(min(z_max, 40.0) * _GRID)
+    for i in range(-steps, steps + 1):
+        z = i / _GRID
+        correction = max(correction, abs(_normal_cdf(z) - _normal_cdf(z + term * (z * z * z - 3 * z))))
+    return min(1.0, berry_esseen + correction + _normal_cdf(-z_max))
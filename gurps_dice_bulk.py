@@ -0,0 +1,121 @@
+from array import array
+
+from gurps_dice import GurpsDice, EmptyDiceError, roll_many, get_distribution, _import_numpy, _is_numpy_rng
+
+
+class DiceColumns(object):
+    """
+    Parsed dice strings as struct of arrays.
+    count[i], face[i] and bonus[i] are params of row i,
+    error[i] is 1 if row i is not correct dice str, its params are 0.
+    """
+
+    def __init__(self, count=None, face=None, bonus=None, error=None):
+        self.count = count if count is not None else array('q')
+        self.face = face if face is not None else array('q')
+        self.bonus = bonus if bonus is not None else array('q')
+        self.error = error if error is not None else array('b')
+
+    def __len__(self):
+        return len(self.count)
+
+    def __repr__(self):
+        return "DiceColumns(rows={:d}, errors={:d})".format(len(self), self.error_count())
+
+    def error_count(self):
+        return sum(self.error)
+
+    def rows(self):
+        """
+        Iterate (count, face, bonus, error) by rows
+        """
+        return zip(self.count, self.face, self.bonus, self.error)
+
+
+def parse_many(dice_strs, dice_class=GurpsDice):
+    """
+    Parse iterable of dice strings by the rules of dice_class.search_dice_in_str
+    and return DiceColumns. Incorrect rows are marked in error column
+    instead of raising EmptyDiceError.
+    parse_many(["2d6+1", "1d6-1", "spear"]) -> DiceColumns(rows=3, errors=1)
+    """
+    columns = DiceColumns()
+    parse = dice_class._parse_dice_str
+    count_append, face_append = columns.count.append, columns.face.append
+    bonus_append, error_append = columns.bonus.append, columns.error.append
+    for dice_str in dice_strs:
+        try:
+            dice_params = parse(dice_str)
+        except EmptyDiceError:
+            count_append(0)
+            face_append(0)
+            bonus_append(0)
+            error_append(1)
+        else:
+            count_append(dice_params[0])
+            face_append(dice_params[1])
+            bonus_append(dice_params[2] if len(dice_params) > 2 else 0)
+            error_append(0)
+    return columns
+
+
+def parse_file(path, dice_class=GurpsDice, encoding='utf-8'):
+    """
+    Parse file with one dice str by line and return DiceColumns
+    """
+    with open(path, encoding=encoding) as dice_file:
+        return parse_many((line.rstrip('\r\n') for line in dice_file), dice_class=dice_class)
+
+
+def _groups(columns):
+    """
+    Return dict (count, face) -> list of correct rows
+    """
+    groups = {}
+    for row, (count, face, bonus, error) in enumerate(columns.rows()):
+        if not error:
+            groups.setdefault((count, face), []).append(row)
+    return groups
+
+
+def roll_columns(columns, rng=None):
+    """
+    Roll every row of DiceColumns once and return array of results,
+    incorrect rows give 0. Rows with the same dice are rolled by one batch
+    """
+    numpy = _import_numpy() if rng is None or _is_numpy_rng(rng) else None
+    if numpy is not None:
+        results = numpy.zeros(len(columns), dtype=numpy.int64)
+        bonus = numpy.asarray(columns.bonus, dtype=numpy.int64)
+        for (count, face), rows in _groups(columns).items():
+            rows = numpy.asarray(rows, dtype=numpy.intp)
+            results[rows] = roll_many(count, face, len(rows), rng=rng) + bonus[rows]
+        return results
+    results = array('q', bytes(8 * len(columns)))
+    bonus = columns.bonus
+    for (count, face), rows in _groups(columns).items():
+        for row, roll in zip(rows, roll_many(count, face, len(rows), rng=rng)):
+            results[row] = roll + bonus[row]
+    return results
+
+
+def distribution_columns(columns):
+    """
+    Return list of DiceDistribution of every row of DiceColumns,
+    incorrect rows give None
+    """
+    return [
+        None if error else get_distribution(count, face).shift(bonus)
+        for count, face, bonus, error in columns.rows()
+    ]
+
+
+def mean_columns(columns):
+    """
+    Return array of expected roll results of every row of DiceColumns,
+    incorrect rows give 0
+    """
+    return array('d', [
+        0.0 if error else (count * (face + 1) / 2 if face else 0.0) + bonus
+        for count, face, bonus, error in columns.rows()
+    ])
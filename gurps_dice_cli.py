@@ -0,0 +1,159 @@
+"""
+Command-line roller.
+Dice are read line by line from files or stdin, so memory does not grow with input,
+and results are written by chunks of lines. Empty lines and lines starting with # are skipped.
+Line is parsed as GurpsDice ("3d6+2"), Dice ("1d20") or HandfulDice ("2d6+1d8-3"),
+expression with subtracted dices like "2d6-1d8" is rolled as DiceExpression.
+python gurps_dice_cli.py roll dice.txt             -> "3d6+2<TAB>13"
+python gurps_dice_cli.py roll --times 5 --seed 1   -> "3d6+2<TAB>13 9 11 15 8"
+python gurps_dice_cli.py validate dice.txt         -> "3d6+2<TAB>OK<TAB>GurpsDice(3d6+2)"
+python gurps_dice_cli.py summarize dice.txt        -> "3d6+2<TAB>5<TAB>20<TAB>12.50<TAB>2.96"
+Wrong lines give "<line><TAB>ERR<TAB><message>" and exit status 1.
+numpy is imported only by roll with --times of at least VECTORIZED_TIMES,
+other rolls are rolled by random, so validate and summarize start without it.
+"""
+import sys
+import math
+import random
+import argparse
+
+MODES = ('roll', 'validate', 'summarize')
+# roll --times from which rolls are vectorized by numpy
+VECTORIZED_TIMES = 1000
+OUTPUT_CHUNK = 1024
+MAX_DICE = 10000
+
+
+def parse_dice(dice_str):
+    """
+    Return GurpsDice, Dice, HandfulDice or DiceExpression of dice_str
+    """
+    from gurps_dice import Dice, GurpsDice, EmptyDiceError
+    from gurps_dice_expression import compile_expression
+    for dice_class in (GurpsDice, Dice):
+        try:
+            return dice_class(dice_str)
+        except EmptyDiceError:
+            pass
+    expression = compile_expression(dice_str)
+    return expression if expression.negative else expression.to_handful()
+
+
+def _groups(dice):
+    """
+    Return ((face, count) of added dices, (face, count) of subtracted dices, bonus)
+    """
+    from gurps_dice import Dice
+    from gurps_dice_handful import HandfulDice
+    if isinstance(dice, HandfulDice):
+        return tuple(dice.faces.items()), (), dice.bonus
+    if isinstance(dice, Dice):
+        return ((dice.face, dice.count),) if dice.count and dice.face else (), (), getattr(dice, 'bonus', 0)
+    return dice.positive, dice.negative, dice.bonus
+
+
+def summary(dice):
+    """
+    Return (min, max, mean, standard deviation) of dice.
+    Dice with modifiers are summarized by their exact distribution
+    """
+    if getattr(dice, 'modifiers', None):
+        distribution = dice.distribution()
+        mean = distribution.mean()
+        variance = sum((value - mean) ** 2 * probability for value, probability in distribution)
+        return dice.min(), dice.max(), mean, math.sqrt(variance)
+    positive, negative, bonus = _groups(dice)
+    mean = bonus + sum(count * (face + 1) / 2 for face, count in positive) - sum(count * (face + 1) / 2 for face, count in negative)
+    variance = sum(count * (face * face - 1) / 12 for face, count in positive + negative)
+    return dice.min(), dice.max(), mean, math.sqrt(variance)
+
+
+def _line_results(mode, lines, times=1, rng=None, max_dice=MAX_DICE):
+    """
+    Yield (output line, True if it's error) for every dice line
+    """
+    from gurps_dice import DiceError
+    from gurps_dice_handful import HandfulDiceError
+    for line in lines:
+        dice_str = line.strip()
+        if not dice_str or dice_str.startswith('#'):
+            continue
+        try:
+            dice = parse_dice(dice_str)
+            positive, negative, bonus = _groups(dice)
+            if sum(count for face, count in positive + negative) > max_dice:
+                raise DiceError("there are more than {:d} dices".format(max_dice))
+        except (DiceError, HandfulDiceError) as error:
+            yield "{}\tERR\t{}".format(dice_str, error), True
+            continue
+        if mode == 'validate':
+            yield "{}\tOK\t{!r}".format(dice_str, dice), False
+        elif mode == 'summarize':
+            yield "{}\t{:d}\t{:d}\t{:.2f}\t{:.2f}".format(dice_str, *summary(dice)), False
+        elif times == 1:
+            yield "{}\t{:d}".format(dice_str, dice.roll(rng)), False
+        else:
+            yield "{}\t{}".format(dice_str, ' '.join(map(str, dice.roll_many(times, rng=rng)))), False
+
+
+def run(mode, lines, output, times=1, rng=None, max_dice=MAX_DICE):
+    """
+    Write results of mode for dice lines to output by chunks of OUTPUT_CHUNK lines.
+    Return number of wrong lines
+    """
+    if mode not in MODES:
+        raise ValueError("mode should be one of {}".format(MODES))
+    if rng is None and not (mode == 'roll' and times >= VECTORIZED_TIMES):
+        rng = random
+    errors = 0
+    chunk = []
+    for result, error in _line_results(mode, lines, times=times, rng=rng, max_dice=max_dice):
+        errors += error
+        chunk.append(result)
+        if len(chunk) >= OUTPUT_CHUNK:
+            output.write('\n'.join(chunk) + '\n')
+            chunk.clear()
+    if chunk:
+        output.write('\n'.join(chunk) + '\n')
+    output.flush()
+    return errors
+
+
+def _rng(seed, vectorized):
+    if seed is None:
+        return None
+    from gurps_dice import _import_numpy
+    from gurps_dice_random import RandomStream
+    stream = RandomStream(seed)
+    return stream.numpy_generator() if vectorized and _import_numpy() is not None else stream
+
+
+def _positive(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not positive number".format(value))
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roll, validate or summarize dice line by line")
+    parser.add_argument('mode', choices=MODES)
+    parser.add_argument('files', nargs='*', default=['-'], help="files with dice by line, - is stdin")
+    parser.add_argument('--times', type=_positive, default=1, help="rolls of every dice")
+    parser.add_argument('--seed', type=int, help="seed of reproducible rolls")
+    parser.add_argument('--max-dice', type=_positive, default=MAX_DICE, help="dices in one line")
+    args = parser.parse_args(argv)
+
+    rng = _rng(args.seed, args.mode == 'roll' and args.times >= VECTORIZED_TIMES)
+    errors = 0
+    for path in args.files:
+        if path == '-':
+            errors += run(args.mode, sys.stdin, sys.stdout, times=args.times, rng=rng, max_dice=args.max_dice)
+            continue
+        with open(path) as lines:
+            errors += run(args.mode, lines, sys.stdout, times=args.times, rng=rng, max_dice=args.max_dice)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
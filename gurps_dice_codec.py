@@ -0,0 +1,235 @@
+"""
+Compact binary form of dices and roll results.
+Dice, GurpsDice, FrozenDice and FrozenGurpsDice are records of RECORD_SIZE bytes,
+Dice with modifiers are longer records of the kind MODIFIED_DICE,
+HandfulDice is a header with the number of faces followed by (face, count) entries,
+roll results are the number of results followed by int64 values.
+encode(GurpsDice("3d6+2")) -> 8 bytes
+decode(encode(GurpsDice("3d6+2"))) -> GurpsDice(3d6+2)
+decode_many(encode_many(dices)) -> list of dices
+Buffers are read by struct.unpack_from at offsets, so bytes, bytearray, mmap
+and memoryview buffers are decoded without copies of records.
+
+All ints are little-endian:
+dice      B kind, x, H face, H count, h bonus
+modified  B kind, B flags (1 explode, 2 keep lowest), H face, H count, H reroll, H keep
+handful   B kind, x, H number of faces, i bonus, then by face: H face, I count
+results   Q number of results, then q by result
+"""
+import sys
+import struct
+from array import array
+
+from gurps_dice import Dice, GurpsDice, DiceError
+from gurps_dice_frozen import FrozenDice, FrozenGurpsDice
+from gurps_dice_handful import HandfulDice
+
+DICE, GURPS_DICE, FROZEN_DICE, FROZEN_GURPS_DICE, HANDFUL_DICE, MODIFIED_DICE = range(6)
+KINDS = {Dice: DICE, GurpsDice: GURPS_DICE, FrozenDice: FROZEN_DICE,
+         FrozenGurpsDice: FROZEN_GURPS_DICE, HandfulDice: HANDFUL_DICE}
+
+_EXPLODE = 1
+_KEEP_LOWEST = 2
+
+_RECORD = struct.Struct('<BxHHh')
+_MODIFIED = struct.Struct('<BBHHHH')
+_HANDFUL = struct.Struct('<BxHi')
+_FACE = struct.Struct('<HI')
+_RESULTS = struct.Struct('<Q')
+RECORD_SIZE = _RECORD.size
+# Results are decoded by memoryview of native long long
+_NATIVE = sys.byteorder == 'little'
+
+
+class DiceCodecError(DiceError):
+    pass
+
+
+def _size(dice):
+    if dice.__class__ is HandfulDice:
+        return _HANDFUL.size + _FACE.size * len(dice.faces)
+    if getattr(dice, 'modifiers', None):
+        return _MODIFIED.size
+    return RECORD_SIZE
+
+
+def encode_into(buffer, offset, dice):
+    """
+    Write binary form of dice to writable buffer at offset and return offset after it
+    """
+    kind = KINDS.get(dice.__class__)
+    if kind is None:
+        raise TypeError("unsupported type for encode: '{}'".format(type(dice)))
+    try:
+        if kind == HANDFUL_DICE:
+            _HANDFUL.pack_into(buffer, offset, kind, len(dice.faces), dice.bonus)
+            offset += _HANDFUL.size
+            for face, count in sorted(dice.faces.items()):
+                _FACE.pack_into(buffer, offset, face, count)
+                offset += _FACE.size
+            return offset
+        modifiers = getattr(dice, 'modifiers', None)
+        if modifiers:
+            flags = (_EXPLODE if modifiers.explode else 0) | (_KEEP_LOWEST if modifiers.keep_lowest else 0)
+            _MODIFIED.pack_into(buffer, offset, MODIFIED_DICE, flags, dice.face, dice.count,
+                                modifiers.reroll, modifiers.keep)
+            return offset + _MODIFIED.size
+        _RECORD.pack_into(buffer, offset, kind, dice.face, dice.count, getattr(dice, 'bonus', 0))
+    except struct.error as error:
+        raise DiceCodecError("{!r} can not be encoded: {}".format(dice, error))
+    return offset + RECORD_SIZE
+
+
+def encode(dice):
+    """
+    Return bytes of binary form of dice
+    """
+    buffer = bytearray(_size(dice))
+    encode_into(buffer, 0, dice)
+    return bytes(buffer)
+
+
+def encode_many(dices):
+    """
+    Return bytearray of binary forms of all dices one after another.
+    It's packed into one buffer, there are no bytes by dice
+    """
+    dices = list(dices)
+    buffer = bytearray(sum(map(_size, dices)))
+    offset = 0
+    for dice in dices:
+        offset = encode_into(buffer, offset, dice)
+    return buffer
+
+
+def _plain_dice(kind, face, count, bonus):
+    """
+    Return Dice or GurpsDice of record, unsigned count and face are valid,
+    so the dice is made without validation
+    """
+    if kind == DICE:
+        dice = Dice.__new__(Dice)
+        dice.__dict__.update(count=count, face=face)
+        return dice
+    if face != 6:
+        raise DiceCodecError("GurpsDice record has face {:d}".format(face))
+    dice = GurpsDice.__new__(GurpsDice)
+    dice.__dict__.update(count=count, face=face, bonus=bonus)
+    return dice
+
+
+def decode_from(buffer, offset=0):
+    """
+    Return (dice, offset after it) of binary form in buffer at offset
+    """
+    try:
+        kind = buffer[offset]
+        if kind == HANDFUL_DICE:
+            kind, length, bonus = _HANDFUL.unpack_from(buffer, offset)
+            offset += _HANDFUL.size
+            faces = {}
+            for i in range(length):
+                face, count = _FACE.unpack_from(buffer, offset)
+                faces[face] = count
+                offset += _FACE.size
+            return HandfulDice.from_counts(faces, bonus=bonus), offset
+        if kind == MODIFIED_DICE:
+            kind, flags, face, count, reroll, keep = _MODIFIED.unpack_from(buffer, offset)
+            keep_lowest = keep if flags & _KEEP_LOWEST else 0
+            return Dice(count, face, explode=bool(flags & _EXPLODE), reroll=reroll,
+                        keep_highest=keep - keep_lowest, keep_lowest=keep_lowest), offset + _MODIFIED.size
+        kind, face, count, bonus = _RECORD.unpack_from(buffer, offset)
+    except (struct.error, IndexError):
+        raise DiceCodecError("binary dice at offset {:d} is truncated".format(offset))
+    offset += RECORD_SIZE
+    if kind <= GURPS_DICE:
+        return _plain_dice(kind, face, count, bonus), offset
+    if kind == FROZEN_DICE:
+        return FrozenDice(count, face), offset
+    if kind == FROZEN_GURPS_DICE:
+        return FrozenGurpsDice(count, bonus), offset
+    raise DiceCodecError("unknown kind {:d} of binary dice at offset {:d}".format(kind, offset - RECORD_SIZE))
+
+
+def decode(buffer):
+    """
+    Return dice of binary form in buffer
+    """
+    dice, offset = decode_from(buffer)
+    if offset != len(buffer):
+        raise DiceCodecError("there are {:d} bytes after binary dice".format(len(buffer) - offset))
+    return dice
+
+
+def iter_decode(buffer):
+    """
+    Iterate dices of binary forms one after another in buffer
+    """
+    offset = 0
+    end = len(buffer)
+    while offset < end:
+        dice, offset = decode_from(buffer, offset)
+        yield dice
+
+
+def decode_many(buffer):
+    """
+    Return list of dices of binary forms one after another in buffer
+    """
+    return list(iter_decode(buffer))
+
+
+def decode_columns(buffer):
+    """
+    Return DiceColumns of buffer of plain dice records, without handfuls and modifiers.
+    Records are unpacked in place, no dices are made
+    """
+    from gurps_dice_bulk import DiceColumns
+    if len(buffer) % RECORD_SIZE:
+        raise DiceCodecError("binary dices are not records of {:d} bytes".format(RECORD_SIZE))
+    columns = DiceColumns()
+    count_append, face_append = columns.count.append, columns.face.append
+    bonus_append = columns.bonus.append
+    for kind, face, count, bonus in _RECORD.iter_unpack(buffer):
+        if kind > FROZEN_GURPS_DICE:
+            raise DiceCodecError("record {:d} is not plain dice".format(len(columns.count)))
+        count_append(count)
+        face_append(face)
+        bonus_append(bonus)
+    columns.error = array('b', bytes(len(columns.count)))
+    return columns
+
+
+def encode_results(results):
+    """
+    Return bytes of roll results: their number and int64 values
+    """
+    # numpy array of results means numpy is imported already
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(results, numpy.ndarray):
+        return _RESULTS.pack(len(results)) + results.astype('<i8', copy=False).tobytes()
+    values = array('q', results)
+    if not _NATIVE:
+        values.byteswap()
+    return _RESULTS.pack(len(values)) + values.tobytes()
+
+
+def decode_results(buffer, offset=0):
+    """
+    Return (roll results, offset after them) of buffer at offset.
+    Results are memoryview of int64 on the buffer, they are not copied
+    """
+    try:
+        length, = _RESULTS.unpack_from(buffer, offset)
+    except struct.error:
+        raise DiceCodecError("binary results at offset {:d} are truncated".format(offset))
+    start = offset + _RESULTS.size
+    stop = start + 8 * length
+    if stop > len(buffer):
+        raise DiceCodecError("binary results at offset {:d} are truncated".format(offset))
+    values = memoryview(buffer).cast('B')[start:stop]
+    if _NATIVE:
+        return values.cast('q'), stop
+    results = array('q', values.tobytes())
+    results.byteswap()
+    return results, stop
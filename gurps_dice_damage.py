@@ -0,0 +1,131 @@
+import functools
+import threading
+
+from gurps_dice import GurpsDice, DiceError
+from gurps_dice_frozen import FrozenGurpsDice
+
+THRUST = 'thr'
+SWING = 'sw'
+DAMAGE_CACHE_SIZE = 4096
+# ST up to which the table is built at first use, bigger ST are computed and cached
+TABLE_ST = 100
+
+# ST -> ((count, bonus) of thrust, (count, bonus) of swing) of GURPS 4e basic damage table,
+# ST between rows uses the lower row, above the last row both get +1d for every 10 ST
+_DAMAGE_ROWS = (
+    (1, ((1, -6), (1, -5))), (3, ((1, -5), (1, -4))), (5, ((1, -4), (1, -3))),
+    (7, ((1, -3), (1, -2))), (9, ((1, -2), (1, -1))), (10, ((1, -2), (1, 0))),
+    (11, ((1, -1), (1, 1))), (12, ((1, -1), (1, 2))), (13, ((1, 0), (2, -1))),
+    (14, ((1, 0), (2, 0))), (15, ((1, 1), (2, 1))), (16, ((1, 1), (2, 2))),
+    (17, ((1, 2), (3, -1))), (18, ((1, 2), (3, 0))), (19, ((2, -1), (3, 1))),
+    (20, ((2, -1), (3, 2))), (21, ((2, 0), (4, -1))), (22, ((2, 0), (4, 0))),
+    (23, ((2, 1), (4, 1))), (24, ((2, 1), (4, 2))), (25, ((2, 2), (5, -1))),
+    (26, ((2, 2), (5, 0))), (27, ((3, -1), (5, 1))), (29, ((3, 0), (5, 2))),
+    (31, ((3, 1), (6, -1))), (33, ((3, 2), (6, 0))), (35, ((4, -1), (6, 1))),
+    (37, ((4, 0), (6, 2))), (39, ((4, 1), (7, -1))), (45, ((5, 0), (7, 1))),
+    (50, ((5, 2), (8, -1))), (55, ((6, 0), (8, 1))), (60, ((7, -1), (9, 0))),
+    (65, ((7, 1), (9, 2))), (70, ((8, 0), (10, 0))), (75, ((8, 2), (10, 2))),
+    (80, ((9, 0), (11, 0))), (85, ((9, 2), (11, 2))), (90, ((10, 0), (12, 0))),
+    (95, ((10, 2), (12, 2))), (100, ((11, 0), (13, 0))),
+)
+
+# Index is ST, index 0 is not used, tables are built once by _build_tables()
+_thrust_table = ()
+_swing_table = ()
+_tables_lock = threading.Lock()
+
+
+class DamageTableError(DiceError):
+    pass
+
+
+def _row(st):
+    """
+    Return ((count, bonus) of thrust, (count, bonus) of swing) for ST
+    """
+    last_st, (thrust_row, swing_row) = _DAMAGE_ROWS[-1]
+    if st >= last_st:
+        extra = (st - last_st) // 10
+        return (thrust_row[0] + extra, thrust_row[1]), (swing_row[0] + extra, swing_row[1])
+    for row_st, rows in reversed(_DAMAGE_ROWS):
+        if row_st <= st:
+            return rows
+
+
+def _build_tables():
+    """
+    Build table rows up to TABLE_ST once
+    """
+    global _thrust_table, _swing_table
+    with _tables_lock:
+        if not _thrust_table:
+            rows = [_row(st) for st in range(1, TABLE_ST + 1)]
+            _swing_table = (None,) + tuple(FrozenGurpsDice._make(*swing_row) for thrust_row, swing_row in rows)
+            _thrust_table = (None,) + tuple(FrozenGurpsDice._make(*thrust_row) for thrust_row, swing_row in rows)
+
+
+@functools.lru_cache(maxsize=DAMAGE_CACHE_SIZE)
+def _large_row(st):
+    """
+    Return (thrust, swing) of ST above TABLE_ST
+    """
+    thrust_row, swing_row = _row(st)
+    return FrozenGurpsDice._make(*thrust_row), FrozenGurpsDice._make(*swing_row)
+
+
+def _lookup(st):
+    """
+    Return (thrust, swing) of ST which is not in built table
+    """
+    if not isinstance(st, int):
+        raise TypeError("unsupported type for ST: '{}'".format(type(st)))
+    if st < 1:
+        raise DamageTableError("ST can not be less than 1")
+    if st > TABLE_ST:
+        return _large_row(st)
+    _build_tables()
+    return _thrust_table[st], _swing_table[st]
+
+
+def thrust(st):
+    """
+    Return basic thrust damage of ST as shared FrozenGurpsDice
+    thrust(12) -> FrozenGurpsDice("1d6-1")
+    """
+    if 0 < st < len(_thrust_table):
+        return _thrust_table[st]
+    return _lookup(st)[0]
+
+
+def swing(st):
+    """
+    Return basic swing damage of ST as shared FrozenGurpsDice
+    swing(12) -> FrozenGurpsDice("1d6+2")
+    """
+    if 0 < st < len(_swing_table):
+        return _swing_table[st]
+    return _lookup(st)[1]
+
+
+_ATTACKS = {THRUST: thrust, SWING: swing}
+
+
+def damage(st, attack=SWING, modifier=0, round_seven=True):
+    """
+    Return damage of weapon like "sw+2" or "thr+1d-1" for ST.
+    Weapon modifier is int, GurpsDice or FrozenGurpsDice,
+    it's added to basic damage and the sum is rounded like GurpsDice.round()
+    damage(12, THRUST, 1) -> FrozenGurpsDice("1d6")
+    damage(12, SWING, 1) -> FrozenGurpsDice("2d6")
+    """
+    base = _ATTACKS.get(attack)
+    if base is None:
+        raise DamageTableError("attack should be '{}' or '{}'".format(THRUST, SWING))
+    if isinstance(modifier, GurpsDice):
+        modifier = FrozenGurpsDice.from_dice(modifier)
+    return _damage(base, st, modifier, round_seven)
+
+
+@functools.lru_cache(maxsize=DAMAGE_CACHE_SIZE)
+def _damage(base, st, modifier, round_seven):
+    return (base(st) + modifier).rounded(round_seven)
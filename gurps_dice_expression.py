@@ -0,0 +1,160 @@
+import re
+import functools
+from array import array
+
+from gurps_dice import (
+    Dice, DiceError, DiceDistribution,
+    get_distribution, roll_sum, roll_many, add_rolls,
+)
+from gurps_dice_handful import HandfulDice
+
+EXPRESSION_CACHE_SIZE = 1024
+
+_TERM_PATTERN = re.compile(r"\s*(?P<sign>[-+])?\s*(?:(?P<dice>\d+d\d+)|(?P<number>\d+))\s*")
+
+
+class DiceExpressionError(DiceError):
+    pass
+
+
+def _convolve(ways1, ways2):
+    result = [0] * (len(ways1) + len(ways2) - 1)
+    for i, w1 in enumerate(ways1):
+        if w1:
+            for j, w2 in enumerate(ways2):
+                result[i + j] += w1 * w2
+    return result
+
+
+class DiceExpression(object):
+    """
+    Compiled sum and difference of dice terms and numbers.
+    Dices with the same face and sign are grouped, numbers are folded to bonus.
+    compile_expression("2d6 + 1d8 - 3 + 1d6") -> DiceExpression(3d6+1d8-3)
+    compile_expression("2d6-1d6") -> DiceExpression(2d6-1d6)
+    """
+
+    def __init__(self, positive=(), negative=(), bonus=0):
+        self.positive = tuple(sorted(positive))
+        self.negative = tuple(sorted(negative))
+        self.bonus = bonus
+        self._distribution = None
+
+    def __call__(self, rng=None):
+        return self.roll(rng)
+
+    def __str__(self):
+        terms = ["{:d}d{:d}".format(count, face) for face, count in self.positive]
+        expression_str = '+'.join(terms)
+        for face, count in self.negative:
+            expression_str += "-{:d}d{:d}".format(count, face)
+        if self.bonus or not expression_str:
+            expression_str += "{:+d}".format(self.bonus) if expression_str else "{:d}".format(self.bonus)
+        return expression_str
+
+    def __repr__(self):
+        return "DiceExpression({})".format(self.__str__())
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (self.positive, self.negative, self.bonus) == (other.positive, other.negative, other.bonus)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.positive, self.negative, self.bonus))
+
+    def to_handful(self):
+        """
+        Return HandfulDice of expression without subtracted dices
+        """
+        if self.negative:
+            raise DiceExpressionError("subtracted dices can not be in HandfulDice")
+        return HandfulDice.from_counts(dict(self.positive), bonus=self.bonus)
+
+    # Expression roll functionality
+    def roll(self, rng=None):
+        """
+        Roll expression and return result
+        """
+        roll_result = self.bonus
+        for face, count in self.positive:
+            roll_result += roll_sum(count, face, rng)
+        for face, count in self.negative:
+            roll_result -= roll_sum(count, face, rng)
+        return roll_result
+
+    def roll_many(self, n, rng=None):
+        """
+        Roll expression n times and return array of results
+        """
+        results = roll_many(0, 0, n, bonus=self.bonus, rng=rng)
+        for face, count in self.positive:
+            results = add_rolls(results, roll_many(count, face, n, rng=rng))
+        for face, count in self.negative:
+            rolls = roll_many(count, face, n, rng=rng)
+            results = add_rolls(results, array('q', [-roll for roll in rolls]) if isinstance(rolls, array) else -rolls)
+        return results
+
+    def max(self):
+        """
+        Return the maximum value which can be
+        """
+        return (sum(face * count for face, count in self.positive)
+                - sum(count for face, count in self.negative) + self.bonus)
+
+    def min(self):
+        """
+        Return the minimum value which can be
+        """
+        return (sum(count for face, count in self.positive)
+                - sum(face * count for face, count in self.negative) + self.bonus)
+
+    def distribution(self):
+        """
+        Return exact DiceDistribution of the roll result
+        """
+        if self._distribution is None:
+            self._distribution = self._convolve_distribution()
+        return self._distribution
+
+    def _convolve_distribution(self):
+        ways, minimum = (1,), self.bonus
+        for face, count in self.positive:
+            distribution = get_distribution(count, face)
+            ways, minimum = _convolve(ways, distribution.ways), minimum + distribution.minimum
+        for face, count in self.negative:
+            distribution = get_distribution(count, face)
+            ways, minimum = _convolve(ways, distribution.ways[::-1]), minimum - distribution.maximum
+        return DiceDistribution(ways, minimum=minimum)
+
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expression_str):
+    """
+    Parse expression like "2d6+1d8-3" once and return cached DiceExpression
+    """
+    if not isinstance(expression_str, str):
+        raise TypeError("unsupported type for dice expression: '{}'".format(type(expression_str)))
+    groups = ({}, {})
+    bonus = 0
+    position = 0
+    while position < len(expression_str) or not position:
+        term = _TERM_PATTERN.match(expression_str, position)
+        if not term or (position and not term.group('sign')):
+            raise DiceExpressionError("there is no correct dice expression in str: '{}'".format(expression_str))
+        negative = term.group('sign') == '-'
+        if term.group('dice'):
+            count, face = Dice._parse_dice_str(term.group('dice'))
+            if count and face:
+                groups[negative][face] = groups[negative].get(face, 0) + count
+        else:
+            bonus += -int(term.group('number')) if negative else int(term.group('number'))
+        position = term.end()
+    return DiceExpression(groups[0].items(), groups[1].items(), bonus)
+
+
+def roll_expression(expression_str, rng=None):
+    """
+    Roll expression like "2d6+1d8-3" and return result
+    """
+    return compile_expression(expression_str).roll(rng)
@@ -0,0 +1,314 @@
+from gurps_dice import (
+    Dice, GurpsDice, DiceCountError, DiceFaceError, DiceModifierError,
+    get_distribution, roll_sum, roll_many, _rounded,
+)
+
+INTERN_LIMIT = 1 << 16
+
+
+class FrozenDice(object):
+    """
+    Immutable and hashable version of Dice.
+    It's validated once at construction and interned,
+    so equal dices are the same object and can be used as dict keys.
+    At most INTERN_LIMIT dices are kept by each class, the rest are
+    still equal by value, but not the same object.
+    FrozenDice("1d6") is FrozenDice(1, 6) -> True
+    FrozenDice("1d6") + FrozenDice("2d6") -> FrozenDice("3d6")
+    FrozenDice("3d6").with_count(1) -> FrozenDice("1d6")
+    """
+    __slots__ = ('count', 'face')
+
+    _interned = {}
+
+    def __new__(cls, count=0, face=0):
+        if not isinstance(count, int):
+            count, face = Dice._parse_dice_str(count)
+        Dice._is_count_valid(count=count)
+        Dice._is_face_valid(face=face)
+        return cls._make(count, face)
+
+    @classmethod
+    def _make(cls, count, face):
+        """
+        Return interned dice without validation
+        """
+        key = (count, face)
+        dice = cls._interned.get(key)
+        if dice is None:
+            dice = object.__new__(cls)
+            object.__setattr__(dice, 'count', count)
+            object.__setattr__(dice, 'face', face)
+            if len(cls._interned) < INTERN_LIMIT:
+                cls._interned[key] = dice
+        return dice
+
+    @classmethod
+    def from_dice(cls, dice):
+        """
+        Return FrozenDice equal to Dice, Dice with modifiers can not be frozen
+        """
+        if getattr(dice, 'modifiers', None):
+            raise DiceModifierError("Dice with modifiers can not be frozen: '{}'".format(dice))
+        return cls(dice.count, dice.face)
+
+    def thaw(self):
+        """
+        Return mutable Dice equal to FrozenDice
+        """
+        return Dice(self.count, self.face)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'{}' object is immutable".format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("'{}' object is immutable".format(self.__class__.__name__))
+
+    def __reduce__(self):
+        return self.__class__, (self.count, self.face)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if other.__class__ is self.__class__:
+            return self.count == other.count and self.face == other.face
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self.__class__, self.count, self.face))
+
+    def __call__(self):
+        return self.roll()
+
+    def __str__(self):
+        return "{:d}d{:d}".format(self.count, self.face)
+
+    def __repr__(self):
+        return "FrozenDice({})".format(self.__str__())
+
+    def __add__(self, other):
+        if isinstance(other, self.__class__):
+            if self.face != other.face:
+                raise DiceFaceError("there is different dice face")
+            return self._make(self.count + other.count, self.face)
+        else:
+            raise TypeError("unsupported operand type(s) for +: '{}' and '{}'".format(self.__class__, type(other)))
+
+    def __sub__(self, other):
+        if isinstance(other, self.__class__):
+            if self.face != other.face:
+                raise DiceFaceError("there is different dice face")
+            if other.count > self.count:
+                raise DiceCountError("dice count can not be less than zero")
+            return self._make(self.count - other.count, self.face)
+        else:
+            raise TypeError("unsupported operand type(s) for -: '{}' and '{}'".format(self.__class__, type(other)))
+
+    # Setting
+    def with_dice(self, count, face=0):
+        """
+        Return new FrozenDice like FrozenDice(count, face)
+        """
+        return self.__class__(count, face)
+
+    def with_face(self, face=0):
+        """
+        Return new FrozenDice with changed face
+        """
+        Dice._is_face_valid(face=face)
+        return self._make(self.count, face)
+
+    def with_count(self, count=0):
+        """
+        Return new FrozenDice with changed count of dice
+        """
+        Dice._is_count_valid(count=count)
+        return self._make(count, self.face)
+
+    # Dice roll functionality
+    def roll(self, rng=None):
+        """
+        Roll FrozenDice and return result
+        """
+        return roll_sum(self.count, self.face, rng)
+
+    def roll_many(self, n, rng=None):
+        """
+        Roll FrozenDice n times and return array of results
+        """
+        return roll_many(self.count, self.face, n, rng=rng)
+
+    def max(self):
+        """
+        Return the maximum value which can be
+        """
+        return self.face * self.count
+
+    def min(self):
+        """
+        Return the minimum value which can be
+        """
+        return self.count if self.face else 0
+
+    def distribution(self):
+        """
+        Return exact DiceDistribution of the roll result
+        """
+        return get_distribution(self.count, self.face)
+
+
+class FrozenGurpsDice(FrozenDice):
+    """
+    Immutable and hashable version of GurpsDice.
+    FrozenGurpsDice("1d6+1") + 1 -> FrozenGurpsDice("1d6+2")
+    FrozenGurpsDice("1d6-1") + FrozenGurpsDice("2d6+3") -> FrozenGurpsDice("3d6+2")
+    FrozenGurpsDice("1d6+1").with_bonus(3) -> FrozenGurpsDice("1d6+3")
+    """
+    __slots__ = ('bonus',)
+
+    _interned = {}
+
+    def __new__(cls, count=1, bonus=0):
+        if not isinstance(count, int):
+            count, _, bonus = GurpsDice._parse_dice_str(count)
+        GurpsDice._is_count_valid(count=count)
+        GurpsDice._is_bonus_valid(bonus=bonus)
+        return cls._make(count, bonus)
+
+    @classmethod
+    def _make(cls, count, bonus):
+        """
+        Return interned dice without validation
+        """
+        key = (count, bonus)
+        dice = cls._interned.get(key)
+        if dice is None:
+            dice = object.__new__(cls)
+            object.__setattr__(dice, 'count', count)
+            object.__setattr__(dice, 'face', 6)
+            object.__setattr__(dice, 'bonus', bonus)
+            if len(cls._interned) < INTERN_LIMIT:
+                cls._interned[key] = dice
+        return dice
+
+    @classmethod
+    def from_dice(cls, dice):
+        """
+        Return FrozenGurpsDice equal to GurpsDice
+        """
+        return cls(dice.count, dice.bonus)
+
+    def thaw(self):
+        """
+        Return mutable GurpsDice equal to FrozenGurpsDice
+        """
+        return GurpsDice(self.count, self.bonus)
+
+    def __reduce__(self):
+        return self.__class__, (self.count, self.bonus)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if other.__class__ is self.__class__:
+            return self.count == other.count and self.bonus == other.bonus
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.__class__, self.count, self.bonus))
+
+    def __str__(self):
+        dice_str = super(FrozenGurpsDice, self).__str__()
+        if self.bonus:
+            dice_str += "{:+d}".format(self.bonus)
+        return dice_str
+
+    def __repr__(self):
+        return "FrozenGurpsDice({})".format(self.__str__())
+
+    def __add__(self, other):
+        if isinstance(other, self.__class__):
+            return self._make(self.count + other.count, self.bonus + other.bonus)
+        elif isinstance(other, int):
+            return self._make(self.count, self.bonus + other)
+        else:
+            raise TypeError("unsupported operand type(s) for +: '{}' and '{}'".format(self.__class__, type(other)))
+
+    def __sub__(self, other):
+        if isinstance(other, self.__class__):
+            if other.count > self.count:
+                raise DiceCountError("dice count can not be less than zero")
+            return self._make(self.count - other.count, self.bonus - other.bonus)
+        elif isinstance(other, int):
+            return self._make(self.count, self.bonus - other)
+        else:
+            raise TypeError("unsupported operand type(s) for -: '{}' and '{}'".format(self.__class__, type(other)))
+
+    # Setting
+    def with_dice(self, count, bonus=0):
+        """
+        Return new FrozenGurpsDice like FrozenGurpsDice(count, bonus)
+        """
+        return self.__class__(count, bonus)
+
+    def with_face(self, *args, **kwargs):
+        """
+        Removed method for FrozenGurpsDice
+        """
+        raise DiceFaceError("dice face can not be changed")
+
+    def with_count(self, count=1):
+        """
+        Return new FrozenGurpsDice with changed count of dice
+        """
+        GurpsDice._is_count_valid(count=count)
+        return self._make(count, self.bonus)
+
+    def with_bonus(self, bonus):
+        """
+        Return new FrozenGurpsDice with changed bonus
+        """
+        GurpsDice._is_bonus_valid(bonus=bonus)
+        return self._make(self.count, bonus)
+
+    # GurpsDice rounding
+    def rounded(self, round_seven=True):
+        """
+        Return new FrozenGurpsDice which is rounded like GurpsDice.round()
+        """
+        return self._make(*_rounded(self.count, self.bonus, round_seven))
+
+    # GurpsDice roll functionality
+    def roll(self, rng=None):
+        """
+        Roll FrozenGurpsDice and return result
+        """
+        return roll_sum(self.count, 6, rng) + self.bonus
+
+    def roll_many(self, n, rng=None):
+        """
+        Roll FrozenGurpsDice n times and return array of results
+        """
+        return roll_many(self.count, 6, n, bonus=self.bonus, rng=rng)
+
+    def max(self):
+        """
+        Return the maximum value which can be
+        """
+        return 6 * self.count + self.bonus
+
+    def min(self):
+        """
+        Return the minimum value which can be
+        """
+        return self.count + self.bonus
+
+    def distribution(self):
+        """
+        Return exact DiceDistribution of the roll result
+        """
+        return get_distribution(self.count, 6).shift(self.bonus)
@@ -1,4 +1,7 @@
-from gurps_dice import Dice
+from gurps_dice import Dice, add_rolls, roll_sum, roll_many
+from gurps_dice_frozen import FrozenDice
+
+DICE_TYPES = (Dice, FrozenDice)
 
 
 class HandfulDiceError(Exception):
@@ -6,17 +9,47 @@ class HandfulDiceError(Exception):
 
 
 class HandfulDice(object):
+    """
+    It makes it possible to operate with dices with different faces.
+    Handful is kept in canonical form: count of dices by face and the bonus,
+    bonuses of GurpsDice are added to the bonus.
+    HandfulDice(Dice("1d6"), Dice("1d8"), GurpsDice("1d6+1")) -> HandfulDice(2d6+1d8+1)
+    HandfulDice(Dice("1d6")) + Dice("1d8") + 2 -> HandfulDice(1d6+1d8+2)
+    Use add_dice() or extend() to accumulate dices in place,
+    + and += return new HandfulDice. It's mutable, so it's not hashable.
+    """
+
     def __init__(self, *args, bonus=0):
-        for dice in args:
-            if not isinstance(dice, Dice):
-                raise TypeError("unsupported type for dice: '{}'".format(type(dice)))
-        self.handful = args
         if not isinstance(bonus, int):
             raise TypeError("unsupported type for bonus: '{}'".format(type(bonus)))
+        self.faces = {}
         self.bonus = bonus
+        for dice in args:
+            if not isinstance(dice, DICE_TYPES):
+                raise TypeError("unsupported type for dice: '{}'".format(type(dice)))
+            self._add(dice)
+
+    @classmethod
+    def from_counts(cls, faces, bonus=0):
+        """
+        Return HandfulDice from mapping face -> count of dices
+        """
+        handful = cls(bonus=bonus)
+        for face, count in faces.items():
+            if Dice._is_face_valid(face=face) and Dice._is_count_valid(count=count):
+                handful._add_face(face, count)
+        return handful
+
+    def copy(self):
+        handful = self.__class__(bonus=self.bonus)
+        handful.faces = dict(self.faces)
+        return handful
+
+    def __call__(self):
+        return self.roll()
 
     def __str__(self):
-        handful_dice_str = '+'.join(self.handful)
+        handful_dice_str = '+'.join("{:d}d{:d}".format(count, face) for face, count in sorted(self.faces.items()))
         if self.bonus:
             handful_dice_str += "{:+d}".format(self.bonus)
         return handful_dice_str
@@ -24,26 +57,122 @@ class HandfulDice(object):
     def __repr__(self):
         return 'HandfulDice({})'.format(self.__str__())
 
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.faces == other.faces and self.bonus == other.bonus
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __reduce_ex__(self, protocol):
+        """
+        Pickle HandfulDice by its binary form of gurps_dice_codec,
+        handfuls which do not fit it are pickled by default
+        """
+        import gurps_dice_codec
+        if self.__class__ is HandfulDice:
+            try:
+                return gurps_dice_codec.decode, (gurps_dice_codec.encode(self),)
+            except gurps_dice_codec.DiceCodecError:
+                pass
+        return super(HandfulDice, self).__reduce_ex__(protocol)
+
     def __add__(self, other):
         if isinstance(other, int):
-            return HandfulDice(self.handful, bonus=self.bonus + other)
-        elif isinstance(other, Dice):
-            return HandfulDice(*(self.handful + (other,)), bonus=self.bonus)
+            handful = self.copy()
+            handful.bonus += other
+        elif isinstance(other, DICE_TYPES):
+            handful = self.copy()
+            handful._add(other)
         elif isinstance(other, self.__class__):
-            return HandfulDice(*(self.handful + other.handful), bonus=self.bonus + other.bonus)
+            handful = self.copy()
+            for face, count in other.faces.items():
+                handful._add_face(face, count)
+            handful.bonus += other.bonus
         else:
             raise TypeError("unsupported operand type(s) for +: '{}' and '{}'".format(self.__class__, type(other)))
+        return handful
 
     def __sub__(self, other):
         if isinstance(other, int):
-            return HandfulDice(self.handful, bonus=self.bonus - other)
+            handful = self.copy()
+            handful.bonus -= other
+            return handful
         else:
             raise TypeError("unsupported operand type(s) for -: '{}' and '{}'".format(self.__class__, type(other)))
 
+    @property
+    def handful(self):
+        """
+        Return tuple of Dice, one by face
+        """
+        return tuple(Dice(count, face) for face, count in sorted(self.faces.items()))
+
+    # Setting
+    def _add_face(self, face, count):
+        if count and face:
+            self.faces[face] = self.faces.get(face, 0) + count
+
+    def _add(self, dice):
+        if getattr(dice, 'modifiers', None):
+            raise HandfulDiceError("dice with modifiers can not be added to HandfulDice: '{}'".format(dice))
+        self._add_face(dice.face, dice.count)
+        self.bonus += getattr(dice, 'bonus', 0)
+
     def add_dice(self, dice):
+        """
+        Add dice to HandfulDice in place
+        """
         if isinstance(dice, str):
             self.add_dice(Dice(dice))
-        elif isinstance(dice, Dice):
-            self.handful += (dice,)
+        elif isinstance(dice, DICE_TYPES):
+            self._add(dice)
         else:
             raise TypeError("unsupported type for add_dice: '{}'".format(type(dice)))
+
+    def extend(self, dices):
+        """
+        Add every dice from iterable to HandfulDice in place
+        """
+        for dice in dices:
+            self.add_dice(dice)
+
+    # HandfulDice roll functionality
+    def roll(self, rng=None):
+        """
+        Roll HandfulDice and return result.
+        Dices with the same face are rolled together
+        """
+        roll_result = self.bonus
+        for face, count in self.faces.items():
+            roll_result += roll_sum(count, face, rng)
+        return roll_result
+
+    def roll_many(self, n, rng=None):
+        """
+        Roll HandfulDice n times and return array of results
+        """
+        if not self.faces:
+            return roll_many(0, 0, n, bonus=self.bonus, rng=rng)
+        groups = iter(self.faces.items())
+        face, count = next(groups)
+        results = roll_many(count, face, n, bonus=self.bonus, rng=rng)
+        for face, count in groups:
+            results = add_rolls(results, roll_many(count, face, n, rng=rng))
+        return results
+
+    def max(self):
+        """
+        Return the maximum value which can be
+        """
+        return sum(face * count for face, count in self.faces.items()) + self.bonus
+
+    def min(self):
+        """
+        Return the minimum value which can be
+        """
+        return sum(self.faces.values()) + self.bonus
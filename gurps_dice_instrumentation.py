@@ -0,0 +1,238 @@
+"""
+Opt-in instrumentation of gurps_dice hot paths.
+enable() replaces instrumented methods by timing wrappers,
+disable() puts the original methods back, so disabled instrumentation
+costs nothing.
+gurps_dice_instrumentation.enable()
+...
+gurps_dice_instrumentation.snapshot() -> {'Dice.roll': {'calls': 10, ...}, ...}
+gurps_dice_instrumentation.disable()
+"""
+import time
+import functools
+import threading
+import contextlib
+from collections import deque
+
+from gurps_dice import Dice, GurpsDice
+from gurps_dice_handful import HandfulDice
+
+SAMPLE_SIZE = 10000
+PERCENTILES = (50, 90, 99)
+
+
+def _roll_dice(args, kwargs):
+    return args[0].count
+
+
+def _roll_many_dice(args, kwargs):
+    return args[0].count * (args[1] if len(args) > 1 else kwargs['n'])
+
+
+def _handful_roll_dice(args, kwargs):
+    return sum(args[0].faces.values())
+
+
+def _handful_roll_many_dice(args, kwargs):
+    return _handful_roll_dice(args, kwargs) * (args[1] if len(args) > 1 else kwargs['n'])
+
+
+# (class, method name, function which returns number of rolled dices or None)
+INSTRUMENTED = (
+    (Dice, 'roll', _roll_dice),
+    (Dice, 'roll_many', _roll_many_dice),
+    (Dice, '_parse_dice_str', None),
+    (Dice, '_parse_modified_dice_str', None),
+    (Dice, 'search_dice_in_str', None),
+    (Dice, '_is_count_valid', None),
+    (Dice, '_is_face_valid', None),
+    (Dice, '_is_modifiers_valid', None),
+    (Dice, '_is_dice_valid', None),
+    (GurpsDice, 'roll', _roll_dice),
+    (GurpsDice, 'roll_many', _roll_many_dice),
+    (GurpsDice, '_parse_dice_str', None),
+    (GurpsDice, 'search_dice_in_str', None),
+    (GurpsDice, '_is_face_valid', None),
+    (GurpsDice, '_is_bonus_valid', None),
+    (GurpsDice, '_is_dice_valid', None),
+    (GurpsDice, 'round_up_step', None),
+    (GurpsDice, 'round_up_max', None),
+    (GurpsDice, 'round_down_step', None),
+    (GurpsDice, 'round_down_max', None),
+    (GurpsDice, 'round', None),
+    (GurpsDice, 'rounded', None),
+    (HandfulDice, 'roll', _handful_roll_dice),
+    (HandfulDice, 'roll_many', _handful_roll_many_dice),
+    (HandfulDice, '__add__', None),
+    (HandfulDice, '__sub__', None),
+    (HandfulDice, 'add_dice', None),
+    (HandfulDice, 'extend', None),
+)
+
+
+class CallStats(object):
+    """
+    Call count, latencies and rolled dices of one instrumented method.
+    Percentiles are taken from the last SAMPLE_SIZE calls
+    """
+
+    def __init__(self, name, sample_size=SAMPLE_SIZE):
+        self.name = name
+        self.samples = deque(maxlen=sample_size)
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.dice = 0
+        self.samples.clear()
+
+    def __repr__(self):
+        return "CallStats({}, calls={:d}, total_ns={:d})".format(self.name, self.calls, self.total_ns)
+
+    def record(self, elapsed, dice=0, error=False):
+        self.calls += 1
+        self.errors += error
+        self.total_ns += elapsed
+        self.dice += dice
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+        self.samples.append(elapsed)
+
+    def percentile(self, percent):
+        """
+        Return latency in ns which percent of sampled calls are not slower than
+        """
+        return self._percentile(sorted(self.samples), percent)
+
+    @staticmethod
+    def _percentile(samples, percent):
+        return samples[min(len(samples) - 1, len(samples) * percent // 100)] if samples else 0
+
+    def to_dict(self):
+        samples = sorted(self.samples)
+        stats = {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ns': self.total_ns,
+            'mean_ns': self.total_ns / self.calls if self.calls else 0.0,
+            'max_ns': self.max_ns,
+            'dice': self.dice,
+            'dice_per_second': self.dice * 1e9 / self.total_ns if self.total_ns else 0.0,
+        }
+        for percent in PERCENTILES:
+            stats['p{:d}_ns'.format(percent)] = self._percentile(samples, percent)
+        return stats
+
+
+_stats = {}
+_callbacks = []
+_originals = {}
+# Method names which are being called by thread, super() calls of them are not recorded
+_active = threading.local()
+
+
+def _wrap(name, attribute, func, count_dice):
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = CallStats(name)
+    perf_counter_ns = time.perf_counter_ns
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        active = getattr(_active, 'attributes', None)
+        if active is None:
+            active = _active.attributes = set()
+        if attribute in active:
+            return func(*args, **kwargs)
+        active.add(attribute)
+        error = False
+        start = perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            active.discard(attribute)
+            elapsed = perf_counter_ns() - start
+            dice = count_dice(args, kwargs) if count_dice is not None and not error else 0
+            stats.record(elapsed, dice, error)
+            for callback in _callbacks:
+                callback(name, elapsed, dice)
+    return wrapper
+
+
+def enable():
+    """
+    Replace instrumented methods by timing wrappers
+    """
+    for cls, attribute, count_dice in INSTRUMENTED:
+        key = (cls, attribute)
+        if key in _originals:
+            continue
+        original = cls.__dict__[attribute]
+        name = "{}.{}".format(cls.__name__, attribute)
+        if isinstance(original, staticmethod):
+            wrapped = staticmethod(_wrap(name, attribute, original.__func__, count_dice))
+        elif isinstance(original, classmethod):
+            wrapped = classmethod(_wrap(name, attribute, original.__func__, count_dice))
+        else:
+            wrapped = _wrap(name, attribute, original, count_dice)
+        _originals[key] = original
+        setattr(cls, attribute, wrapped)
+
+
+def disable():
+    """
+    Put original methods back, collected stats are kept
+    """
+    for (cls, attribute), original in _originals.items():
+        setattr(cls, attribute, original)
+    _originals.clear()
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+@contextlib.contextmanager
+def instrumented():
+    """
+    Enable instrumentation inside with block
+    """
+    enabled = is_enabled()
+    enable()
+    try:
+        yield
+    finally:
+        if not enabled:
+            disable()
+
+
+def reset():
+    """
+    Forget all collected stats
+    """
+    for stats in _stats.values():
+        stats.reset()
+
+
+def snapshot():
+    """
+    Return dict method name -> dict of stats of called methods
+    """
+    return {name: stats.to_dict() for name, stats in sorted(_stats.items()) if stats.calls}
+
+
+def add_callback(callback):
+    """
+    Call callback(method name, elapsed ns, rolled dices) after every instrumented call
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
@@ -0,0 +1,414 @@
+"""
+Append-only memory-mapped journal of rolls for auditing.
+enable() makes Dice.roll() and GurpsDice.roll() write one fixed record by roll:
+timestamp, binary dice of gurps_dice_codec, result, seed and position of the stream.
+Rolls without rng are rolled by RandomStream of the journal, so replay()
+re-derives their results from the seeds. Rolls with rng are recorded as external,
+they are kept but can not be replayed.
+gurps_dice_journal.enable("rolls")
+GurpsDice("3d6+2").roll() -> 13, recorded
+gurps_dice_journal.disable().close()
+gurps_dice_journal.replay("rolls") -> ReplayReport(verified=1, skipped=0, mismatches=[])
+python gurps_dice_journal.py show rolls --dice 3d6+2
+python gurps_dice_journal.py replay rolls
+Replay gives the same results with the same roll settings: roll engine, alias tables,
+approximation and loaded distribution table.
+
+Directory has segments rolls-<index>.journal of segment_records records,
+a full segment is closed and the next one is started. Segment is little-endian:
+header    4s magic, H version, H record size, I capacity, Q number of records, 12x
+records   d timestamp, Q seed, Q position, q result, B flags, 3x, 12s binary dice
+"""
+import os
+import re
+import sys
+import mmap
+import time
+import struct
+import random
+import argparse
+import functools
+import threading
+import contextlib
+from collections import namedtuple
+
+import gurps_dice
+from gurps_dice import Dice, GurpsDice, DiceError, EmptyDiceError, _import_numpy
+from gurps_dice_codec import KINDS, DiceCodecError, encode, decode_from
+from gurps_dice_random import RandomStream, derive_seed
+
+MAGIC = b'GDJR'
+VERSION = 1
+SEGMENT_RECORDS = 1 << 16
+# Flag of rolls with rng of the caller
+EXTERNAL = 1
+_HEADER = struct.Struct('<4sHHIQ12x')
+_LENGTH = struct.Struct('<Q')
+_LENGTH_OFFSET = 12
+_RECORD = struct.Struct('<dQQqB3x12s')
+_SEGMENT_NAME = "rolls-{:08d}.journal"
+_SEGMENT_PATTERN = re.compile(r"^rolls-(?P<index>\d{8})\.journal$")
+
+JournalRecord = namedtuple('JournalRecord', ['timestamp', 'dice', 'result', 'seed', 'position', 'flags'])
+ReplayReport = namedtuple('ReplayReport', ['verified', 'skipped', 'mismatches'])
+
+
+class JournalError(DiceError):
+    pass
+
+
+def segment_paths(directory):
+    """
+    Return paths of journal segments in directory in order
+    """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if _SEGMENT_PATTERN.match(name))
+
+
+def _read_header(buffer, path):
+    if len(buffer) < _HEADER.size:
+        raise JournalError("'{}' is not roll journal".format(path))
+    magic, version, record_size, capacity, length = _HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise JournalError("'{}' is not roll journal".format(path))
+    if version != VERSION or record_size != _RECORD.size:
+        raise JournalError("roll journal version {:d} is not supported".format(version))
+    if length > capacity or _HEADER.size + capacity * record_size > len(buffer):
+        raise JournalError("roll journal '{}' is corrupted".format(path))
+    return capacity, length
+
+
+class RollJournal(object):
+    """
+    Writer of journal in directory, it continues the last segment if it's there.
+    Records are written to the mapped segment under the lock, so rolls of threads
+    are recorded in the order of the stream
+    """
+
+    def __init__(self, directory, segment_records=SEGMENT_RECORDS, seed=None):
+        if not isinstance(segment_records, int) or segment_records < 1:
+            raise ValueError("segment records should be positive int")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_records = segment_records
+        self._seed = seed if seed is not None else random.getrandbits(64)
+        self._lock = threading.Lock()
+        self._mmap = None
+        paths = segment_paths(directory)
+        self._open(int(_SEGMENT_PATTERN.match(os.path.basename(paths[-1])).group('index')) if paths else 0)
+
+    def __repr__(self):
+        return "RollJournal({!r}, segment {:d})".format(self.directory, self._index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def segment_path(self):
+        return os.path.join(self.directory, _SEGMENT_NAME.format(self._index))
+
+    def _open(self, index):
+        """
+        Map segment index, it's made if it's not there, full segment is skipped
+        """
+        self._index = index
+        path = self.segment_path
+        if not os.path.exists(path):
+            with open(path, 'wb') as segment_file:
+                segment_file.write(_HEADER.pack(MAGIC, VERSION, _RECORD.size, self.segment_records, 0))
+                segment_file.truncate(_HEADER.size + _RECORD.size * self.segment_records)
+        with open(path, 'r+b') as segment_file:
+            self._mmap = mmap.mmap(segment_file.fileno(), 0)
+        try:
+            self._capacity, self._length = _read_header(self._mmap, path)
+        except JournalError:
+            self._mmap.close()
+            self._mmap = None
+            raise
+        if self._length >= self._capacity:
+            self._rotate()
+            return
+        # New stream by every opening of segment, so streams never repeat and never cross segments
+        self._stream_seed = derive_seed(self._seed, self._index, self._length)
+        self._stream = RandomStream(self._stream_seed)
+        self._position = 0
+
+    def _rotate(self):
+        self._mmap.flush()
+        self._mmap.close()
+        self._open(self._index + 1)
+
+    def __call__(self, dice, rng=None):
+        return self.roll(dice, rng)
+
+    def roll(self, dice, rng=None):
+        """
+        Roll valid dice, record and return the result.
+        Dices which gurps_dice_codec can not encode, by type or by range, are not recorded
+        """
+        if dice.__class__ not in KINDS:
+            return dice._roll(rng)
+        try:
+            dice_bytes = encode(dice)
+        except DiceCodecError:
+            return dice._roll(rng)
+        with self._lock:
+            if self._mmap is None:
+                raise JournalError("roll journal is closed")
+            if self._length >= self._capacity:
+                self._rotate()
+            if rng is None:
+                seed, position, flags = self._stream_seed, self._position, 0
+                roll_result = dice._roll(self._stream)
+                self._position += 1
+            else:
+                seed, position, flags = getattr(rng, 'root_seed', 0), 0, EXTERNAL
+                roll_result = dice._roll(rng)
+            _RECORD.pack_into(self._mmap, _HEADER.size + _RECORD.size * self._length,
+                              time.time(), seed, position, roll_result, flags, dice_bytes)
+            self._length += 1
+            _LENGTH.pack_into(self._mmap, _LENGTH_OFFSET, self._length)
+        return roll_result
+
+    def flush(self):
+        """
+        Write mapped records to the file
+        """
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+                self._mmap.close()
+                self._mmap = None
+
+
+def enable(journal):
+    """
+    Record Dice.roll() and GurpsDice.roll() to RollJournal or to new RollJournal in directory.
+    Return the journal
+    """
+    if not isinstance(journal, RollJournal):
+        journal = RollJournal(journal)
+    gurps_dice._journal = journal
+    return journal
+
+
+def disable():
+    """
+    Stop recording rolls, return the journal which was enabled or None.
+    It's not closed
+    """
+    journal = gurps_dice._journal
+    gurps_dice._journal = None
+    return journal
+
+
+def is_enabled():
+    return gurps_dice._journal is not None
+
+
+@contextlib.contextmanager
+def journaled(journal):
+    """
+    Record rolls inside with block, journal made from directory is closed after it
+    """
+    previous = gurps_dice._journal
+    opened = not isinstance(journal, RollJournal)
+    journal = enable(journal)
+    try:
+        yield journal
+    finally:
+        gurps_dice._journal = previous
+        if opened:
+            journal.close()
+
+
+class JournalSegment(object):
+    """
+    Read-only mapped segment, records written after opening are not seen
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as segment_file:
+            try:
+                self._mmap = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise JournalError("roll journal '{}' is empty".format(path))
+        try:
+            self.capacity, self.length = _read_header(self._mmap, path)
+        except JournalError:
+            self._mmap.close()
+            raise
+        self._buffer = memoryview(self._mmap)
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def raw_records(self):
+        """
+        Iterate (timestamp, seed, position, result, flags, binary dice) of records
+        """
+        return _RECORD.iter_unpack(self._buffer[_HEADER.size:_HEADER.size + _RECORD.size * self.length])
+
+    def array(self):
+        """
+        Return numpy structured array of records on the mapped file
+        """
+        return _import_numpy().frombuffer(self._buffer, dtype=record_dtype(), count=self.length, offset=_HEADER.size)
+
+    def close(self):
+        """
+        Unmap the segment, if arrays of it are still used, it's unmapped when they are gone
+        """
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+@functools.lru_cache(maxsize=None)
+def record_dtype():
+    """
+    Return numpy dtype of records as structured array
+    """
+    numpy = _import_numpy()
+    if numpy is None:
+        raise ImportError("numpy is required for arrays of records")
+    return numpy.dtype([('timestamp', '<f8'), ('seed', '<u8'), ('position', '<u8'), ('result', '<i8'),
+                        ('flags', 'u1'), ('padding', 'V3'), ('dice', 'S12')])
+
+
+def _dice_bytes(dice):
+    """
+    Return binary dice of record for dice or its str
+    """
+    if isinstance(dice, str):
+        try:
+            dice = GurpsDice(dice)
+        except EmptyDiceError:
+            dice = Dice(dice)
+    return encode(dice).ljust(12, b'\0')
+
+
+def iter_records(directory, since=None, until=None, dice=None):
+    """
+    Iterate JournalRecord of directory in order with since <= timestamp < until
+    and with dice (Dice, GurpsDice or their str). Records are filtered before decoding,
+    dice of record is str
+    """
+    dice_bytes = _dice_bytes(dice) if dice is not None else None
+    names = {}
+    for path in segment_paths(directory):
+        with JournalSegment(path) as segment:
+            for timestamp, seed, position, result, flags, binary in segment.raw_records():
+                if since is not None and timestamp < since or until is not None and timestamp >= until:
+                    continue
+                if dice_bytes is not None and binary != dice_bytes:
+                    continue
+                name = names.get(binary)
+                if name is None:
+                    name = names[binary] = str(decode_from(binary)[0])
+                yield JournalRecord(timestamp, name, result, seed, position, flags)
+
+
+def read_array(directory, since=None, until=None, dice=None):
+    """
+    Return numpy structured array of record_dtype() of records of directory in order,
+    they are filtered like iter_records() but by vectorized comparisons
+    """
+    dtype = record_dtype()
+    numpy = _import_numpy()
+    arrays = []
+    for path in segment_paths(directory):
+        with JournalSegment(path) as segment:
+            records = segment.array()
+            keep = numpy.ones(len(records), dtype=bool)
+            if since is not None:
+                keep &= records['timestamp'] >= since
+            if until is not None:
+                keep &= records['timestamp'] < until
+            if dice is not None:
+                keep &= records['dice'] == _dice_bytes(dice)
+            arrays.append(records[keep])
+            del records
+    return numpy.concatenate(arrays) if arrays else numpy.empty(0, dtype=dtype)
+
+
+def replay(directory):
+    """
+    Roll every recorded roll again from the seed of its stream and compare results.
+    Return ReplayReport: number of verified rolls, number of skipped external rolls
+    and rolls of streams which do not start in the journal, list of JournalRecord which differ
+    """
+    verified = skipped = 0
+    mismatches = []
+    dices = {}
+    for path in segment_paths(directory):
+        # Streams never cross segments
+        streams = {}
+        with JournalSegment(path) as segment:
+            for timestamp, seed, position, result, flags, binary in segment.raw_records():
+                if flags & EXTERNAL:
+                    skipped += 1
+                    continue
+                dice = dices.get(binary)
+                if dice is None:
+                    dice = dices[binary] = decode_from(binary)[0]
+                stream = streams.get(seed)
+                if stream is None and not position:
+                    stream = streams[seed] = [RandomStream(seed), 0]
+                if stream is None or stream[1] != position:
+                    skipped += 1
+                    continue
+                stream[1] += 1
+                if dice._roll(stream[0]) == result:
+                    verified += 1
+                else:
+                    mismatches.append(JournalRecord(timestamp, str(dice), result, seed, position, flags))
+    return ReplayReport(verified, skipped, mismatches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show or replay roll journal")
+    parser.add_argument('mode', choices=('show', 'replay'))
+    parser.add_argument('directory', help="journal directory")
+    parser.add_argument('--since', type=float, help="first timestamp to show")
+    parser.add_argument('--until', type=float, help="timestamp to stop show before")
+    parser.add_argument('--dice', help="dice to show like 3d6+2")
+    args = parser.parse_args(argv)
+
+    if args.mode == 'show':
+        lines = []
+        for record in iter_records(args.directory, since=args.since, until=args.until, dice=args.dice):
+            lines.append("{:.6f}\t{}\t{:d}{}".format(record.timestamp, record.dice, record.result,
+                                                     "\texternal" if record.flags & EXTERNAL else ''))
+            if len(lines) >= 1024:
+                print('\n'.join(lines))
+                lines.clear()
+        if lines:
+            print('\n'.join(lines))
+        return 0
+    report = replay(args.directory)
+    for record in report.mismatches:
+        print("MISMATCH\t{:.6f}\t{}\t{:d}\tseed {:d} position {:d}".format(
+            record.timestamp, record.dice, record.result, record.seed, record.position))
+    print("{:d} verified, {:d} skipped, {:d} mismatches".format(report.verified, report.skipped, len(report.mismatches)))
+    return 1 if report.mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import random
+import hashlib
+
+from gurps_dice import _import_numpy
+
+
+def derive_seed(seed, *path):
+    """
+    Return 64 bit seed derived from seed and path.
+    Same seed and path always give the same result,
+    different paths give independent seeds.
+    derive_seed(42, 3) -> seed of shard 3 of root seed 42
+    """
+    key = repr((seed,) + path).encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class RandomStream(random.Random):
+    """
+    random.Random which knows its seed and can spawn child streams.
+    RandomStream(42).child(3) is the stream of shard 3,
+    it does not depend on the state of the parent stream,
+    so shards give the same results in any process and in any order.
+    """
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.root_seed = seed
+        self._spawned = 0
+        self._numpy_spawned = 0
+        super(RandomStream, self).__init__(seed)
+
+    def __repr__(self):
+        return "RandomStream({!r})".format(self.root_seed)
+
+    def __reduce__(self):
+        return self.__class__, (self.root_seed,), self.__getstate__()
+
+    def __getstate__(self):
+        return {'random_state': self.getstate(), '_spawned': self._spawned, '_numpy_spawned': self._numpy_spawned}
+
+    def __setstate__(self, state):
+        self.setstate(state['random_state'])
+        self._spawned = state['_spawned']
+        self._numpy_spawned = state.get('_numpy_spawned', 0)
+
+    def child(self, *path):
+        """
+        Return child RandomStream by path
+        """
+        return self.__class__(derive_seed(self.root_seed, *path))
+
+    def spawn(self, n):
+        """
+        Return n new child RandomStream, they never repeat for this stream
+        """
+        children = [self.child(index) for index in range(self._spawned, self._spawned + n)]
+        self._spawned += n
+        return children
+
+    def numpy_generator(self):
+        """
+        Return new numpy.random.Generator seeded from the seed of the stream,
+        generators never repeat for this stream like spawn()
+        """
+        numpy = _import_numpy()
+        if numpy is None:
+            raise ImportError("numpy is required for numpy_generator")
+        seed = derive_seed(self.root_seed, 'numpy', self._numpy_spawned)
+        self._numpy_spawned += 1
+        return numpy.random.default_rng(seed)
+
+
+def split(seed, n):
+    """
+    Return n independent RandomStream of shards of root seed
+    """
+    return [RandomStream(derive_seed(seed, index)) for index in range(n)]
@@ -0,0 +1,268 @@
+"""
+asyncio dice service.
+Protocol is one request by line: dice expression like "2d6+1d8-3",
+response is one line: "OK <result>" or "ERR <message>".
+Responses of one connection come in the order of requests, so requests
+can be pipelined. Concurrent requests for the same expression are rolled
+by one batched roll_many() call.
+python gurps_dice_service.py --port 8765
+python gurps_dice_service.py --unix /tmp/gurps_dice.sock
+"""
+import asyncio
+import argparse
+
+from gurps_dice import DiceError
+from gurps_dice_expression import compile_expression
+
+
+class DiceServiceError(DiceError):
+    pass
+
+
+class RollBatcher(object):
+    """
+    Collect roll requests by expression and roll every expression once per batch.
+    Batch is rolled after max_delay seconds or when max_batch requests wait.
+    """
+
+    def __init__(self, max_batch=4096, max_delay=0.001, rng=None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.rng = rng
+        self._pending = {}
+        self._pending_count = 0
+        self._flush_handle = None
+        self.batches = 0
+        self.rolls = 0
+
+    def roll(self, expression):
+        """
+        Return future with roll result of expression str or compiled DiceExpression
+        """
+        if isinstance(expression, str):
+            expression = compile_expression(expression)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(expression, []).append(future)
+        self._pending_count += 1
+        if self._pending_count >= self.max_batch:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self.flush)
+        return future
+
+    def flush(self):
+        """
+        Roll all pending requests
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending, self._pending_count = self._pending, {}, 0
+        for expression, futures in pending.items():
+            futures = [future for future in futures if not future.done()]
+            if not futures:
+                continue
+            try:
+                results = expression.roll_many(len(futures), rng=self.rng)
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(int(result))
+            self.batches += 1
+            self.rolls += len(futures)
+
+
+class DiceServer(object):
+    """
+    asyncio TCP or Unix socket dice server.
+    max_pipeline is how many requests of one connection can wait for
+    results, reading stops until they are sent (backpressure).
+    max_line is the longest accepted request line.
+    max_dice and max_face limit dices of one expression.
+    """
+
+    def __init__(self, max_pipeline=256, max_line=1024, max_dice=1000, max_face=1000000, batcher=None):
+        self.max_pipeline = max_pipeline
+        self.max_line = max_line
+        self.max_dice = max_dice
+        self.max_face = max_face
+        self.batcher = batcher if batcher is not None else RollBatcher()
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """
+        Start listening on host and port or on Unix socket path
+        """
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=path, limit=self.max_line)
+        else:
+            self.server = await asyncio.start_server(self._handle, host=host, port=port, limit=self.max_line)
+        return self.server
+
+    @property
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def _request(self, line):
+        """
+        Return future with response line for request line
+        """
+        expression_str = line.decode('utf-8', 'replace').strip()
+        try:
+            expression = compile_expression(expression_str)
+            groups = expression.positive + expression.negative
+            if sum(count for face, count in groups) > self.max_dice:
+                raise DiceServiceError("expression can not have more than {:d} dices".format(self.max_dice))
+            if any(face > self.max_face for face, count in groups):
+                raise DiceServiceError("dice face can not be more than {:d}".format(self.max_face))
+            return self.batcher.roll(expression)
+        except Exception as error:
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(error)
+            return future
+
+    async def _handle(self, reader, writer):
+        responses = asyncio.Queue(maxsize=self.max_pipeline)
+        sender = asyncio.ensure_future(self._send(responses, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await responses.put(DiceServiceError("request line is longer than {:d}".format(self.max_line)))
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if line.strip():
+                    await responses.put(self._request(line))
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+
+    async def _send(self, responses, writer):
+        connected = True
+        while True:
+            response = await responses.get()
+            if response is None:
+                break
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                line = "OK {:d}\n".format(await response)
+            except Exception as error:
+                line = "ERR {}\n".format(error)
+            if not connected:
+                continue
+            try:
+                writer.write(line.encode())
+                await writer.drain()
+            except ConnectionError:
+                connected = False
+        if connected:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+
+class DiceClient(object):
+    """
+    asyncio client of DiceServer.
+    client = await DiceClient.connect(port=8765)
+    await client.roll("3d6+2") -> 12
+    await client.roll_many(["3d6", "1d20"] * 100) -> [...] pipelined
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=None, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def _read_result(self):
+        line = (await self.reader.readline()).decode().rstrip('\n')
+        if line.startswith("OK "):
+            return int(line[3:])
+        if not line:
+            raise DiceServiceError("connection is closed")
+        raise DiceServiceError(line[4:])
+
+    async def roll(self, expression_str):
+        """
+        Roll expression on server and return result
+        """
+        return (await self.roll_many([expression_str]))[0]
+
+    async def roll_many(self, expression_strs, raise_errors=True):
+        """
+        Send all expressions without waiting and return list of results.
+        All responses are read before the first error is raised,
+        with raise_errors=False errors are returned as DiceServiceError
+        """
+        for expression_str in expression_strs:
+            if not expression_str.strip() or '\n' in expression_str:
+                raise DiceServiceError("expression should be one not empty line: {!r}".format(expression_str))
+        async with self._lock:
+            self.writer.write(''.join("{}\n".format(expression_str) for expression_str in expression_strs).encode())
+            await self.writer.drain()
+            results = []
+            first_error = None
+            for _ in range(len(expression_strs)):
+                try:
+                    results.append(await self._read_result())
+                except DiceServiceError as error:
+                    first_error = first_error or error
+                    results.append(error)
+            if raise_errors and first_error is not None:
+                raise first_error
+            return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="asyncio dice service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on Unix socket path instead of TCP")
+    parser.add_argument('--max-batch', type=int, default=4096, help="roll batch when so many requests wait")
+    parser.add_argument('--max-delay', type=float, default=0.001, help="roll batch after so many seconds")
+    parser.add_argument('--max-pipeline', type=int, default=256, help="waiting requests by connection")
+    parser.add_argument('--max-dice', type=int, default=1000, help="dices in one expression")
+    parser.add_argument('--max-face', type=int, default=1000000, help="the biggest dice face")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = DiceServer(max_pipeline=args.max_pipeline, max_dice=args.max_dice, max_face=args.max_face,
+                            batcher=RollBatcher(max_batch=args.max_batch, max_delay=args.max_delay))
+        await server.start(host=args.host, port=args.port, path=args.unix)
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+import math
+from collections import Counter
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+from gurps_dice import GurpsDice
+from gurps_dice_random import RandomStream, derive_seed
+from gurps_dice_success import SuccessRoll, CRITICAL_SUCCESS
+
+DRAW = -1
+
+
+class SimulationError(Exception):
+    pass
+
+
+class Combatant(object):
+    """
+    Side of the combat simulation.
+    Combatant("knight", skill=14, defense=10, damage="2d6+1", dr=3, hp=12)
+    """
+
+    def __init__(self, name, skill, defense, damage, dr=0, hp=10):
+        if not isinstance(damage, GurpsDice):
+            damage = GurpsDice(damage)
+        for parameter, value in (('skill', skill), ('defense', defense), ('dr', dr), ('hp', hp)):
+            if not isinstance(value, int):
+                raise TypeError("unsupported type for {}: '{}'".format(parameter, type(value)))
+        self.name = name
+        self.skill = skill
+        self.defense = defense
+        self.damage = damage
+        self.dr = dr
+        self.hp = hp
+
+    def __repr__(self):
+        return "Combatant({!r}, skill={:d}, defense={:d}, damage={}, dr={:d}, hp={:d})".format(
+            self.name, self.skill, self.defense, self.damage, self.dr, self.hp)
+
+
+def fight(combatants, rng, max_rounds=100):
+    """
+    Fight until one side drops.
+    Sides attack in turn: success roll against skill, then success roll
+    against defense (not allowed after critical success), then damage minus DR.
+    Return (winner index or DRAW, number of rounds)
+    """
+    attacks = [SuccessRoll(combatant.skill) for combatant in combatants]
+    defenses = [SuccessRoll(combatant.defense) for combatant in combatants]
+    hp = [combatant.hp for combatant in combatants]
+    for rounds in range(1, max_rounds + 1):
+        for attacker, defender in ((0, 1), (1, 0)):
+            attack = attacks[attacker].roll(rng)
+            if not attack.is_success:
+                continue
+            if attack.outcome != CRITICAL_SUCCESS and defenses[defender].roll(rng).is_success:
+                continue
+            hp[defender] -= max(0, combatants[attacker].damage.roll(rng) - combatants[defender].dr)
+            if hp[defender] <= 0:
+                return attacker, rounds
+    return DRAW, max_rounds
+
+
+def _run_shard(combatants, trials, seed, max_rounds):
+    """
+    Run trials with own RandomStream and return partial histograms
+    """
+    rng = RandomStream(seed)
+    wins = Counter()
+    rounds = Counter()
+    for trial in range(trials):
+        winner, trial_rounds = fight(combatants, rng, max_rounds)
+        wins[winner] += 1
+        rounds[trial_rounds] += 1
+    return wins, rounds
+
+
+class SimulationResult(object):
+    """
+    Merged histograms of combat simulation with confidence intervals
+    """
+
+    def __init__(self, confidence=0.95):
+        self.trials = 0
+        self.shards = 0
+        self.wins = Counter()
+        self.rounds = Counter()
+        self.confidence = confidence
+        self._z = NormalDist().inv_cdf((1 + confidence) / 2)
+
+    def __repr__(self):
+        low, high = self.win_rate_interval(0)
+        return "SimulationResult(trials={:d}, win_rate={:.4f} [{:.4f}, {:.4f}], mean_rounds={:.2f})".format(
+            self.trials, self.win_rate(0), low, high, self.mean_rounds())
+
+    def merge(self, wins, rounds, trials):
+        self.wins.update(wins)
+        self.rounds.update(rounds)
+        self.trials += trials
+        self.shards += 1
+
+    def win_rate(self, side=0):
+        """
+        Return share of trials won by side, DRAW for share of draws
+        """
+        return self.wins[side] / self.trials if self.trials else 0.0
+
+    def win_rate_interval(self, side=0):
+        """
+        Return Wilson score confidence interval of win rate,
+        it does not collapse to zero width at win rate 0 or 1
+        """
+        if not self.trials:
+            return 0.0, 1.0
+        rate = self.win_rate(side)
+        z_square = self._z ** 2 / self.trials
+        center = (rate + z_square / 2) / (1 + z_square)
+        half_width = self._z * math.sqrt(rate * (1 - rate) / self.trials + z_square / self.trials / 4) / (1 + z_square)
+        return center - half_width, center + half_width
+
+    def mean_rounds(self):
+        """
+        Return mean number of rounds in fight
+        """
+        if not self.trials:
+            return 0.0
+        return sum(rounds * count for rounds, count in self.rounds.items()) / self.trials
+
+    def mean_rounds_interval(self):
+        """
+        Return normal approximation confidence interval of mean number of rounds
+        """
+        mean = self.mean_rounds()
+        if self.trials < 2:
+            return mean - math.inf, mean + math.inf
+        variance = sum(count * (rounds - mean) ** 2 for rounds, count in self.rounds.items()) / (self.trials - 1)
+        half_width = self._z * math.sqrt(variance / self.trials)
+        return mean - half_width, mean + half_width
+
+    def precision(self):
+        """
+        Return the widest half width of win rate confidence intervals
+        """
+        return max((high - low) / 2 for low, high in map(self.win_rate_interval, (0, 1)))
+
+
+class CombatSimulation(object):
+    """
+    Monte Carlo simulation of fights between two Combatant.
+    Trials are split into shards of shard_size with own seed derived from seed,
+    shards are run by a process pool and their histograms are merged in order,
+    so the result depends only on seed, not on the number of processes.
+    CombatSimulation(knight, orc, seed=1).run(precision=0.01)
+    """
+
+    def __init__(self, first, second, seed=None, max_rounds=100, shard_size=1000, processes=None):
+        if not isinstance(shard_size, int) or shard_size < 1:
+            raise SimulationError("shard size should be positive int")
+        self.combatants = (first, second)
+        self.seed = seed if seed is not None else RandomStream().root_seed
+        self.max_rounds = max_rounds
+        self.shard_size = shard_size
+        self.processes = processes
+
+    def _shard_args(self, start, stop, trials):
+        """
+        Return args of _run_shard for shards from start to stop,
+        the last shard of all is cut to trials
+        """
+        shards = range(start, stop)
+        return (
+            [self.combatants] * len(shards),
+            [min(self.shard_size, trials - shard * self.shard_size) for shard in shards],
+            [derive_seed(self.seed, shard) for shard in shards],
+            [self.max_rounds] * len(shards),
+        )
+
+    def run(self, trials=None, precision=None, confidence=0.95, max_trials=1000000, wave=8):
+        """
+        Run trials and return SimulationResult.
+        With precision it stops after the first wave of shards
+        when half width of win rate confidence intervals is not wider
+        than precision, or after max_trials
+        """
+        if trials is None and precision is None:
+            raise SimulationError("trials or precision should be given")
+        total_trials = trials if trials is not None else max_trials
+        total_shards = -(-total_trials // self.shard_size)
+        result = SimulationResult(confidence=confidence)
+        executor = ProcessPoolExecutor(max_workers=self.processes) if self.processes != 1 else None
+        try:
+            for start in range(0, total_shards, wave):
+                args = self._shard_args(start, min(start + wave, total_shards), total_trials)
+                partials = executor.map(_run_shard, *args) if executor else map(_run_shard, *args)
+                for (wins, rounds), shard_trials in zip(partials, args[1]):
+                    result.merge(wins, rounds, shard_trials)
+                if precision is not None and result.precision() <= precision:
+                    break
+        finally:
+            if executor:
+                executor.shutdown()
+        return result
@@ -0,0 +1,388 @@
+import random
+import operator
+import functools
+import itertools
+from array import array
+from collections import namedtuple
+
+from gurps_dice import _import_numpy, roll_sum, roll_many, get_distribution, DiceError
+
+CRITICAL_FAILURE = -2
+FAILURE = -1
+SUCCESS = 1
+CRITICAL_SUCCESS = 2
+
+OUTCOME_NAMES = {
+    CRITICAL_FAILURE: 'critical failure',
+    FAILURE: 'failure',
+    SUCCESS: 'success',
+    CRITICAL_SUCCESS: 'critical success',
+}
+
+# Below MIN_SKILL and above MAX_SKILL the outcome of every 3d6 roll stays the same
+MIN_SKILL = -6
+MAX_SKILL = 16
+
+MIN_ROLL = 3
+MAX_ROLL = 18
+
+_ROLLS = range(MIN_ROLL, MAX_ROLL + 1)
+_ROW = MAX_ROLL + 1
+
+# Regular contest with the higher skill above it is rolled with both skills reduced
+REGULAR_MAX_SKILL = 14
+MAX_CONTEST_ROUNDS = 1000
+CONTEST_CACHE_SIZE = 4096
+
+# All 216 equiprobable 3d6 results, so one random.choice is one success roll
+_THREE_D6 = tuple(sum(outcome) for outcome in itertools.product(range(1, 7), repeat=3))
+
+
+class SuccessRollError(DiceError):
+    pass
+
+
+def _rule_outcome(skill, roll):
+    """
+    Return outcome of 3d6 success roll by GURPS rules
+    """
+    if roll <= 4 or (roll == 5 and skill >= 15) or (roll == 6 and skill >= 16):
+        return CRITICAL_SUCCESS
+    if roll == 18 or (roll == 17 and skill <= 15) or roll >= skill + 10:
+        return CRITICAL_FAILURE
+    if roll == 17 or roll > skill:
+        return FAILURE
+    return SUCCESS
+
+
+def _build_tables():
+    outcomes = []
+    probabilities = []
+    distribution = get_distribution(3, 6)
+    for skill in range(MIN_SKILL, MAX_SKILL + 1):
+        row = [FAILURE] * _ROW
+        chances = dict.fromkeys(OUTCOME_NAMES, 0.0)
+        for roll in _ROLLS:
+            row[roll] = _rule_outcome(skill, roll)
+            chances[row[roll]] += distribution.pmf(roll)
+        outcomes.extend(row)
+        probabilities.append(chances)
+    return tuple(outcomes), tuple(probabilities)
+
+
+_OUTCOMES, _PROBABILITIES = _build_tables()
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy_outcomes():
+    """
+    Return outcomes table as numpy array, it's made on the first vectorized use
+    """
+    numpy = _import_numpy()
+    return numpy.array(_OUTCOMES, dtype=numpy.int8)
+
+
+def _skill_index(skill):
+    if not isinstance(skill, int):
+        raise TypeError("unsupported type for skill: '{}'".format(type(skill)))
+    return min(max(skill, MIN_SKILL), MAX_SKILL) - MIN_SKILL
+
+
+def _check_roll(roll):
+    """
+    Return roll as int, rise error's if it's not 3d6 roll
+    """
+    try:
+        roll = operator.index(roll)
+    except TypeError:
+        raise TypeError("unsupported type for roll: '{}'".format(type(roll)))
+    if not MIN_ROLL <= roll <= MAX_ROLL:
+        raise SuccessRollError("3d6 roll should be in range {:d}-{:d}, not {:d}".format(MIN_ROLL, MAX_ROLL, roll))
+    return roll
+
+
+def _check_rolls(low, high):
+    if low < MIN_ROLL or high > MAX_ROLL:
+        raise SuccessRollError("3d6 rolls should be in range {:d}-{:d}, not {:d}-{:d}".format(MIN_ROLL, MAX_ROLL, low, high))
+
+
+def outcome(skill, roll):
+    """
+    Return outcome of 3d6 roll against skill
+    """
+    return _OUTCOMES[_skill_index(skill) * _ROW + _check_roll(roll)]
+
+
+def outcome_probabilities(skill):
+    """
+    Return dict with probability of every outcome of success roll against skill
+    """
+    return dict(_PROBABILITIES[_skill_index(skill)])
+
+
+def success_probability(skill):
+    """
+    Return the probability of success (critical or not) against skill
+    """
+    chances = _PROBABILITIES[_skill_index(skill)]
+    return chances[SUCCESS] + chances[CRITICAL_SUCCESS]
+
+
+class SuccessRollResult(namedtuple('SuccessRollResult', ['skill', 'roll', 'outcome', 'margin'])):
+    """
+    Result of success roll.
+    margin is margin of success, it's negative on failure
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return "{} ({:d} vs {:d}, margin {:+d})".format(OUTCOME_NAMES[self.outcome], self.roll, self.skill, self.margin)
+
+    @property
+    def is_success(self):
+        return self.outcome > 0
+
+    @property
+    def is_critical(self):
+        return self.outcome in (CRITICAL_SUCCESS, CRITICAL_FAILURE)
+
+
+def resolve(skill, roll):
+    """
+    Resolve 3d6 roll against skill and return SuccessRollResult
+    """
+    roll = _check_roll(roll)
+    return SuccessRollResult(skill, roll, _OUTCOMES[_skill_index(skill) * _ROW + roll], skill - roll)
+
+
+def resolve_many(skill, rolls):
+    """
+    Resolve array of 3d6 rolls against skill.
+    Return arrays of outcomes and margins of success
+    """
+    numpy = _import_numpy()
+    if numpy is not None:
+        rolls = numpy.asarray(rolls)
+        if not len(rolls):
+            rolls = rolls.astype(numpy.int64)
+        elif rolls.dtype.kind not in 'iu':
+            raise TypeError("unsupported type for rolls: '{}'".format(rolls.dtype))
+        else:
+            _check_rolls(int(rolls.min()), int(rolls.max()))
+    else:
+        rolls = array('q', rolls)
+        if rolls:
+            _check_rolls(min(rolls), max(rolls))
+    return _resolve_many(skill, rolls)
+
+
+def _resolve_many(skill, rolls):
+    """
+    Resolve array of valid 3d6 rolls against skill
+    """
+    offset = _skill_index(skill) * _ROW
+    numpy = _import_numpy()
+    if numpy is not None:
+        rolls = numpy.asarray(rolls)
+        return _numpy_outcomes()[rolls + offset], skill - rolls
+    outcomes = array('b', [_OUTCOMES[offset + roll] for roll in rolls])
+    margins = array('q', [skill - roll for roll in rolls])
+    return outcomes, margins
+
+
+def _is_success(skill, roll):
+    return _OUTCOMES[_skill_index(skill) * _ROW + roll] > 0
+
+
+def _contest_winner(skill1, roll1, skill2, roll2):
+    """
+    Return 1 if the first wins quick contest, -1 if the second wins, 0 on tie
+    """
+    success1, success2 = _is_success(skill1, roll1), _is_success(skill2, roll2)
+    if success1 != success2:
+        return 1 if success1 else -1
+    margin = (skill1 - roll1) - (skill2 - roll2)
+    return (margin > 0) - (margin < 0)
+
+
+def _regular_skills(skill1, skill2):
+    """
+    Return skills of regular contest, if the higher is above REGULAR_MAX_SKILL
+    both are reduced until it's REGULAR_MAX_SKILL
+    """
+    shift = max(skill1, skill2, REGULAR_MAX_SKILL) - REGULAR_MAX_SKILL
+    return skill1 - shift, skill2 - shift
+
+
+def _contest_skills(skills1, skills2):
+    """
+    Return arrays of skills of contests, rise error's if they are not paired
+    """
+    numpy = _import_numpy()
+    if numpy is not None:
+        skills1, skills2 = numpy.asarray(skills1), numpy.asarray(skills2)
+        for skills in (skills1, skills2):
+            if len(skills) and skills.dtype.kind not in 'iu':
+                raise TypeError("unsupported type for skills: '{}'".format(skills.dtype))
+        skills1, skills2 = skills1.astype(numpy.int64), skills2.astype(numpy.int64)
+    else:
+        skills1, skills2 = array('q', skills1), array('q', skills2)
+    if len(skills1) != len(skills2):
+        raise SuccessRollError("skills of contests should be paired, not {:d} and {:d}".format(len(skills1), len(skills2)))
+    return skills1, skills2
+
+
+def _numpy_successes(skills, rolls):
+    numpy = _import_numpy()
+    offsets = (numpy.clip(skills, MIN_SKILL, MAX_SKILL) - MIN_SKILL) * _ROW
+    return _numpy_outcomes()[offsets + rolls] > 0
+
+
+def quick_contest(skills1, skills2, rng=None):
+    """
+    Resolve quick contests of skills1[i] against skills2[i] at once.
+    Return arrays of winners (1 if the first wins, -1 if the second wins, 0 on tie)
+    and margins of victory of the first (its margin of success minus margin of the second)
+    """
+    skills1, skills2 = _contest_skills(skills1, skills2)
+    rolls1 = roll_many(3, 6, len(skills1), rng=rng)
+    rolls2 = roll_many(3, 6, len(skills1), rng=rng)
+    numpy = _import_numpy()
+    if numpy is not None:
+        rolls1, rolls2 = numpy.asarray(rolls1), numpy.asarray(rolls2)
+        successes1 = _numpy_successes(skills1, rolls1)
+        successes2 = _numpy_successes(skills2, rolls2)
+        margins = (skills1 - rolls1) - (skills2 - rolls2)
+        winners = numpy.where(successes1 != successes2, numpy.where(successes1, 1, -1), numpy.sign(margins)).astype(numpy.int8)
+        return winners, margins
+    winners = array('b', map(_contest_winner, skills1, rolls1, skills2, rolls2))
+    margins = array('q', [(skill1 - roll1) - (skill2 - roll2) for skill1, roll1, skill2, roll2 in zip(skills1, rolls1, skills2, rolls2)])
+    return winners, margins
+
+
+def regular_contest(skills1, skills2, rng=None, max_rounds=MAX_CONTEST_ROUNDS):
+    """
+    Resolve regular contests of skills1[i] against skills2[i] at once,
+    every contest is rolled again until one succeeds and the other fails.
+    Return arrays of winners (1 if the first wins, -1 if the second wins,
+    0 if it's not resolved in max_rounds) and margins of victory of the first in the last round
+    """
+    skills1, skills2 = _contest_skills(skills1, skills2)
+    numpy = _import_numpy()
+    if numpy is not None:
+        shifts = numpy.maximum(numpy.maximum(skills1, skills2) - REGULAR_MAX_SKILL, 0)
+        skills1, skills2 = skills1 - shifts, skills2 - shifts
+        winners = numpy.zeros(len(skills1), dtype=numpy.int8)
+        margins = numpy.zeros(len(skills1), dtype=numpy.int64)
+        pending = numpy.arange(len(skills1))
+        for i in range(max_rounds):
+            if not len(pending):
+                break
+            rolls1 = numpy.asarray(roll_many(3, 6, len(pending), rng=rng))
+            rolls2 = numpy.asarray(roll_many(3, 6, len(pending), rng=rng))
+            successes1 = _numpy_successes(skills1[pending], rolls1)
+            decided = successes1 != _numpy_successes(skills2[pending], rolls2)
+            done = pending[decided]
+            winners[done] = numpy.where(successes1[decided], 1, -1)
+            margins[done] = ((skills1[done] - rolls1[decided]) - (skills2[done] - rolls2[decided]))
+            pending = pending[~decided]
+        return winners, margins
+    winners = array('b', [0]) * len(skills1)
+    margins = array('q', [0]) * len(skills1)
+    for i in range(len(skills1)):
+        skill1, skill2 = _regular_skills(skills1[i], skills2[i])
+        for j in range(max_rounds):
+            roll1, roll2 = roll_sum(3, 6, rng), roll_sum(3, 6, rng)
+            success1 = _is_success(skill1, roll1)
+            if success1 != _is_success(skill2, roll2):
+                winners[i] = 1 if success1 else -1
+                margins[i] = (skill1 - roll1) - (skill2 - roll2)
+                break
+    return winners, margins
+
+
+@functools.lru_cache(maxsize=CONTEST_CACHE_SIZE)
+def quick_contest_probabilities(skill1, skill2):
+    """
+    Return exact probabilities (the first wins, tie, the second wins) of quick contest
+    """
+    _skill_index(skill1), _skill_index(skill2)
+    ways = get_distribution(3, 6).ways
+    chances = {1: 0, 0: 0, -1: 0}
+    for roll1 in _ROLLS:
+        for roll2 in _ROLLS:
+            chances[_contest_winner(skill1, roll1, skill2, roll2)] += ways[roll1 - MIN_ROLL] * ways[roll2 - MIN_ROLL]
+    total = get_distribution(3, 6).total ** 2
+    return chances[1] / total, chances[0] / total, chances[-1] / total
+
+
+@functools.lru_cache(maxsize=CONTEST_CACHE_SIZE)
+def regular_contest_probabilities(skill1, skill2):
+    """
+    Return exact probabilities (the first wins, tie, the second wins) of regular contest
+    without limit of rounds, so tie is 0.0
+    """
+    _skill_index(skill1), _skill_index(skill2)
+    skill1, skill2 = _regular_skills(skill1, skill2)
+    ways = get_distribution(3, 6).ways
+    total = get_distribution(3, 6).total
+    successes1 = sum(ways[roll - MIN_ROLL] for roll in _ROLLS if _is_success(skill1, roll))
+    successes2 = sum(ways[roll - MIN_ROLL] for roll in _ROLLS if _is_success(skill2, roll))
+    first = successes1 * (total - successes2)
+    second = successes2 * (total - successes1)
+    return first / (first + second), 0.0, second / (first + second)
+
+
+def win_probability(skill1, skill2, regular=False):
+    """
+    Return exact probability that skill1 wins quick or regular contest against skill2
+    """
+    if regular:
+        return regular_contest_probabilities(skill1, skill2)[0]
+    return quick_contest_probabilities(skill1, skill2)[0]
+
+
+class SuccessRoll(object):
+    """
+    It makes it possible to make GURPS success rolls against effective skill.
+    3d6 <= skill is success, criticals depend on skill.
+    SuccessRoll(12).roll() -> SuccessRollResult(skill=12, roll=9, outcome=SUCCESS, margin=3)
+    """
+
+    def __init__(self, skill):
+        self._offset = _skill_index(skill) * _ROW
+        self.skill = skill
+
+    def __call__(self):
+        return self.roll()
+
+    def __repr__(self):
+        return "SuccessRoll({:d})".format(self.skill)
+
+    def roll(self, rng=None):
+        """
+        Make success roll and return SuccessRollResult
+        """
+        roll = random.choice(_THREE_D6) if rng is None else int(rng.choice(_THREE_D6))
+        return SuccessRollResult(self.skill, roll, _OUTCOMES[self._offset + roll], self.skill - roll)
+
+    def roll_many(self, n, rng=None):
+        """
+        Make n success rolls.
+        Return arrays of rolls, outcomes and margins of success
+        """
+        rolls = roll_many(3, 6, n, rng=rng)
+        outcomes, margins = _resolve_many(self.skill, rolls)
+        return rolls, outcomes, margins
+
+    def probability(self, roll_outcome):
+        """
+        Return the probability of outcome
+        """
+        return _PROBABILITIES[self._offset // _ROW][roll_outcome]
+
+    def success_probability(self):
+        """
+        Return the probability of success (critical or not)
+        """
+        return success_probability(self.skill)
@@ -0,0 +1,246 @@
+"""
+Precomputed distribution tables in one memory-mapped file.
+Worker processes which load the same file share one page cache copy
+of the tables and do not convolve or parse them: get_distribution() takes
+distributions of the loaded table and decodes values only when they are read.
+python gurps_dice_table.py dice.table --count 1-100 --face 6 --face 20
+gurps_dice_table.load("dice.table")
+Dice("50d6").distribution() -> DiceDistribution(50..300) from the table
+
+File is little-endian:
+header    4s magic, H version, 2x, I number of entries
+index     (I count, I face, I width, I length, Q offset) by entry, sorted by (count, face)
+data      by entry: length cumulative numbers of outcomes of the sum count..count * face,
+          unsigned ints of width bytes, width is a multiple of 8, offset is aligned to 8
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+import threading
+from collections.abc import Sequence
+
+import gurps_dice
+from gurps_dice import DiceDistribution, DiceError, _add_die, _accumulate
+
+MAGIC = b'GDTB'
+VERSION = 1
+_HEADER = struct.Struct('<4sH2xI')
+_ENTRY = struct.Struct('<IIIIQ')
+_ALIGN = 8
+# Values of 8 bytes are read by memoryview of native unsigned long long
+_NATIVE = sys.byteorder == 'little'
+
+_load_lock = threading.Lock()
+
+
+class DistributionTableError(DiceError):
+    pass
+
+
+class _MappedValues(Sequence):
+    """
+    Read-only sequence of unsigned ints of width bytes in buffer,
+    values are decoded when they are read, slices are tuples
+    """
+    __slots__ = ('_values', '_width', '_length')
+
+    def __init__(self, buffer, width, length):
+        self._width = width
+        self._length = length
+        self._values = buffer.cast('Q') if width == 8 and _NATIVE else buffer
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(*index.indices(self._length)))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("index out of range")
+        if self._width == 8 and _NATIVE:
+            return self._values[index]
+        start = index * self._width
+        return int.from_bytes(self._values[start:start + self._width], 'little')
+
+    def __reduce__(self):
+        return tuple, (tuple(self),)
+
+
+def _width(total):
+    return max(1, -(-total.bit_length() // 64)) * 8
+
+
+def write_table(path, counts, faces):
+    """
+    Write distributions of <count>d<face> for all counts and faces to file path
+    """
+    counts = sorted(set(counts))
+    faces = sorted(set(faces))
+    if not counts or not faces or counts[0] < 1 or faces[0] < 1:
+        raise DistributionTableError("counts and faces of distribution table should be positive")
+    tables = {}
+    for face in faces:
+        ways = [1]
+        done = 0
+        for count in counts:
+            for i in range(count - done):
+                ways = _add_die(ways, face)
+            done = count
+            tables[(count, face)] = _accumulate(ways)
+    index = []
+    offset = _HEADER.size + _ENTRY.size * len(tables)
+    for (count, face), cumulative in sorted(tables.items()):
+        offset += -offset % _ALIGN
+        width = _width(cumulative[-1])
+        index.append((count, face, width, len(cumulative), offset))
+        offset += width * len(cumulative)
+    temporary = "{}.{:d}.tmp".format(path, os.getpid())
+    with open(temporary, 'wb') as table_file:
+        table_file.write(_HEADER.pack(MAGIC, VERSION, len(index)))
+        for entry in index:
+            table_file.write(_ENTRY.pack(*entry))
+        for count, face, width, length, offset in index:
+            table_file.write(b'\0' * (offset - table_file.tell()))
+            table_file.write(b''.join(value.to_bytes(width, 'little') for value in tables[(count, face)]))
+    os.replace(temporary, path)
+    return len(index)
+
+
+class DistributionTable(object):
+    """
+    Memory-mapped file of write_table().
+    DistributionTable("dice.table").get(3, 6) -> DiceDistribution(3..18) or None if it's not there
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as table_file:
+            try:
+                self._mmap = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise DistributionTableError("distribution table '{}' is empty".format(path))
+        self._buffer = memoryview(self._mmap)
+        try:
+            self._entries = self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_index(self):
+        if len(self._buffer) < _HEADER.size:
+            raise DistributionTableError("'{}' is not distribution table".format(self.path))
+        magic, version, number = _HEADER.unpack_from(self._buffer)
+        if magic != MAGIC:
+            raise DistributionTableError("'{}' is not distribution table".format(self.path))
+        if version != VERSION:
+            raise DistributionTableError("distribution table version {:d} is not supported".format(version))
+        if _HEADER.size + _ENTRY.size * number > len(self._buffer):
+            raise DistributionTableError("distribution table '{}' is truncated".format(self.path))
+        entries = {}
+        for count, face, width, length, offset in _ENTRY.iter_unpack(self._buffer[_HEADER.size:_HEADER.size + _ENTRY.size * number]):
+            if not width or width % 8 or offset % _ALIGN or offset + width * length > len(self._buffer) or length != count * (face - 1) + 1:
+                raise DistributionTableError("distribution table '{}' is corrupted".format(self.path))
+            entries[(count, face)] = (width, length, offset)
+        return entries
+
+    def __repr__(self):
+        return "DistributionTable({!r}, {:d} distributions)".format(self.path, len(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def keys(self):
+        return self._entries.keys()
+
+    def get(self, count, face):
+        """
+        Return DiceDistribution of <count>d<face> or None if it's not in the table
+        """
+        entry = self._entries.get((count, face))
+        if entry is None:
+            return None
+        width, length, offset = entry
+        values = _MappedValues(self._buffer[offset:offset + width * length], width, length)
+        return DiceDistribution(minimum=count, cumulative=values)
+
+    def close(self):
+        """
+        Forget the table and unmap the file.
+        If distributions of the table are still used, it's unmapped when they are gone
+        """
+        self._entries = {}
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+def load(path):
+    """
+    Map distribution table, get_distribution() takes distributions from it.
+    Table which was loaded before is not closed
+    """
+    table = DistributionTable(path)
+    with _load_lock:
+        gurps_dice._distribution_table = table
+        gurps_dice.clear_distribution_cache()
+    return table
+
+
+def unload():
+    """
+    Stop using distribution table, get_distribution() convolves again.
+    Return the table which was loaded or None
+    """
+    with _load_lock:
+        table = gurps_dice._distribution_table
+        gurps_dice._distribution_table = None
+        gurps_dice.clear_distribution_cache()
+    return table
+
+
+def get_table():
+    return gurps_dice._distribution_table
+
+
+def _parse_range(range_str):
+    """
+    Return list of ints from "5", "1-100" or "4,6,8"
+    """
+    values = []
+    for part in range_str.split(','):
+        low, sep, high = part.partition('-')
+        try:
+            values.extend(range(int(low), int(high) + 1) if sep else [int(low)])
+        except ValueError:
+            raise argparse.ArgumentTypeError("'{}' is not number or range like 1-100".format(part))
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate distribution table file")
+    parser.add_argument('path', help="output file")
+    parser.add_argument('--count', type=_parse_range, action='append', required=True, help="counts like 1-100 or 3,5")
+    parser.add_argument('--face', type=_parse_range, action='append', required=True, help="faces like 6 or 4,6,8")
+    args = parser.parse_args(argv)
+    number = write_table(args.path, [count for counts in args.count for count in counts],
+                         [face for faces in args.face for face in faces])
+    print("{} distributions are written to {}".format(number, args.path))
+
+
+if __name__ == '__main__':
+    main()
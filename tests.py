@@ -1,9 +1,65 @@
 import random
+import itertools
+import gurps_dice
 from gurps_dice import Dice, GurpsDice, EmptyDiceError, DiceFaceError, DiceCountError, DiceBonusError
+from gurps_dice import DiceModifiers, DiceModifierError
+import gurps_dice_handful
 from gurps_dice_handful import HandfulDice
+from gurps_dice_frozen import FrozenDice, FrozenGurpsDice
+import pickle
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import gurps_dice_random
+from gurps_dice_random import RandomStream
+from gurps_dice_simulation import Combatant, CombatSimulation
+import gurps_dice_bulk
+from gurps_dice_expression import compile_expression, DiceExpressionError
+import os
+import tempfile
+import asyncio
+from gurps_dice_service import DiceServer, DiceClient, RollBatcher, DiceServiceError
+import gurps_dice_instrumentation
+import gurps_dice_damage
+from gurps_dice_damage import DamageTableError
+import gurps_dice_success
+import gurps_dice_approximate
+import gurps_dice_table
+from gurps_dice_table import DistributionTableError
+import io
+import sys
+import subprocess
+import contextlib
+import gurps_dice_cli
+import gurps_dice_codec
+import gurps_dice_journal
+from array import array
+from gurps_dice_success import SuccessRoll, SuccessRollError, CRITICAL_SUCCESS, SUCCESS, FAILURE, CRITICAL_FAILURE
 
 run_test_dice = True
 run_test_gurps_dice = True
+run_test_distribution = True
+run_test_roll_many = True
+run_test_success_roll = True
+run_test_parse_cache = True
+run_test_frozen_dice = True
+run_test_handful_dice = True
+run_test_random_stream = True
+run_test_simulation = True
+run_test_rounding = True
+run_test_bulk = True
+run_test_expression = True
+run_test_service = True
+run_test_instrumentation = True
+run_test_damage = True
+run_test_roll_engine = True
+run_test_alias = True
+run_test_approximate = True
+run_test_table = True
+run_test_cli = True
+run_test_contest = True
+run_test_modifiers = True
+run_test_codec = True
+run_test_journal = True
 
 
 def random_int(start, end, excluding=()):
@@ -357,7 +413,1488 @@ def test_gurps_dice():
     print("GurpsDice test finished")
     print("---"*20)
 
+
+def test_distribution():
+    print("---"*20)
+    print("Distribution test start")
+    print("---"*20)
+
+    for count in range(5):
+        for face in range(7):
+            dice_str = get_dice_str(count, face)
+            distribution = Dice(dice_str).distribution()
+            ways = {}
+            for outcome in itertools.product(range(1, face + 1), repeat=count if face else 0):
+                ways[sum(outcome)] = ways.get(sum(outcome), 0) + 1
+            ways = ways or {0: 1}
+            total = sum(ways.values())
+            for value in range(-1, count * face + 2):
+                pmf = ways.get(value, 0) / total
+                assert abs(distribution.pmf(value) - pmf) < 1e-12, 'Dice("{dice_str}").distribution().pmf({value}) != {pmf}, Dice("{dice_str}").distribution().pmf({value}) == {result}'.format(dice_str=dice_str, value=value, pmf=pmf, result=distribution.pmf(value))
+                cdf = sum(w for v, w in ways.items() if v <= value) / total
+                assert abs(distribution.cdf(value) - cdf) < 1e-12, 'Dice("{dice_str}").distribution().cdf({value}) != {cdf}, Dice("{dice_str}").distribution().cdf({value}) == {result}'.format(dice_str=dice_str, value=value, cdf=cdf, result=distribution.cdf(value))
+    print('Dice("<count>d<face>").distribution() with count in range 0-4 and face in range 0-6 match enumeration, OK')
+
+    for count in range(1, 101):
+        for face in (2, 6, 20):
+            dice = Dice(count, face)
+            distribution = dice.distribution()
+            assert (distribution.minimum, distribution.maximum) == (dice.min(), dice.max()), 'Dice({count}, {face}).distribution() range != ({minimum}, {maximum})'.format(count=count, face=face, minimum=dice.min(), maximum=dice.max())
+            assert distribution.total == face ** count, 'Dice({count}, {face}).distribution().total != {total}'.format(count=count, face=face, total=face ** count)
+            mean = count * (face + 1) / 2
+            assert abs(distribution.mean() - mean) < 1e-9, 'Dice({count}, {face}).distribution().mean() != {mean}'.format(count=count, face=face, mean=mean)
+    print('Dice(count, face).distribution() with count in range 1-100 has valid range, total and mean, OK')
+
+    for count in range(1, 11):
+        for bonus in range(-20, 21):
+            dice = GurpsDice(count, bonus)
+            distribution = dice.distribution()
+            base_distribution = Dice(count, 6).distribution()
+            assert distribution.cumulative is base_distribution.cumulative, 'GurpsDice({count}, {bonus}).distribution() should share table with Dice({count}, 6)'.format(count=count, bonus=bonus)
+            assert (distribution.minimum, distribution.maximum) == (dice.min(), dice.max()), 'GurpsDice({count}, {bonus}).distribution() range != ({minimum}, {maximum})'.format(count=count, bonus=bonus, minimum=dice.min(), maximum=dice.max())
+            for value in range(dice.min() - 1, dice.max() + 2):
+                assert distribution.pmf(value) == base_distribution.pmf(value - bonus), 'GurpsDice({count}, {bonus}).distribution().pmf({value}) != Dice({count}, 6).distribution().pmf({base_value})'.format(count=count, bonus=bonus, value=value, base_value=value - bonus)
+    print('GurpsDice(count, bonus).distribution() with count in range 1-10 and bonus in range -20-20 is shifted Dice distribution, OK')
+
+    distribution = GurpsDice("3d6").distribution()
+    assert distribution.probability_at_most(10) == 0.5, 'GurpsDice("3d6").distribution().probability_at_most(10) != 0.5'
+    assert distribution.probability_at_least(18) == 1 / 216, 'GurpsDice("3d6").distribution().probability_at_least(18) != 1/216'
+    print('GurpsDice("3d6").distribution() odds are valid, OK')
+
+    gurps_dice.clear_distribution_cache()
+    Dice(400, 6).distribution()
+    cache_info = gurps_dice.get_distribution.cache_info()
+    assert cache_info.currsize == 1 and cache_info.maxsize == gurps_dice.DISTRIBUTION_CACHE_SIZE, 'Dice(400, 6).distribution() should keep only one bounded cache entry, cache_info == {}'.format(cache_info)
+    print('Dice(400, 6).distribution() keeps only one bounded cache entry, OK')
+
+    print("---"*20)
+    print("Distribution test finished")
+    print("---"*20)
+
+
+def test_roll_many():
+    print("---"*20)
+    print("Roll many test start")
+    print("---"*20)
+
+    for count in range(0, 11):
+        for face in (0, 1, 2, 6, 20):
+            dice_str = get_dice_str(count, face)
+            dice = Dice(dice_str)
+            rolls = dice.roll_many(1000)
+            assert len(rolls) == 1000, 'len(Dice("{dice_str}").roll_many(1000)) != 1000, len(Dice("{dice_str}").roll_many(1000)) == {length}'.format(dice_str=dice_str, length=len(rolls))
+            assert dice.min() <= min(rolls) and max(rolls) <= dice.max(), 'Dice("{dice_str}").roll_many(1000) out of range({minimum}, {maximum})'.format(dice_str=dice_str, minimum=dice.min(), maximum=dice.max())
+    print('Dice("<count>d<face>").roll_many(1000) with count in range 0-10 is valid, OK')
+
+    for count in range(0, 6):
+        for bonus in range(-10, 11):
+            dice = GurpsDice(count, bonus)
+            rolls = dice.roll_many(500)
+            assert dice.min() <= min(rolls) and max(rolls) <= dice.max(), '{dice!r}.roll_many(500) out of range({minimum}, {maximum})'.format(dice=dice, minimum=dice.min(), maximum=dice.max())
+    print('GurpsDice(count, bonus).roll_many(500) with count in range 0-5 and bonus in range -10-10 is valid, OK')
+
+    rolls = GurpsDice("3d6+2").roll_many(100000)
+    mean = sum(rolls) / len(rolls)
+    assert abs(mean - 12.5) < 0.1, 'GurpsDice("3d6+2").roll_many(100000) mean != 12.5, mean == %s' % mean
+    assert set(rolls) == set(range(5, 21)), 'GurpsDice("3d6+2").roll_many(100000) should hit every value in range(5, 20)'
+    print('GurpsDice("3d6+2").roll_many(100000) mean is 12.5, OK')
+
+    handful = HandfulDice(Dice("2d6"), Dice("1d8"), GurpsDice("1d6+1"), bonus=3)
+    rolls = handful.roll_many(1000)
+    assert len(rolls) == 1000 and 8 <= min(rolls) and max(rolls) <= 34, 'HandfulDice(2d6, 1d8, 1d6+1, bonus=3).roll_many(1000) out of range(8, 34)'
+    print('HandfulDice(...).roll_many(1000) is valid, OK')
+
+    assert len(Dice("3d6").roll_many(0)) == 0, 'Dice("3d6").roll_many(0) should be empty'
+    try:
+        Dice("3d6").roll_many(-1)
+    except ValueError:
+        print('Dice("3d6").roll_many(-1) raise ValueError, OK')
+    else:
+        assert False, 'Dice("3d6").roll_many(-1) should raise ValueError'
+
+    print("---"*20)
+    print("Roll many test finished")
+    print("---"*20)
+
+
+def test_success_roll():
+    print("---"*20)
+    print("SuccessRoll test start")
+    print("---"*20)
+
+    for skill in range(-20, 31):
+        for roll in range(3, 19):
+            if roll in (3, 4) or (roll == 5 and skill >= 15) or (roll == 6 and skill >= 16):
+                expected = CRITICAL_SUCCESS
+            elif roll == 18 or (roll == 17 and skill <= 15) or roll - skill >= 10:
+                expected = CRITICAL_FAILURE
+            elif roll <= skill and roll != 17:
+                expected = SUCCESS
+            else:
+                expected = FAILURE
+            result = gurps_dice_success.resolve(skill, roll)
+            assert result.outcome == expected, 'resolve({skill}, {roll}).outcome != {expected}, resolve({skill}, {roll}).outcome == {outcome}'.format(skill=skill, roll=roll, expected=expected, outcome=result.outcome)
+            assert result.margin == skill - roll, 'resolve({skill}, {roll}).margin != {margin}'.format(skill=skill, roll=roll, margin=skill - roll)
+    print('resolve(skill, roll) with skill in range -20-30 and roll in range 3-18 is valid, OK')
+
+    for skill in range(-20, 31):
+        probabilities = gurps_dice_success.outcome_probabilities(skill)
+        assert abs(sum(probabilities.values()) - 1) < 1e-12, 'outcome_probabilities({skill}) sum != 1'.format(skill=skill)
+    assert gurps_dice_success.success_probability(10) == 0.5, 'success_probability(10) != 0.5'
+    assert abs(gurps_dice_success.success_probability(30) - 212 / 216) < 1e-12, 'success_probability(30) != 212/216'
+    assert abs(gurps_dice_success.success_probability(-10) - 4 / 216) < 1e-12, 'success_probability(-10) != 4/216'
+    assert abs(SuccessRoll(16).probability(CRITICAL_SUCCESS) - 20 / 216) < 1e-12, 'SuccessRoll(16).probability(CRITICAL_SUCCESS) != 20/216'
+    print('outcome_probabilities(skill) with skill in range -20-30 is valid, OK')
+
+    for skill in range(-5, 21):
+        success_roll = SuccessRoll(skill)
+        for i in range(100):
+            result = success_roll.roll()
+            assert result == gurps_dice_success.resolve(skill, result.roll), 'SuccessRoll({skill}).roll() != resolve({skill}, {roll})'.format(skill=skill, roll=result.roll)
+        rolls, outcomes, margins = success_roll.roll_many(1000)
+        for roll, roll_outcome, margin in zip(rolls, outcomes, margins):
+            assert (roll_outcome, margin) == gurps_dice_success.resolve(skill, int(roll))[2:], 'SuccessRoll({skill}).roll_many() != resolve({skill}, {roll})'.format(skill=skill, roll=roll)
+    print('SuccessRoll(skill).roll() and roll_many(1000) with skill in range -5-20 is valid, OK')
+
+    for function, args in ((gurps_dice_success.resolve, (10, 0)), (gurps_dice_success.resolve, (10, 2)),
+                           (gurps_dice_success.outcome, (10, 19)), (gurps_dice_success.outcome, (16, 19)),
+                           (gurps_dice_success.outcome, (10, -1)), (gurps_dice_success.resolve_many, (10, [3, 10, 19])),
+                           (gurps_dice_success.resolve_many, (10, [2, 10, 18]))):
+        try:
+            result = function(*args)
+        except SuccessRollError:
+            pass
+        else:
+            assert False, '{function}{args} should raise SuccessRollError, {function}{args} == {result}'.format(function=function.__name__, args=args, result=result)
+    outcomes, margins = gurps_dice_success.resolve_many(10, [])
+    assert len(outcomes) == len(margins) == 0, 'resolve_many(10, []) should return empty arrays'
+    print('resolve(), outcome() and resolve_many() with roll out of range 3-18 raise SuccessRollError, OK')
+
+    print("---"*20)
+    print("SuccessRoll test finished")
+    print("---"*20)
+
+
+def test_parse_cache():
+    print("---"*20)
+    print("Parse cache test start")
+    print("---"*20)
+
+    gurps_dice.clear_parse_cache()
+    GurpsDice("3d6+2")
+    info = gurps_dice.parse_cache_info()['gurps_dice']
+    assert (info['hits'], info['misses']) == (0, 1), 'GurpsDice("3d6+2") should parse str once, parse_cache_info() == %s' % info
+    for i in range(100):
+        dice = GurpsDice("3d6+2")
+    info = gurps_dice.parse_cache_info()['gurps_dice']
+    assert (info['hits'], info['misses']) == (100, 1), 'GurpsDice("3d6+2") should be taken from cache, parse_cache_info() == %s' % info
+    assert dice.__str__() == "3d6+2", 'GurpsDice("3d6+2") from cache != "3d6+2", GurpsDice("3d6+2") == %s' % dice
+    print('GurpsDice("3d6+2") is parsed once and then taken from cache, OK')
+
+    Dice("2d10")
+    Dice("2d10")
+    info = gurps_dice.parse_cache_info()['dice']
+    assert (info['hits'], info['misses']) == (1, 1), 'Dice("2d10") should be taken from cache, parse_cache_info() == %s' % info
+    for i in range(5):
+        dice = Dice("4d6kh3")
+    info = gurps_dice.parse_cache_info()['dice']
+    assert (info['hits'], info['misses']) == (5, 2), 'Dice("4d6kh3") should be parsed by the same cache, parse_cache_info() == %s' % info
+    print('Dice("2d10") is parsed once and then taken from cache, OK')
+
+    assert Dice.search_dice_in_str("2d10") == {'count': 2, 'face': 10}, 'Dice.search_dice_in_str("2d10") != {"count": 2, "face": 10}'
+    assert GurpsDice.search_dice_in_str("2d6-1") == {'count': 2, 'face': 6, 'bonus': -1}, 'GurpsDice.search_dice_in_str("2d6-1") != {"count": 2, "face": 6, "bonus": -1}'
+    print('search_dice_in_str(dice_str) returns dict, OK')
+
+    for dice_str in ("1d6,3", "1d6+", "d6", "1d8+1", ""):
+        for i in range(2):
+            try:
+                dice = GurpsDice(dice_str)
+            except EmptyDiceError:
+                pass
+            else:
+                assert False, 'GurpsDice("{dice_str}") should raise EmptyDiceError, GurpsDice("{dice_str}") == {dice}'.format(dice_str=dice_str, dice=dice)
+    print('GurpsDice(<incorrect str>) raise EmptyDiceError every time, OK')
+
+    print("---"*20)
+    print("Parse cache test finished")
+    print("---"*20)
+
+
+def test_frozen_dice():
+    print("---"*20)
+    print("FrozenDice test start")
+    print("---"*20)
+
+    for count in range(21):
+        for face in range(21):
+            dice_str = get_dice_str(count, face)
+            dice = FrozenDice(dice_str)
+            assert dice is FrozenDice(count, face), 'FrozenDice("{dice_str}") is not FrozenDice({count}, {face})'.format(dice_str=dice_str, count=count, face=face)
+            assert dice.__str__() == dice_str, 'FrozenDice("{dice_str}") != "{dice_str}", FrozenDice("{dice_str}") == {dice}'.format(dice_str=dice_str, dice=dice)
+            assert (dice.min(), dice.max()) == (Dice(dice_str).min(), Dice(dice_str).max()), 'FrozenDice("{dice_str}") range != Dice("{dice_str}") range'.format(dice_str=dice_str)
+            assert dice.thaw().__str__() == dice_str and FrozenDice.from_dice(Dice(dice_str)) is dice, 'FrozenDice("{dice_str}") should be converted to Dice and back'.format(dice_str=dice_str)
+    print('FrozenDice("<count>d<face>") with count and face parameters in range 0-20 is valid and interned, OK')
+
+    for count1 in range(11):
+        for count2 in range(11):
+            dice = FrozenDice(count1, 6) + FrozenDice(count2, 6)
+            assert dice is FrozenDice(count1 + count2, 6), 'FrozenDice({count1}, 6) + FrozenDice({count2}, 6) is not FrozenDice({count}, 6)'.format(count1=count1, count2=count2, count=count1 + count2)
+            try:
+                dice = FrozenDice(count1, 6) - FrozenDice(count2, 6)
+            except DiceCountError:
+                assert count2 > count1, 'FrozenDice({count1}, 6) - FrozenDice({count2}, 6) should not raise DiceCountError'.format(count1=count1, count2=count2)
+            else:
+                assert dice is FrozenDice(count1 - count2, 6), 'FrozenDice({count1}, 6) - FrozenDice({count2}, 6) is not FrozenDice({count}, 6)'.format(count1=count1, count2=count2, count=count1 - count2)
+    print('FrozenDice(count1, 6) ± FrozenDice(count2, 6) with counts in range 0-10 is valid, OK')
+
+    for dice, other, error in ((FrozenDice(1, 6), FrozenDice(1, 8), DiceFaceError), (FrozenDice(1, 6), 1, TypeError), (FrozenDice(1, 6), Dice(1, 6), TypeError)):
+        try:
+            result = dice + other
+        except error:
+            pass
+        else:
+            assert False, '{dice!r} + {other!r} should raise {error}, {dice!r} + {other!r} == {result!r}'.format(dice=dice, other=other, error=error.__name__, result=result)
+    print('FrozenDice + <incompatible> raise errors like Dice, OK')
+
+    for count in range(11):
+        for bonus in range(-20, 21):
+            dice_str = get_dice_str(count, 6, bonus)
+            dice = FrozenGurpsDice(dice_str)
+            assert dice is FrozenGurpsDice(count, bonus), 'FrozenGurpsDice("{dice_str}") is not FrozenGurpsDice({count}, {bonus})'.format(dice_str=dice_str, count=count, bonus=bonus)
+            assert dice.__str__() == dice_str, 'FrozenGurpsDice("{dice_str}") != "{dice_str}", FrozenGurpsDice("{dice_str}") == {dice}'.format(dice_str=dice_str, dice=dice)
+            assert dice + 1 is FrozenGurpsDice(count, bonus + 1) and dice - 1 is FrozenGurpsDice(count, bonus - 1), 'FrozenGurpsDice("{dice_str}") ± 1 is not valid'.format(dice_str=dice_str)
+            rounded = GurpsDice(dice_str)
+            rounded.round()
+            assert dice.rounded().__str__() == rounded.__str__(), 'FrozenGurpsDice("{dice_str}").rounded() != "{rounded}"'.format(dice_str=dice_str, rounded=rounded)
+            rolls = dice.roll_many(100)
+            assert dice.min() <= min(rolls) and max(rolls) <= dice.max(), 'FrozenGurpsDice("{dice_str}").roll_many(100) out of range'.format(dice_str=dice_str)
+    print('FrozenGurpsDice("<count>d6±<bonus>") with count in range 0-10 and bonus in range -20-20 is valid, OK')
+
+    dice = FrozenGurpsDice("3d6+2")
+    for attribute, value in (('count', 1), ('bonus', 1), ('other', 1)):
+        try:
+            setattr(dice, attribute, value)
+        except AttributeError:
+            pass
+        else:
+            assert False, 'FrozenGurpsDice("3d6+2").{attribute} = {value} should raise AttributeError'.format(attribute=attribute, value=value)
+    assert not hasattr(dice, '__dict__'), 'FrozenGurpsDice("3d6+2") should not have __dict__'
+    assert dice.with_bonus(0) is FrozenGurpsDice("3d6") and dice.with_count(1) is FrozenGurpsDice("1d6+2"), 'FrozenGurpsDice("3d6+2").with_*() is not valid'
+    assert pickle.loads(pickle.dumps(dice)) is dice, 'pickle.loads(pickle.dumps(FrozenGurpsDice("3d6+2"))) is not FrozenGurpsDice("3d6+2")'
+    assert {dice: 1}[FrozenGurpsDice(3, 2)] == 1 and dice != FrozenDice(3, 6), 'FrozenGurpsDice("3d6+2") should be usable as dict key'
+    print('FrozenGurpsDice("3d6+2") is immutable, hashable and picklable, OK')
+
+    print("---"*20)
+    print("FrozenDice test finished")
+    print("---"*20)
+
+
+def test_handful_dice():
+    print("---"*20)
+    print("HandfulDice test start")
+    print("---"*20)
+
+    handful = HandfulDice(*(Dice("1d6") for i in range(40)), bonus=2)
+    assert (handful.faces, handful.bonus) == ({6: 40}, 2), 'HandfulDice(40 x 1d6, bonus=2) should be grouped to 40d6+2, HandfulDice(40 x 1d6, bonus=2) == %s' % handful
+    assert (handful.min(), handful.max()) == (42, 242), 'HandfulDice(40 x 1d6, bonus=2) range != (42, 242)'
+    print('HandfulDice(40 x Dice("1d6"), bonus=2) is grouped to 40d6+2, OK')
+
+    for bonus in range(-5, 6):
+        handful = HandfulDice(Dice("2d6"), Dice("1d8"), GurpsDice("1d6-1"), FrozenDice("1d8"), Dice("3d0"), bonus=bonus)
+        minimum, maximum = 4 + bonus, 33 + bonus
+        assert (handful.min(), handful.max()) == (minimum, maximum), 'HandfulDice(2d6, 1d8, 1d6-1, 1d8, 3d0, bonus={bonus}) range != ({minimum}, {maximum})'.format(bonus=bonus, minimum=minimum, maximum=maximum)
+        for i in range(100):
+            roll = handful.roll()
+            assert minimum <= roll <= maximum, 'HandfulDice(2d6, 1d8, 1d6-1, 1d8, 3d0, bonus={bonus}).roll() out of range({minimum}, {maximum}), roll == {roll}'.format(bonus=bonus, minimum=minimum, maximum=maximum, roll=roll)
+        rolls = handful.roll_many(1000)
+        assert len(rolls) == 1000 and minimum <= min(rolls) and max(rolls) <= maximum, 'HandfulDice(2d6, 1d8, 1d6-1, 1d8, 3d0, bonus={bonus}).roll_many(1000) out of range({minimum}, {maximum})'.format(bonus=bonus, minimum=minimum, maximum=maximum)
+    print('HandfulDice(2d6, 1d8, 1d6-1, 1d8, 3d0, bonus=<bonus>) roll(), roll_many(), min() and max() are valid, OK')
+
+    handful = HandfulDice(bonus=3)
+    assert handful.roll() == 3 and list(handful.roll_many(3)) == [3, 3, 3], 'HandfulDice(bonus=3) should roll 3'
+    print('HandfulDice(bonus=3).roll() == 3, OK')
+
+    handful = HandfulDice(Dice("2d6"), GurpsDice("1d6+1")) + 2
+    assert handful.__str__() == "3d6+3", 'HandfulDice(2d6, 1d6+1) + 2 != "3d6+3", HandfulDice(2d6, 1d6+1) + 2 == %s' % handful
+    handful.add_dice("1d4")
+    assert handful.max() == 25, 'HandfulDice(2d6, 1d6+1, 1d4, bonus=2).max() != 25, HandfulDice(2d6, 1d6+1, 1d4, bonus=2).max() == %s' % handful.max()
+    assert handful.__str__() == "1d4+3d6+3", 'HandfulDice(2d6, 1d6+1, 1d4, bonus=2) != "1d4+3d6+3", HandfulDice(2d6, 1d6+1, 1d4, bonus=2) == %s' % handful
+    print('HandfulDice(2d6, 1d6+1) + 2 is valid, OK')
+
+    handful = HandfulDice()
+    handful.extend(Dice(1, face) for face in (4, 6, 8) for i in range(1000))
+    handful += GurpsDice("2d6-1")
+    assert (handful.faces, handful.bonus) == ({4: 1000, 6: 1002, 8: 1000}, -1), 'HandfulDice accumulated in place != 1000d4+1002d6+1000d8-1, HandfulDice == %s' % handful
+    print('HandfulDice().extend(3000 x Dice) accumulated in place is valid, OK')
+
+    handful1 = HandfulDice(Dice("2d6"), Dice("1d8"), bonus=1)
+    handful2 = HandfulDice(Dice("1d8"), Dice("1d20"), bonus=-3)
+    handful = handful1 + handful2
+    assert handful == HandfulDice.from_counts({6: 2, 8: 2, 20: 1}, bonus=-2), 'HandfulDice(2d6+1d8+1) + HandfulDice(1d8+1d20-3) != HandfulDice(2d6+2d8+1d20-2), == %s' % handful
+    assert (handful1.__str__(), handful2.__str__()) == ("2d6+1d8+1", "1d8+1d20-3"), 'HandfulDice + HandfulDice should not change operands'
+    assert HandfulDice(Dice("1d8"), Dice("2d6")) == HandfulDice(Dice("1d6"), Dice("1d8"), Dice("1d6")), 'HandfulDice(1d8, 2d6) != HandfulDice(1d6, 1d8, 1d6)'
+    try:
+        hash(handful)
+    except TypeError:
+        pass
+    else:
+        assert False, 'hash(HandfulDice) should raise TypeError, HandfulDice is mutable'
+    alias = handful
+    handful += Dice("1d4")
+    assert handful is not alias and alias == HandfulDice.from_counts({6: 2, 8: 2, 20: 1}, bonus=-2), 'HandfulDice += Dice should return new HandfulDice and keep aliases'
+    assert [dice.__str__() for dice in HandfulDice(Dice("1d8"), Dice("2d6")).handful] == ["2d6", "1d8"], 'HandfulDice(1d8, 2d6).handful != (2d6, 1d8)'
+    print('HandfulDice + HandfulDice and equality work on canonical form, += keeps aliases, OK')
+
+    print("---"*20)
+    print("HandfulDice test finished")
+    print("---"*20)
+
+
+def roll_shard(stream):
+    return sum(GurpsDice("3d6+1").roll_many(1000, rng=stream)) + sum(HandfulDice(Dice("2d8"), Dice("1d4")).roll(stream) for i in range(100))
+
+
+def test_random_stream():
+    print("---"*20)
+    print("RandomStream test start")
+    print("---"*20)
+
+    for dice in (Dice("3d6"), GurpsDice("2d6-1"), FrozenGurpsDice("4d6+2"), HandfulDice(Dice("2d6"), Dice("1d20"), bonus=1)):
+        stream1, stream2 = RandomStream(7), RandomStream(7)
+        rolls1 = [dice.roll(stream1) for i in range(100)] + list(dice.roll_many(100, rng=stream1))
+        rolls2 = [dice.roll(stream2) for i in range(100)] + list(dice.roll_many(100, rng=stream2))
+        assert rolls1 == rolls2, '{dice!r}.roll(RandomStream(7)) should be reproducible'.format(dice=dice)
+        assert rolls1 != [dice.roll(stream1) for i in range(200)], '{dice!r}.roll(RandomStream(7)) should not repeat'.format(dice=dice)
+    print('Dice, GurpsDice, FrozenGurpsDice and HandfulDice roll() and roll_many() with RandomStream(seed) are reproducible, OK')
+
+    if gurps_dice._import_numpy() is not None:
+        rolls1 = GurpsDice("3d6").roll_many(100, rng=RandomStream(7).numpy_generator())
+        rolls2 = GurpsDice("3d6").roll_many(100, rng=RandomStream(7).numpy_generator())
+        assert list(rolls1) == list(rolls2), 'GurpsDice("3d6").roll_many(100, rng=<numpy generator>) should be reproducible'
+        assert isinstance(Dice("3d6").roll(RandomStream(7).numpy_generator()), int), 'Dice("3d6").roll(<numpy generator>) should return int'
+        stream = RandomStream(7)
+        rolls3 = GurpsDice("3d6").roll_many(100, rng=stream.numpy_generator())
+        rolls4 = GurpsDice("3d6").roll_many(100, rng=stream.numpy_generator())
+        assert list(rolls1) == list(rolls3) and list(rolls3) != list(rolls4), 'RandomStream(7).numpy_generator() should not repeat for the same stream'
+        assert [child.root_seed for child in stream.spawn(2)] == [child.root_seed for child in RandomStream(7).spawn(2)], 'RandomStream(7).numpy_generator() should not change spawn()'
+        print('GurpsDice("3d6").roll_many(100, rng=<numpy generator>) is reproducible, OK')
+
+    streams = gurps_dice_random.split(42, 8)
+    assert len(set(stream.root_seed for stream in streams)) == 8, 'split(42, 8) seeds should be different'
+    assert [stream.root_seed for stream in streams] == [stream.root_seed for stream in RandomStream(42).spawn(8)], 'split(42, 8) != RandomStream(42).spawn(8)'
+    stream = RandomStream(42)
+    assert [child.root_seed for child in stream.spawn(4) + stream.spawn(4)] == [child.root_seed for child in streams], 'RandomStream(42).spawn(4) twice != split(42, 8)'
+    assert pickle.loads(pickle.dumps(stream)).random() == stream.random(), 'pickled RandomStream should continue the same stream'
+    print('split(seed, n) and RandomStream(seed).spawn(n) are deterministic, OK')
+
+    single_process = sum(roll_shard(stream) for stream in gurps_dice_random.split(2024, 8))
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        multi_process = sum(executor.map(roll_shard, gurps_dice_random.split(2024, 8)))
+    assert single_process == multi_process, 'shards of seed 2024 should give the same result in 1 and 3 processes, {single_process} != {multi_process}'.format(single_process=single_process, multi_process=multi_process)
+    print('8 shards of seed 2024 give the same result in 1 and 3 processes, OK')
+
+    print("---"*20)
+    print("RandomStream test finished")
+    print("---"*20)
+
+
+def test_simulation():
+    print("---"*20)
+    print("CombatSimulation test start")
+    print("---"*20)
+
+    knight = Combatant("knight", skill=14, defense=10, damage="2d6+1", dr=3, hp=12)
+    orc = Combatant("orc", skill=11, defense=8, damage="1d6+2", dr=1, hp=11)
+    result1 = CombatSimulation(knight, orc, seed=5, shard_size=200, processes=1).run(trials=2000)
+    result2 = CombatSimulation(knight, orc, seed=5, shard_size=200, processes=2).run(trials=2000)
+    assert result1.trials == 2000 and result1.shards == 10, 'CombatSimulation(...).run(trials=2000) should run 10 shards of 200 trials'
+    assert (result1.wins, result1.rounds) == (result2.wins, result2.rounds), 'CombatSimulation(seed=5) should give the same result in 1 and 2 processes'
+    low, high = result1.win_rate_interval(0)
+    assert 0.5 < low <= result1.win_rate(0) <= high < 1, 'knight should mostly win, win rate interval == ({low}, {high})'.format(low=low, high=high)
+    low, high = result1.mean_rounds_interval()
+    assert 1 <= low <= result1.mean_rounds() <= high, 'mean rounds interval is not valid, ({low}, {high})'.format(low=low, high=high)
+    print('CombatSimulation(knight, orc, seed=5).run(trials=2000) is the same in 1 and 2 processes, OK')
+
+    result = CombatSimulation(knight, orc, seed=5, shard_size=200, processes=1).run(trials=2001)
+    assert result.trials == 2001 and result.shards == 11, 'CombatSimulation(...).run(trials=2001) should run 2001 trials, trials == {}'.format(result.trials)
+    assert sum(result.wins.values()) == sum(result.rounds.values()) == 2001, 'CombatSimulation(...).run(trials=2001) histograms should count 2001 trials'
+    print('CombatSimulation(knight, orc).run(trials=2001) cuts the last shard, OK')
+
+    result = CombatSimulation(knight, orc, seed=5, shard_size=100, processes=1).run(precision=0.03, wave=4)
+    assert result.precision() <= 0.03 and result.trials < 10000, 'CombatSimulation(...).run(precision=0.03) should stop early, trials == %s' % result.trials
+    print('CombatSimulation(knight, orc).run(precision=0.03) stops early after %s trials, OK' % result.trials)
+
+    giant = Combatant("giant", skill=18, defense=3, damage="6d6+10", dr=10, hp=40)
+    rat = Combatant("rat", skill=3, defense=3, damage="1d6-4", dr=0, hp=3)
+    result = CombatSimulation(giant, rat, seed=5, shard_size=10, processes=1).run(precision=0.01, wave=1)
+    low, high = result.win_rate_interval(0)
+    assert result.win_rate(0) == 1 and 0 < result.precision() <= 0.01 and result.trials >= 180, 'CombatSimulation(giant, rat).run(precision=0.01) should not stop at zero width interval, trials == {trials}, interval == ({low}, {high})'.format(trials=result.trials, low=low, high=high)
+    print('CombatSimulation(giant, rat).run(precision=0.01) with win rate 1 runs %s trials, OK' % result.trials)
+
+    print("---"*20)
+    print("CombatSimulation test finished")
+    print("---"*20)
+
+
+def round_by_steps(dice, round_seven=True):
+    while True:
+        count, bonus = dice.count, dice.bonus
+        dice.round_up_step(round_seven)
+        if (count, bonus) == (dice.count, dice.bonus):
+            break
+    while True:
+        count, bonus = dice.count, dice.bonus
+        dice.round_down_step(round_seven)
+        if (count, bonus) == (dice.count, dice.bonus):
+            break
+    return dice
+
+
+def test_rounding():
+    print("---"*20)
+    print("GurpsDice rounding test start")
+    print("---"*20)
+
+    for round_seven in (True, False):
+        for count in range(6):
+            for bonus in range(-60, 351):
+                dice_str = get_dice_str(count, 6, bonus)
+                expected = round_by_steps(GurpsDice(count, bonus), round_seven).__str__()
+                dice = GurpsDice(count, bonus)
+                dice.round(round_seven)
+                assert dice.__str__() == expected, 'GurpsDice("{dice_str}").round({round_seven}) != "{expected}", GurpsDice("{dice_str}").round({round_seven}) == {dice}'.format(dice_str=dice_str, round_seven=round_seven, expected=expected, dice=dice)
+                rounded = GurpsDice(count, bonus).rounded(round_seven)
+                assert rounded.__str__() == expected, 'GurpsDice("{dice_str}").rounded({round_seven}) != "{expected}", GurpsDice("{dice_str}").rounded({round_seven}) == {dice}'.format(dice_str=dice_str, round_seven=round_seven, expected=expected, dice=rounded)
+                assert FrozenGurpsDice(count, bonus).rounded(round_seven).__str__() == expected, 'FrozenGurpsDice("{dice_str}").rounded({round_seven}) != "{expected}"'.format(dice_str=dice_str, round_seven=round_seven, expected=expected)
+                up_max, up_steps = GurpsDice(count, bonus), GurpsDice(count, bonus)
+                up_max.round_up_max(round_seven)
+                while up_steps.bonus >= (3 if round_seven else 4):
+                    up_steps.round_up_step(round_seven)
+                assert up_max.__str__() == up_steps.__str__(), 'GurpsDice("{dice_str}").round_up_max({round_seven}) != "{expected}", GurpsDice("{dice_str}").round_up_max({round_seven}) == {dice}'.format(dice_str=dice_str, round_seven=round_seven, expected=up_steps, dice=up_max)
+                down_max, down_steps = GurpsDice(count, bonus), GurpsDice(count, bonus)
+                down_max.round_down_max(round_seven)
+                while down_steps.bonus <= -2 and down_steps.count > 1:
+                    down_steps.round_down_step(round_seven)
+                assert down_max.__str__() == down_steps.__str__(), 'GurpsDice("{dice_str}").round_down_max({round_seven}) != "{expected}", GurpsDice("{dice_str}").round_down_max({round_seven}) == {dice}'.format(dice_str=dice_str, round_seven=round_seven, expected=down_steps, dice=down_max)
+    print('GurpsDice("<count>d6±<bonus>").round(), rounded(), round_up_max() and round_down_max() with count in range 0-5 and bonus in range -60-350 match step by step rounding, OK')
+
+    dice = GurpsDice("1d6+300")
+    rounded = dice.rounded()
+    assert dice.__str__() == "1d6+300" and rounded is not dice, 'GurpsDice("1d6+300").rounded() should not change GurpsDice'
+    print('GurpsDice("1d6+300").rounded() == %s, OK' % rounded)
+
+    print("---"*20)
+    print("GurpsDice rounding test finished")
+    print("---"*20)
+
+
+def test_bulk():
+    print("---"*20)
+    print("Bulk parsing test start")
+    print("---"*20)
+
+    dice_strs = [get_dice_str(count, face, bonus) for count in range(5) for face in (0, 4, 6, 20) for bonus in (-2, 0, 3)] + ["", "d6", "1d6,3", "spear", "3d6+0"]
+    for dice_class in (Dice, GurpsDice):
+        columns = gurps_dice_bulk.parse_many(dice_strs, dice_class=dice_class)
+        assert len(columns) == len(dice_strs), 'parse_many() should return row for every str'
+        for dice_str, (count, face, bonus, error) in zip(dice_strs, columns.rows()):
+            try:
+                expected = dict({'bonus': 0}, **dice_class.search_dice_in_str(dice_str))
+            except EmptyDiceError:
+                assert error == 1 and (count, face, bonus) == (0, 0, 0), 'parse_many(["{dice_str}"], {dice_class}) should mark error'.format(dice_str=dice_str, dice_class=dice_class.__name__)
+            else:
+                assert error == 0 and (count, face, bonus) == (expected['count'], expected['face'], expected['bonus']), 'parse_many(["{dice_str}"], {dice_class}) != {expected}'.format(dice_str=dice_str, dice_class=dice_class.__name__, expected=expected)
+    print('parse_many(<dice strs>) match search_dice_in_str() of Dice and GurpsDice, OK')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.txt")
+        with open(path, 'w') as catalog:
+            catalog.write("2d6+1\n1d6-1\r\nspear\n3d6")
+        columns = gurps_dice_bulk.parse_file(path)
+    assert (list(columns.count), list(columns.bonus), list(columns.error)) == ([2, 1, 0, 3], [1, -1, 0, 0], [0, 0, 1, 0]), 'parse_file(<catalog>) is not valid, %r' % columns
+    print('parse_file(<catalog>) is valid, OK')
+
+    columns = gurps_dice_bulk.parse_many(["2d6+1", "1d6-1", "spear", "3d6", "2d6+1", "0d6+4"] * 100)
+    for i in range(10):
+        rolls = gurps_dice_bulk.roll_columns(columns)
+        for (count, face, bonus, error), roll in zip(columns.rows(), rolls):
+            dice = GurpsDice(count, bonus)
+            assert (roll == 0) if error else (dice.min() <= roll <= dice.max()), 'roll_columns() row {dice} out of range, roll == {roll}'.format(dice=dice, roll=roll)
+    rolls1 = gurps_dice_bulk.roll_columns(columns, rng=RandomStream(3))
+    rolls2 = gurps_dice_bulk.roll_columns(columns, rng=RandomStream(3))
+    assert list(rolls1) == list(rolls2), 'roll_columns(rng=RandomStream(3)) should be reproducible'
+    print('roll_columns(<columns>) is valid, OK')
+
+    distributions = gurps_dice_bulk.distribution_columns(columns)
+    means = gurps_dice_bulk.mean_columns(columns)
+    for (count, face, bonus, error), distribution, mean in zip(columns.rows(), distributions, means):
+        if error:
+            assert distribution is None and mean == 0, 'distribution_columns() and mean_columns() should skip incorrect rows'
+        else:
+            assert abs(distribution.mean() - mean) < 1e-9 and distribution.minimum == GurpsDice(count, bonus).min(), 'distribution_columns() row {count}d6{bonus:+d} is not valid'.format(count=count, bonus=bonus)
+    print('distribution_columns(<columns>) and mean_columns(<columns>) are valid, OK')
+
+    print("---"*20)
+    print("Bulk parsing test finished")
+    print("---"*20)
+
+
+def test_expression():
+    print("---"*20)
+    print("DiceExpression test start")
+    print("---"*20)
+
+    for expression_str, expected, minimum, maximum in (
+            ("2d6+1d8-3", "2d6+1d8-3", 0, 17),
+            (" 2d6 + 1d8 - 3 + 1d6 ", "3d6+1d8-3", 1, 23),
+            ("1d6+1d6+1d6+2-1", "3d6+1", 4, 19),
+            ("2d6-1d6", "2d6-1d6", -4, 11),
+            ("-1d4+5", "-1d4+5", 1, 4),
+            ("3", "3", 3, 3),
+            ("0d6+1d0+2", "2", 2, 2)):
+        expression = compile_expression(expression_str)
+        assert expression.__str__() == expected, 'compile_expression("{expression_str}") != "{expected}", compile_expression("{expression_str}") == {expression}'.format(expression_str=expression_str, expected=expected, expression=expression)
+        assert (expression.min(), expression.max()) == (minimum, maximum), 'compile_expression("{expression_str}") range != ({minimum}, {maximum})'.format(expression_str=expression_str, minimum=minimum, maximum=maximum)
+        distribution = expression.distribution()
+        assert (distribution.minimum, distribution.maximum) == (minimum, maximum), 'compile_expression("{expression_str}").distribution() range != ({minimum}, {maximum})'.format(expression_str=expression_str, minimum=minimum, maximum=maximum)
+        for i in range(100):
+            roll = expression.roll()
+            assert minimum <= roll <= maximum, 'compile_expression("{expression_str}").roll() out of range({minimum}, {maximum}), roll == {roll}'.format(expression_str=expression_str, minimum=minimum, maximum=maximum, roll=roll)
+        rolls = expression.roll_many(1000)
+        assert minimum <= min(rolls) and max(rolls) <= maximum, 'compile_expression("{expression_str}").roll_many(1000) out of range({minimum}, {maximum})'.format(expression_str=expression_str, minimum=minimum, maximum=maximum)
+        rolls = expression.roll_many(100, rng=RandomStream(1))
+        assert minimum <= min(rolls) and max(rolls) <= maximum, 'compile_expression("{expression_str}").roll_many(100, rng=RandomStream(1)) out of range({minimum}, {maximum})'.format(expression_str=expression_str, minimum=minimum, maximum=maximum)
+    print('compile_expression(<expression>) groups faces, folds numbers and rolls in range, OK')
+
+    assert compile_expression("2d6+1d8-3") is compile_expression("2d6+1d8-3"), 'compile_expression("2d6+1d8-3") should be cached'
+    distribution = compile_expression("2d6-1d6").distribution()
+    assert abs(distribution.mean() - 3.5) < 1e-12 and distribution.total == 216, 'compile_expression("2d6-1d6").distribution() is not valid'
+    distribution = compile_expression("1d6+1d8-3").distribution()
+    assert distribution.pmf(-1) == 1 / 48 and distribution.pmf(6) == 6 / 48, 'compile_expression("1d6+1d8-3").distribution() is not valid'
+    handful = compile_expression("1d6+1d8+1d6+2").to_handful()
+    assert handful == HandfulDice(Dice("2d6"), Dice("1d8"), bonus=2), 'compile_expression("1d6+1d8+1d6+2").to_handful() != HandfulDice(2d6+1d8+2)'
+    print('compile_expression(<expression>) is cached, distribution() and to_handful() are valid, OK')
+
+    for expression_str in ("", "+", "2d6+", "2d6 1d8", "2d6++1", "2x6", "1d6*2", "d6"):
+        try:
+            expression = compile_expression(expression_str)
+        except DiceExpressionError:
+            pass
+        else:
+            assert False, 'compile_expression("{expression_str}") should raise DiceExpressionError, compile_expression("{expression_str}") == {expression}'.format(expression_str=expression_str, expression=expression)
+    print('compile_expression(<incorrect expression>) raise DiceExpressionError, OK')
+
+    print("---"*20)
+    print("DiceExpression test finished")
+    print("---"*20)
+
+
+def test_service():
+    print("---"*20)
+    print("DiceService test start")
+    print("---"*20)
+
+    async def check_service(path=None):
+        batcher = RollBatcher(max_batch=64, max_delay=0.01)
+        server = DiceServer(max_pipeline=16, max_line=64, batcher=batcher)
+        await server.start(path=path)
+        port = None if path else server.address[1]
+        try:
+            client = await DiceClient.connect(port=port, path=path)
+            for i in range(20):
+                roll = await client.roll("3d6+2")
+                assert 5 <= roll <= 20, 'DiceClient.roll("3d6+2") out of range(5, 20), roll == {roll}'.format(roll=roll)
+            expression_strs = ["2d6+1d8-3", "3d6", "1d20"] * 100
+            rolls = await client.roll_many(expression_strs)
+            assert len(rolls) == len(expression_strs), 'DiceClient.roll_many(<300 expressions>) should return 300 results'
+            for expression_str, roll in zip(expression_strs, rolls):
+                expression = compile_expression(expression_str)
+                assert expression.min() <= roll <= expression.max(), 'DiceClient.roll_many(["{expression_str}"]) out of range({minimum}, {maximum}), roll == {roll}'.format(expression_str=expression_str, minimum=expression.min(), maximum=expression.max(), roll=roll)
+            assert batcher.batches < batcher.rolls, 'RollBatcher should coalesce pipelined requests, batches == {}, rolls == {}'.format(batcher.batches, batcher.rolls)
+
+            results = await client.roll_many(["3d6", "spear", "1d6", "2d6++1"], raise_errors=False)
+            assert isinstance(results[1], DiceServiceError) and isinstance(results[3], DiceServiceError), 'DiceClient.roll_many(<incorrect expressions>) should return DiceServiceError, results == {}'.format(results)
+            assert 3 <= results[0] <= 18 and 1 <= results[2] <= 6, 'DiceClient.roll_many(<mixed expressions>) results after error are not valid, results == {}'.format(results)
+            try:
+                await client.roll("1d6*2")
+            except DiceServiceError:
+                pass
+            else:
+                assert False, 'DiceClient.roll("1d6*2") should raise DiceServiceError'
+            try:
+                await client.roll_many(["1d6", "bad", "1d20", "1d20", "1d20"])
+            except DiceServiceError:
+                pass
+            else:
+                assert False, 'DiceClient.roll_many(["1d6", "bad", ...]) should raise DiceServiceError'
+            roll = await client.roll("3d6+100")
+            assert 103 <= roll <= 118, 'DiceClient.roll("3d6+100") after error should not read stale response, roll == {}'.format(roll)
+            for expression_str in ("1d99999999999999999999", "1000000000d6", "1001d6", "1d1000001"):
+                try:
+                    roll = await asyncio.wait_for(client.roll(expression_str), 5)
+                except DiceServiceError:
+                    pass
+                else:
+                    assert False, 'DiceClient.roll("{}") should raise DiceServiceError, roll == {}'.format(expression_str, roll)
+            roll = await client.roll("1000d6")
+            assert 1000 <= roll <= 6000, 'DiceClient.roll("1000d6") after too big expressions should work, roll == {}'.format(roll)
+            print('DiceClient keeps responses in sync after errors, too big expressions give ERR, OK')
+
+            clients = [await DiceClient.connect(port=port, path=path) for i in range(10)]
+            batches = batcher.batches
+            rolls = await asyncio.gather(*[other.roll_many(["1d6"] * 10) for other in clients])
+            assert all(1 <= roll <= 6 for client_rolls in rolls for roll in client_rolls), 'DiceClient.roll_many(["1d6"]) of concurrent clients out of range(1, 6)'
+            assert batcher.batches - batches < 100, 'RollBatcher should coalesce requests of concurrent clients'
+            for other in clients:
+                await other.close()
+
+            try:
+                await client.roll("1d6+" * 20 + "1")
+            except DiceServiceError:
+                pass
+            else:
+                assert False, 'DiceClient.roll(<too long line>) should raise DiceServiceError'
+            await client.close()
+        finally:
+            await server.close()
+
+    asyncio.run(check_service())
+    print('DiceClient.roll() and roll_many() are valid, pipelined and batched on TCP, OK')
+    if hasattr(asyncio, 'start_unix_server'):
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(check_service(path=os.path.join(directory, 'dice.sock')))
+        print('DiceClient.roll() and roll_many() are valid, pipelined and batched on Unix socket, OK')
+
+    print("---"*20)
+    print("DiceService test finished")
+    print("---"*20)
+
+
+def test_instrumentation():
+    print("---"*20)
+    print("Instrumentation test start")
+    print("---"*20)
+
+    original_roll = Dice.__dict__['roll']
+    original_parse = GurpsDice.__dict__['_parse_dice_str']
+    calls = []
+
+    def callback(name, elapsed, dice):
+        calls.append((name, dice))
+
+    rounded_str = GurpsDice("2d6+10").rounded().__str__()
+    gurps_dice_instrumentation.reset()
+    gurps_dice_instrumentation.add_callback(callback)
+    try:
+        with gurps_dice_instrumentation.instrumented():
+            assert gurps_dice_instrumentation.is_enabled(), 'gurps_dice_instrumentation.is_enabled() should be True inside instrumented()'
+            dice = Dice("3d6")
+            for i in range(100):
+                assert 3 <= dice.roll() <= 18, 'instrumented Dice("3d6").roll() out of range(3, 18)'
+            dice.roll_many(50)
+            assert GurpsDice("2d6+10").rounded().__str__() == rounded_str, 'instrumented GurpsDice("2d6+10").rounded() != {}'.format(rounded_str)
+            assert GurpsDice.search_dice_in_str("1d6-1") == {'count': 1, 'face': 6, 'bonus': -1}, 'instrumented GurpsDice.search_dice_in_str("1d6-1") is not valid'
+            handful = HandfulDice(Dice("1d6")) + HandfulDice(Dice("1d8"), bonus=2)
+            assert handful == HandfulDice(Dice("1d6"), Dice("1d8"), bonus=2), 'instrumented HandfulDice + HandfulDice is not valid'
+            try:
+                GurpsDice("1d8")
+            except EmptyDiceError:
+                pass
+            else:
+                assert False, 'instrumented GurpsDice("1d8") should raise EmptyDiceError'
+    finally:
+        gurps_dice_instrumentation.remove_callback(callback)
+    assert not gurps_dice_instrumentation.is_enabled(), 'gurps_dice_instrumentation.is_enabled() should be False after instrumented()'
+    assert Dice.__dict__['roll'] is original_roll and GurpsDice.__dict__['_parse_dice_str'] is original_parse, 'gurps_dice_instrumentation.disable() should put original methods back'
+    print('gurps_dice_instrumentation.instrumented() wraps methods and puts them back, OK')
+
+    snapshot = gurps_dice_instrumentation.snapshot()
+    for name, calls_count, dice_count in (("Dice.roll", 100, 300), ("Dice.roll_many", 1, 150), ("GurpsDice.rounded", 1, 0), ("GurpsDice.search_dice_in_str", 1, 0), ("HandfulDice.__add__", 1, 0)):
+        stats = snapshot[name]
+        assert (stats['calls'], stats['dice']) == (calls_count, dice_count), 'snapshot()["{name}"] calls, dice != ({calls_count}, {dice_count}), stats == {stats}'.format(name=name, calls_count=calls_count, dice_count=dice_count, stats=stats)
+        assert stats['p50_ns'] <= stats['p90_ns'] <= stats['p99_ns'] <= stats['max_ns'] <= stats['total_ns'], 'snapshot()["{name}"] latencies are not ordered, stats == {stats}'.format(name=name, stats=stats)
+    assert snapshot["Dice.roll"]['dice_per_second'] > 0, 'snapshot()["Dice.roll"]["dice_per_second"] should be positive'
+    assert snapshot["GurpsDice._parse_dice_str"]['errors'] == 1, 'snapshot()["GurpsDice._parse_dice_str"] should count 1 error'
+    assert snapshot["Dice._parse_modified_dice_str"]['calls'] == 5, '5 Dice("<str>") should be counted by snapshot()["Dice._parse_modified_dice_str"]'
+    assert calls.count(("Dice.roll", 3)) == 100, 'callback should be called after every Dice.roll()'
+    print('gurps_dice_instrumentation.snapshot() counts calls, errors, latencies and dices, callbacks are called, OK')
+
+    gurps_dice_instrumentation.reset()
+    with gurps_dice_instrumentation.instrumented():
+        GurpsDice("3d6+2").roll()
+    snapshot = gurps_dice_instrumentation.snapshot()
+    assert (snapshot["GurpsDice.roll"]['calls'], snapshot["GurpsDice.roll"]['dice']) == (1, 3), 'GurpsDice("3d6+2").roll() should be counted once with 3 dices'
+    assert "Dice.roll" not in snapshot and "Dice._is_dice_valid" not in snapshot, 'super() calls of instrumented methods should not be counted, snapshot == {}'.format(snapshot)
+    assert snapshot["GurpsDice._is_dice_valid"]['calls'] == 1, 'GurpsDice._is_dice_valid should be counted once'
+    with gurps_dice_instrumentation.instrumented():
+        Dice("4d6kh3").roll()
+    assert gurps_dice_instrumentation.snapshot()["Dice._is_modifiers_valid"]['calls'] == 2, 'Dice("4d6kh3") modifiers should be validated on init and roll'
+    print('super() calls of instrumented methods are counted once, OK')
+
+    Dice("3d6").roll()
+    assert gurps_dice_instrumentation.snapshot()["GurpsDice.roll"]['calls'] == 1, 'disabled instrumentation should not count calls'
+    gurps_dice_instrumentation.reset()
+    assert gurps_dice_instrumentation.snapshot() == {}, 'gurps_dice_instrumentation.reset() should forget stats'
+    print('disabled instrumentation does not count, reset() forgets stats, OK')
+
+    print("---"*20)
+    print("Instrumentation test finished")
+    print("---"*20)
+
+
+def test_damage():
+    print("---"*20)
+    print("Damage table test start")
+    print("---"*20)
+
+    for st, thrust_str, swing_str in (
+            (1, "1d6-6", "1d6-5"), (2, "1d6-6", "1d6-5"), (10, "1d6-2", "1d6"), (12, "1d6-1", "1d6+2"),
+            (13, "1d6", "2d6-1"), (18, "1d6+2", "3d6"), (28, "3d6-1", "5d6+1"), (40, "4d6+1", "7d6-1"),
+            (44, "4d6+1", "7d6-1"), (45, "5d6", "7d6+1"), (100, "11d6", "13d6"), (109, "11d6", "13d6"),
+            (110, "12d6", "14d6"), (250, "26d6", "28d6")):
+        thrust, swing = gurps_dice_damage.thrust(st), gurps_dice_damage.swing(st)
+        assert (thrust.__str__(), swing.__str__()) == (thrust_str, swing_str), 'thrust({st}), swing({st}) != {thrust_str}, {swing_str}, thrust({st}), swing({st}) == {thrust}, {swing}'.format(st=st, thrust_str=thrust_str, swing_str=swing_str, thrust=thrust, swing=swing)
+        assert thrust is FrozenGurpsDice(thrust_str) and swing is FrozenGurpsDice(swing_str), 'thrust({st}), swing({st}) should be shared FrozenGurpsDice'.format(st=st)
+    previous = gurps_dice_damage.thrust(1), gurps_dice_damage.swing(1)
+    for st in range(2, 300):
+        current = gurps_dice_damage.thrust(st), gurps_dice_damage.swing(st)
+        for previous_dice, current_dice in zip(previous, current):
+            assert previous_dice.distribution().mean() <= current_dice.distribution().mean(), 'damage of ST {st} should not be less than damage of ST {previous_st}'.format(st=st, previous_st=st - 1)
+        previous = current
+    print('thrust(<ST>) and swing(<ST>) are valid and shared, OK')
+
+    assert gurps_dice_damage.thrust(10 ** 7).__str__() == "1000001d6" and len(gurps_dice_damage._thrust_table) <= gurps_dice_damage.TABLE_ST + 1, 'thrust(10 ** 7) should be computed without building table up to ST 10 ** 7'
+    gurps_dice_damage._thrust_table = gurps_dice_damage._swing_table = ()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        swings = list(executor.map(gurps_dice_damage.swing, list(range(1, 101)) * 8))
+    assert swings == [gurps_dice_damage.swing(st) for st in range(1, 101)] * 8 and swings[11].__str__() == "1d6+2", 'swing(<ST>) built by 8 threads is not valid'
+    print('thrust(10 ** 7) is computed and tables are built once by threads, OK')
+
+    for st, attack, modifier, expected in (
+            (12, gurps_dice_damage.SWING, 0, "1d6+2"), (12, gurps_dice_damage.THRUST, 1, "1d6"),
+            (12, gurps_dice_damage.SWING, 1, "2d6"), (12, gurps_dice_damage.SWING, -4, "1d6-2"),
+            (10, gurps_dice_damage.THRUST, GurpsDice("1d6-1"), "1d6+1"),
+            (20, gurps_dice_damage.SWING, FrozenGurpsDice("1d6+2"), "5d6")):
+        dice = gurps_dice_damage.damage(st, attack, modifier)
+        base = GurpsDice((gurps_dice_damage.thrust if attack == gurps_dice_damage.THRUST else gurps_dice_damage.swing)(st).__str__())
+        base = base + (modifier if isinstance(modifier, int) else GurpsDice(modifier.__str__()))
+        base.round()
+        assert dice.__str__() == expected == base.__str__(), 'damage({st}, "{attack}", {modifier}) != {expected}, damage({st}, "{attack}", {modifier}) == {dice}'.format(st=st, attack=attack, modifier=modifier, expected=expected, dice=dice)
+    print('damage(<ST>, <attack>, <modifier>) is rounded like GurpsDice.round(), OK')
+
+    for st, attack, error in ((0, gurps_dice_damage.SWING, DamageTableError), (-5, gurps_dice_damage.THRUST, DamageTableError),
+                              ("12", gurps_dice_damage.SWING, TypeError), (12, "cut", DamageTableError)):
+        try:
+            dice = gurps_dice_damage.damage(st, attack)
+        except error:
+            pass
+        else:
+            assert False, 'damage({st!r}, "{attack}") should raise {error}, damage({st!r}, "{attack}") == {dice}'.format(st=st, attack=attack, error=error.__name__, dice=dice)
+    print('damage(<incorrect ST or attack>) raise error, OK')
+
+    print("---"*20)
+    print("Damage table test finished")
+    print("---"*20)
+
+
+def test_roll_engine():
+    print("---"*20)
+    print("Roll engine test start")
+    print("---"*20)
+
+    assert gurps_dice.get_roll_engine() == 'randint', 'default roll engine should be "randint"'
+    gurps_dice.set_roll_engine('bits')
+    max_outcomes = gurps_dice.ALIAS_MAX_OUTCOMES
+    gurps_dice.ALIAS_MAX_OUTCOMES = 0
+    try:
+        rng = RandomStream(17)
+        for count, face in ((0, 6), (3, 0), (4, 1), (1, 6), (3, 6), (10, 6), (2, 20), (3, 70000), (400, 6)):
+            dice = Dice(count, face)
+            for i in range(200):
+                roll = dice.roll(rng)
+                assert dice.min() <= roll <= dice.max(), 'Dice("{dice}").roll() of bits engine out of range({minimum}, {maximum}), roll == {roll}'.format(dice=dice, minimum=dice.min(), maximum=dice.max(), roll=roll)
+            rolls = dice.roll_many(500, rng=rng)
+            assert len(rolls) == 500 and dice.min() <= min(rolls) and max(rolls) <= dice.max(), 'Dice("{dice}").roll_many(500) of bits engine out of range({minimum}, {maximum})'.format(dice=dice, minimum=dice.min(), maximum=dice.max())
+        print('Dice(<count>, <face>).roll() and roll_many() of bits engine are in range, OK')
+
+        for count, face in ((1, 6), (3, 6), (2, 20)):
+            n = 100000
+            distribution = gurps_dice.get_distribution(count, face)
+            for name, rolls in (("roll()", [gurps_dice.roll_sum(count, face, rng) for i in range(n)]),
+                                ("roll_many()", gurps_dice.roll_many(count, face, n, rng=rng))):
+                counts = {}
+                for roll in rolls:
+                    counts[roll] = counts.get(roll, 0) + 1
+                chi_square = sum((counts.get(value, 0) - n * probability) ** 2 / (n * probability) for value, probability in distribution)
+                degrees = len(distribution) - 1
+                assert chi_square < degrees + 6 * degrees ** 0.5, '{name} of {count}d{face} of bits engine is biased, chi square == {chi_square}'.format(name=name, count=count, face=face, chi_square=chi_square)
+        print('roll_sum() and roll_many() of bits engine are not biased, OK')
+
+        first = GurpsDice("3d6+2").roll_many(100, rng=RandomStream(5))
+        second = GurpsDice("3d6+2").roll_many(100, rng=RandomStream(5))
+        assert list(first) == list(second), 'GurpsDice("3d6+2").roll_many(100) of bits engine should repeat with the same seed'
+        print('bits engine repeats with the same seed, OK')
+    finally:
+        gurps_dice.set_roll_engine('randint')
+        gurps_dice.ALIAS_MAX_OUTCOMES = max_outcomes
+
+    try:
+        gurps_dice.set_roll_engine('dice')
+    except ValueError:
+        pass
+    else:
+        assert False, 'set_roll_engine("dice") should raise ValueError'
+    print('set_roll_engine(<unknown engine>) raise ValueError, OK')
+
+    print("---"*20)
+    print("Roll engine test finished")
+    print("---"*20)
+
+
+def test_alias():
+    print("---"*20)
+    print("Alias sampler test start")
+    print("---"*20)
+
+    assert not gurps_dice._use_alias(1, 6, 1000), '1d6 should not be rolled by alias table'
+    assert gurps_dice._use_alias(3, 6, 1), '3d6 should be rolled by alias table'
+    assert not gurps_dice._use_alias(300, 6, 1), 'single roll of 300d6 should not build alias table'
+    assert gurps_dice._use_alias(300, 6, 2000), 'roll_many(2000) of 300d6 should build alias table'
+    assert not gurps_dice._use_alias(1000, 6, 10 ** 6), 'alias table of 1000d6 is bigger than ALIAS_MAX_OUTCOMES'
+    print('alias table is used when expected rolls cover its outcomes, OK')
+
+    for count, face in ((2, 2), (3, 6), (10, 6), (5, 20)):
+        probabilities, aliases = gurps_dice._alias_table(count, face)[:2]
+        size = len(probabilities)
+        chances = [probabilities[i] / size for i in range(size)]
+        for i in range(size):
+            chances[aliases[i]] += (1.0 - probabilities[i]) / size
+        distribution = gurps_dice.get_distribution(count, face)
+        for i, (value, probability) in enumerate(distribution):
+            assert abs(chances[i] - probability) < 1e-12, 'alias table of {count}d{face} gives {chance} for {value}, not {probability}'.format(count=count, face=face, chance=chances[i], value=value, probability=probability)
+    print('alias tables give exact probabilities, OK')
+
+    rngs = [random.Random(11)]
+    if gurps_dice._import_numpy() is not None:
+        rngs.append(gurps_dice._import_numpy().random.default_rng(11))
+    for rng in rngs:
+        for count, face in ((3, 6), (10, 6), (4, 20)):
+            n = 100000
+            distribution = gurps_dice.get_distribution(count, face)
+            for name, rolls in (("roll_sum()", [gurps_dice.roll_sum(count, face, rng) for i in range(n)]),
+                                ("roll_many()", gurps_dice.roll_many(count, face, n, rng=rng))):
+                counts = {}
+                for roll in rolls:
+                    counts[roll] = counts.get(roll, 0) + 1
+                expected = [(value, n * probability) for value, probability in distribution if n * probability >= 5]
+                chi_square = sum((counts.get(value, 0) - frequency) ** 2 / frequency for value, frequency in expected)
+                degrees = len(expected) - 1
+                assert chi_square < degrees + 6 * degrees ** 0.5, '{name} of {count}d{face} by alias table is biased, chi square == {chi_square}'.format(name=name, count=count, face=face, chi_square=chi_square)
+    print('roll_sum() and roll_many() by alias tables are not biased, OK')
+
+    dice = GurpsDice("10d6+3")
+    rolls = dice.roll_many(1000)
+    assert min(rolls) >= dice.min() and max(rolls) <= dice.max(), 'GurpsDice("10d6+3").roll_many(1000) out of range'
+    assert all(dice.min() <= dice.roll() <= dice.max() for i in range(1000)), 'GurpsDice("10d6+3").roll() out of range'
+    print('GurpsDice bonus is added to rolls of alias table, OK')
+
+    first = [Dice(10, 6).roll(RandomStream(3)) for i in range(3)] + list(Dice(10, 6).roll_many(50, rng=RandomStream(3)))
+    second = [Dice(10, 6).roll(RandomStream(3)) for i in range(3)] + list(Dice(10, 6).roll_many(50, rng=RandomStream(3)))
+    assert first == second, 'rolls by alias table should repeat with the same seed'
+    print('rolls by alias table repeat with the same seed, OK')
+
+    assert gurps_dice._alias_table.cache_info().maxsize == gurps_dice.ALIAS_CACHE_SIZE, 'alias cache should be bounded by ALIAS_CACHE_SIZE'
+    gurps_dice.clear_distribution_cache()
+    assert gurps_dice._alias_table.cache_info().currsize == 0, 'clear_distribution_cache() should forget alias tables'
+    print('alias tables are kept in bounded cache, OK')
+
+    print("---"*20)
+    print("Alias sampler test finished")
+    print("---"*20)
+
+
+def test_approximate():
+    print("---"*20)
+    print("Approximate rolls test start")
+    print("---"*20)
+
+    assert not gurps_dice_approximate.is_enabled(), 'approximate rolls should be disabled by default'
+    assert gurps_dice_approximate.get_min_count() is None, 'get_min_count() should be None by default'
+    print('exact rolls are the default, OK')
+
+    for min_count, error in ((1, ValueError), ('100', TypeError)):
+        try:
+            gurps_dice_approximate.enable(min_count)
+        except error:
+            pass
+        else:
+            assert False, 'enable({min_count!r}) should raise {error}'.format(min_count=min_count, error=error.__name__)
+    assert not gurps_dice_approximate.is_enabled(), 'enable() with wrong min count should not enable approximate rolls'
+    print('enable(<wrong min count>) raise error, OK')
+
+    with gurps_dice_approximate.approximated(100):
+        assert gurps_dice_approximate.get_min_count() == 100, 'approximated(100) should set min count 100'
+        for dice in (Dice("1000d6"), GurpsDice("200d6-30"), Dice("500d20"), HandfulDice(Dice("300d6"), Dice("2d8"), bonus=4)):
+            rolls = [dice.roll() for i in range(200)] + list(dice.roll_many(1000)) + list(dice.roll_many(1000, rng=random.Random(1)))
+            assert dice.min() <= min(rolls) and max(rolls) <= dice.max(), 'approximate rolls of {dice} out of range({minimum}, {maximum})'.format(dice=dice, minimum=dice.min(), maximum=dice.max())
+        exact = list(Dice("10d6").roll_many(100, rng=random.Random(3)))
+    assert not gurps_dice_approximate.is_enabled(), 'approximated() should disable approximate rolls on exit'
+    assert exact == list(Dice("10d6").roll_many(100, rng=random.Random(3))), 'pools less than min count should be rolled exactly'
+    print('Dice, GurpsDice and HandfulDice are rolled approximately in approximated(100), OK')
+
+    with gurps_dice_approximate.approximated(2):
+        rolls = [Dice("2d6").roll() for i in range(1000)] + list(GurpsDice("2d6+1").roll_many(1000, rng=random.Random(2)))
+        assert min(rolls) >= 2 and max(rolls) <= 13, 'approximate rolls of 2d6 should be clamped to min() and max()'
+    print('approximate rolls are clamped to min() and max(), OK')
+
+    rngs = [random.Random(7)]
+    if gurps_dice._import_numpy() is not None:
+        rngs.append(gurps_dice._import_numpy().random.default_rng(7))
+    with gurps_dice_approximate.approximated():
+        for rng in rngs:
+            n = 20000
+            rolls = sorted(gurps_dice.roll_many(200, 6, n, rng=rng))
+            distance = 0.0
+            for i, roll in enumerate(rolls):
+                if i + 1 == n or rolls[i + 1] != roll:
+                    distance = max(distance, abs((i + 1) / n - gurps_dice_approximate.approximate_cdf(200, 6, roll)))
+            assert distance < 2 / n ** 0.5, 'approximate rolls of 200d6 do not follow approximate_cdf(), distance == {distance}'.format(distance=distance)
+    print('approximate rolls follow approximate_cdf(), OK')
+
+    for count, face in ((2, 6), (10, 6), (100, 6), (50, 20)):
+        error = gurps_dice_approximate.approximation_error(count, face)
+        bound = gurps_dice_approximate.approximation_error_bound(count, face)
+        assert error <= bound, 'approximation_error({count}, {face}) == {error} is bigger than its bound {bound}'.format(count=count, face=face, error=error, bound=bound)
+    assert gurps_dice_approximate.approximation_error(100, 6) < 1e-4, 'approximation_error(100, 6) should be less than 1e-4'
+    print('approximation_error() is less than approximation_error_bound(), OK')
+
+    print("---"*20)
+    print("Approximate rolls test finished")
+    print("---"*20)
+
+
+def test_table():
+    print("---"*20)
+    print("Distribution table test start")
+    print("---"*20)
+
+    keys = [(1, 6), (3, 6), (30, 6), (3, 20), (60, 20)]
+    gurps_dice.clear_distribution_cache()
+    exact = {key: gurps_dice.get_distribution(*key) for key in keys}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dice.table")
+        assert gurps_dice_table.write_table(path, [1, 3, 30, 60], [6, 20]) == 8, 'write_table() should write 8 distributions'
+        table = gurps_dice_table.load(path)
+        try:
+            assert gurps_dice_table.get_table() is table and len(table) == 8 and (60, 20) in table, 'load() should map table of 8 distributions'
+            for key, distribution in exact.items():
+                mapped = gurps_dice.get_distribution(*key)
+                assert not isinstance(mapped.cumulative, tuple), 'get_distribution{key} should be taken from the table'.format(key=key)
+                assert (mapped.minimum, mapped.total, list(mapped.cumulative)) == (distribution.minimum, distribution.total, list(distribution.cumulative)), 'get_distribution{key} of the table != convolved one'.format(key=key)
+                assert mapped.ways == distribution.ways and list(mapped) == list(distribution) and mapped.mean() == distribution.mean(), 'get_distribution{key} of the table != convolved one'.format(key=key)
+            print('get_distribution() takes distributions from loaded table, OK')
+
+            assert isinstance(gurps_dice.get_distribution(3, 8).cumulative, tuple), 'get_distribution(3, 8) should be convolved, it is not in the table'
+            assert GurpsDice("30d6+2").distribution().cdf(110) == exact[(30, 6)].shift(2).cdf(110), 'GurpsDice("30d6+2").distribution() should use the table'
+            rolls = Dice(30, 6).roll_many(1000)
+            assert min(rolls) >= 30 and max(rolls) <= 180, 'Dice(30, 6).roll_many(1000) by alias table of mapped distribution out of range'
+            copy = pickle.loads(pickle.dumps(gurps_dice.get_distribution(60, 20)))
+            assert list(copy.cumulative) == list(exact[(60, 20)].cumulative), 'pickled distribution of the table != convolved one'
+            print('Dice and GurpsDice use loaded table, distributions of it can be pickled, OK')
+        finally:
+            assert gurps_dice_table.unload() is table, 'unload() should return loaded table'
+            table.close()
+        assert gurps_dice_table.get_table() is None, 'get_table() should be None after unload()'
+        assert isinstance(gurps_dice.get_distribution(3, 6).cumulative, tuple), 'get_distribution() should convolve after unload()'
+        print('unload() goes back to convolution, OK')
+
+        gurps_dice_table.main([path, '--count', '1-5', '--count', '10', '--face', '4,6'])
+        with gurps_dice_table.DistributionTable(path) as table:
+            assert sorted(table.keys()) == [(count, face) for count in (1, 2, 3, 4, 5, 10) for face in (4, 6)], 'gurps_dice_table.py --count 1-5 --count 10 --face 4,6 wrote wrong distributions'
+        print('gurps_dice_table.py writes distribution table, OK')
+
+        with open(path, 'rb') as table_file:
+            data = table_file.read()
+        for name, content in (("empty", b''), ("not table", b'dice table' * 10), ("truncated", data[:40]),
+                              ("new version", data[:4] + b'\x09' + data[5:])):
+            with open(path, 'wb') as table_file:
+                table_file.write(content)
+            try:
+                gurps_dice_table.DistributionTable(path)
+            except DistributionTableError:
+                pass
+            else:
+                assert False, 'DistributionTable(<{name} file>) should raise DistributionTableError'.format(name=name)
+        print('DistributionTable(<wrong file>) raise DistributionTableError, OK')
+
+    print("---"*20)
+    print("Distribution table test finished")
+    print("---"*20)
+
+
+def test_cli():
+    print("---"*20)
+    print("Command-line roller test start")
+    print("---"*20)
+
+    lines = ["3d6+2\n", "1d20\n", "# comment\n", "\n", "2d6+1d8-3\n", "2d6-1d8\n", "4d6kh3\n", "4d6!\n", "abc\n", "20000d6\n"]
+    output = io.StringIO()
+    errors = gurps_dice_cli.run('summarize', iter(lines), output)
+    expected = [
+        "3d6+2\t5\t20\t12.50\t2.96",
+        "1d20\t1\t20\t10.50\t5.77",
+        "2d6+1d8-3\t0\t17\t8.50\t3.33",
+        "2d6-1d8\t-6\t11\t2.50\t3.33",
+        "4d6kh3\t3\t18\t12.24\t2.85",
+        "4d6!\t4\t264\t16.80\t6.52",
+        "abc\tERR\tthere is no correct dice expression in str: 'abc'",
+        "20000d6\tERR\tthere are more than 10000 dices",
+    ]
+    assert errors == 2 and output.getvalue().splitlines() == expected, 'summarize gives wrong output:\n{output}'.format(output=output.getvalue())
+    print('summarize gives min, max, mean and standard deviation by line, OK')
+
+    output = io.StringIO()
+    assert gurps_dice_cli.run('validate', iter(lines), output) == 2, 'validate should find 2 wrong lines'
+    assert [line.split('\t')[2] for line in output.getvalue().splitlines()][:4] == ['GurpsDice(3d6+2)', 'Dice(1d20)', 'HandfulDice(2d6+1d8-3)', 'DiceExpression(2d6-1d8)'], 'validate should parse GurpsDice, Dice, HandfulDice and DiceExpression'
+    print('validate parses GurpsDice, Dice, HandfulDice and DiceExpression, OK')
+
+    for times in (1, 5, 1000):
+        output = io.StringIO()
+        gurps_dice_cli.run('roll', iter(lines[:6]), output, times=times, rng=random.Random(times))
+        for line, dice_str in zip(output.getvalue().splitlines(), ("3d6+2", "1d20", "2d6+1d8-3", "2d6-1d8")):
+            name, rolls = line.split('\t')
+            dice = gurps_dice_cli.parse_dice(dice_str)
+            rolls = [int(roll) for roll in rolls.split()]
+            assert name == dice_str and len(rolls) == times and dice.min() <= min(rolls) and max(rolls) <= dice.max(), 'roll --times {times} of {dice_str} gives wrong line: {line}'.format(times=times, dice_str=dice_str, line=line[:60])
+    first, second = io.StringIO(), io.StringIO()
+    gurps_dice_cli.run('roll', lines, first, times=3, rng=RandomStream(9))
+    gurps_dice_cli.run('roll', lines, second, times=3, rng=RandomStream(9))
+    assert first.getvalue() == second.getvalue(), 'roll with the same seed should repeat'
+    print('roll --times <n> rolls every line n times, OK')
+
+    class Output(object):
+        writes = 0
+
+        def write(self, text):
+            self.writes += 1
+
+        def flush(self):
+            pass
+    output = Output()
+    gurps_dice_cli.run('validate', ("{:d}d6\n".format(i % 50 + 1) for i in range(3000)), output)
+    assert output.writes == 3, '3000 lines should be written by 3 chunks, not {writes}'.format(writes=output.writes)
+    print('results are written by chunks of OUTPUT_CHUNK lines, OK')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dice.txt")
+        with open(path, 'w') as dice_file:
+            dice_file.writelines(lines[:2])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = gurps_dice_cli.main(['roll', path, '--seed', '5', '--times', '2'])
+        assert status == 0 and len(output.getvalue().splitlines()) == 2, 'gurps_dice_cli.py roll <file> should roll 2 lines'
+        with open(path, 'a') as dice_file:
+            dice_file.write("1d\n")
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert gurps_dice_cli.main(['validate', path]) == 1, 'gurps_dice_cli.py validate <file with wrong line> should exit with 1'
+        print('gurps_dice_cli.py reads files and exits with 1 on wrong lines, OK')
+
+        check = "import sys, gurps_dice_cli; gurps_dice_cli.main(sys.argv[1:]); print(sys.modules.get('numpy') is not None)"
+        for args, imported in ((['validate', path], False), (['summarize', path], False), (['roll', path, '--times', '1000'], gurps_dice._import_numpy() is not None)):
+            result = subprocess.run([sys.executable, '-c', check] + args, cwd=os.path.dirname(os.path.abspath(gurps_dice_cli.__file__)),
+                                    stdout=subprocess.PIPE, universal_newlines=True)
+            assert result.stdout.splitlines()[-1] == str(imported) or (not imported and args[0] == 'roll'), 'gurps_dice_cli.py {args} should import numpy: {imported}'.format(args=' '.join(args[:1] + args[2:]), imported=imported)
+        if gurps_dice._import_numpy() is not None:
+            check = ("import sys, gurps_dice, gurps_dice_cli; gurps_dice_cli.main(sys.argv[1:]); "
+                     "print(type(gurps_dice.roll_many(3, 6, 10)).__name__)")
+            result = subprocess.run([sys.executable, '-c', check, 'validate', path], cwd=os.path.dirname(os.path.abspath(gurps_dice_cli.__file__)),
+                                    stdout=subprocess.PIPE, universal_newlines=True)
+            assert result.stdout.splitlines()[-1] == 'ndarray', 'roll_many() after gurps_dice_cli.py validate should be vectorized by numpy'
+    print('numpy is imported only by roll --times <many> and stays usable after it, OK')
+
+    print("---"*20)
+    print("Command-line roller test finished")
+    print("---"*20)
+
+
+def test_contest():
+    print("---"*20)
+    print("Contest test start")
+    print("---"*20)
+
+    for skill1, skill2 in ((12, 10), (10, 12), (3, 20), (16, 16), (-10, 25)):
+        probabilities = gurps_dice_success.quick_contest_probabilities(skill1, skill2)
+        assert abs(sum(probabilities) - 1.0) < 1e-12, 'quick_contest_probabilities({skill1}, {skill2}) should sum to 1'.format(skill1=skill1, skill2=skill2)
+        reverse = gurps_dice_success.quick_contest_probabilities(skill2, skill1)
+        assert probabilities == reverse[::-1], 'quick_contest_probabilities({skill1}, {skill2}) should be reverse of ({skill2}, {skill1})'.format(skill1=skill1, skill2=skill2)
+    assert gurps_dice_success.quick_contest_probabilities(12, 12)[0] == gurps_dice_success.quick_contest_probabilities(12, 12)[2], 'equal skills should win equally'
+    assert gurps_dice_success.regular_contest_probabilities(20, 18) == gurps_dice_success.regular_contest_probabilities(14, 12), 'regular contest 20 vs 18 should be rolled as 14 vs 12'
+    first, tie, second = gurps_dice_success.regular_contest_probabilities(12, 10)
+    success1, success2 = gurps_dice_success.success_probability(12), gurps_dice_success.success_probability(10)
+    assert tie == 0.0 and abs(first - success1 * (1 - success2) / (success1 * (1 - success2) + success2 * (1 - success1))) < 1e-12, 'regular_contest_probabilities(12, 10) is wrong'
+    assert gurps_dice_success.win_probability(12, 10) == gurps_dice_success.quick_contest_probabilities(12, 10)[0], 'win_probability(12, 10) should be the quick contest one'
+    assert gurps_dice_success.win_probability(12, 10, regular=True) == first, 'win_probability(12, 10, regular=True) should be the regular contest one'
+    print('quick and regular contest probabilities are exact, OK')
+
+    n = 40000
+    for name, contest, probabilities_of in (("quick_contest", gurps_dice_success.quick_contest, gurps_dice_success.quick_contest_probabilities),
+                                            ("regular_contest", gurps_dice_success.regular_contest, gurps_dice_success.regular_contest_probabilities)):
+        for rng in (None, random.Random(4)):
+            skills1 = [12, 5] * (n // 2)
+            skills2 = [10, 9] * (n // 2)
+            winners, margins = contest(skills1, skills2, rng=rng)
+            assert len(winners) == len(margins) == n, '{name}() should return {n} winners and margins'.format(name=name, n=n)
+            for offset, (skill1, skill2) in enumerate(((12, 10), (5, 9))):
+                expected = probabilities_of(skill1, skill2)
+                for winner, probability in zip((1, 0, -1), expected):
+                    frequency = sum(1 for i in range(offset, n, 2) if winners[i] == winner) / (n // 2)
+                    assert abs(frequency - probability) < 5 * (probability * (1 - probability) / (n // 2)) ** 0.5 + 1e-9, '{name}({skill1}, {skill2}) gives {winner} with frequency {frequency}, not {probability}'.format(name=name, skill1=skill1, skill2=skill2, winner=winner, frequency=frequency, probability=probability)
+            for i in range(n):
+                if winners[i] == 1:
+                    assert margins[i] >= -4, '{name}() first wins with margin {margin}'.format(name=name, margin=margins[i])
+        print('{name}() follows exact probabilities, OK'.format(name=name))
+
+    winners, margins = gurps_dice_success.quick_contest([14] * 100, [10] * 100, rng=random.Random(2))
+    for i, (winner, margin) in enumerate(zip(winners, margins)):
+        assert winner == 0 or margin == 0 or winner * margin > 0 or abs(margin) <= 4, 'quick_contest() winner {winner} does not agree with margin {margin}'.format(winner=winner, margin=margin)
+    assert list(gurps_dice_success.quick_contest([14, 3], [10, 18], rng=RandomStream(8))[0]) == list(gurps_dice_success.quick_contest([14, 3], [10, 18], rng=RandomStream(8))[0]), 'quick_contest() with the same seed should repeat'
+    assert list(gurps_dice_success.regular_contest([3] * 10, [3] * 10, max_rounds=0)[0]) == [0] * 10, 'regular_contest(max_rounds=0) should not resolve contests'
+    assert [len(results) for results in gurps_dice_success.quick_contest([], [])] == [0, 0], 'quick_contest([], []) should return empty arrays'
+    print('contests are reproducible, not resolved contests are ties, OK')
+
+    for skills1, skills2, error in (([12, 10], [10], SuccessRollError), ([12.5], [10], TypeError)):
+        try:
+            gurps_dice_success.quick_contest(skills1, skills2)
+        except error:
+            pass
+        else:
+            assert False, 'quick_contest({skills1}, {skills2}) should raise {error}'.format(skills1=skills1, skills2=skills2, error=error.__name__)
+    try:
+        gurps_dice_success.win_probability(12.5, 10)
+    except TypeError:
+        pass
+    else:
+        assert False, 'win_probability(12.5, 10) should raise TypeError'
+    print('contests of wrong skills raise error, OK')
+
+    print("---"*20)
+    print("Contest test finished")
+    print("---"*20)
+
+
+def test_modifiers():
+    print("---"*20)
+    print("Modifiers test start")
+    print("---"*20)
+
+    dice = Dice("4d6r2!kh3")
+    assert (dice.count, dice.face, dice.modifiers) == (4, 6, DiceModifiers(explode=True, reroll=2, keep_highest=3)), 'Dice("4d6r2!kh3") is parsed wrong: {dice!r}'.format(dice=dice)
+    assert str(dice) == '4d6r2!kh3' and str(Dice(3, 8, keep_lowest=1)) == '3d8kl1' and str(Dice("5d10k2")) == '5d10kh2', 'str of Dice with modifiers should be parsed back'
+    assert Dice.search_dice_in_str("2d10") == {'count': 2, 'face': 10}, 'search_dice_in_str("2d10") should not have modifiers'
+    assert Dice.search_dice_in_str("3d6r3!kl2") == {'count': 3, 'face': 6, 'explode': True, 'reroll': 3, 'keep_lowest': 2}, 'search_dice_in_str("3d6r3!kl2") is wrong'
+    assert not Dice("3d6").modifiers and str(Dice("2d6!") + Dice("1d6!")) == '3d6!', 'exploding Dice should stack'
+    print('modifiers are parsed and printed, OK')
+
+    for dice_str, error in (("2d1!", DiceModifierError), ("3d6r7", DiceModifierError), ("3d6kh4", DiceModifierError),
+                            ("3d6!!", EmptyDiceError), ("3d6kx2", EmptyDiceError)):
+        try:
+            Dice(dice_str)
+        except error:
+            pass
+        else:
+            assert False, 'Dice("{dice_str}") should raise {error}'.format(dice_str=dice_str, error=error.__name__)
+    for dices, error in (((Dice("4d6kh3"), Dice("4d6kh3")), DiceModifierError), ((Dice("2d6!"), Dice("2d6")), DiceModifierError)):
+        try:
+            dices[0] + dices[1]
+        except error:
+            pass
+        else:
+            assert False, '{dices} should not stack'.format(dices=dices)
+    try:
+        Dice(3, 6, keep_highest=2, keep_lowest=1)
+    except DiceModifierError:
+        pass
+    else:
+        assert False, 'Dice can not keep both highest and lowest'
+    for convert in (HandfulDice, FrozenDice.from_dice):
+        try:
+            convert(Dice("4d6kh3"))
+        except (gurps_dice_handful.HandfulDiceError, DiceModifierError):
+            pass
+        else:
+            assert False, '{convert} should not drop modifiers of Dice'.format(convert=convert)
+    dice = GurpsDice("3d6+2")
+    try:
+        dice.set_modifiers(keep_highest=1)
+    except DiceModifierError:
+        pass
+    else:
+        assert False, 'GurpsDice("3d6+2").set_modifiers(keep_highest=1) should raise DiceModifierError'
+    assert not dice.modifiers and str(dice) == '3d6+2', 'GurpsDice should stay without modifiers, not {dice}'.format(dice=dice)
+    print('wrong modifiers raise error, OK')
+
+    max_explosions = gurps_dice.MAX_EXPLOSIONS
+    gurps_dice.MAX_EXPLOSIONS = 2
+    gurps_dice.clear_distribution_cache()
+    try:
+        for face, reroll, explode in ((4, 0, False), (4, 2, False), (4, 0, True), (3, 2, True)):
+            # one dice by all its draws: reroll draw, first draw, two explosion draws
+            die = {}
+            for first, second, third, fourth in itertools.product(range(1, face + 1), repeat=4):
+                value = first if first >= reroll else second
+                if explode and value == face:
+                    value += third
+                    if third == face:
+                        value += fourth
+                die[value] = die.get(value, 0) + 1
+            for count, keep in ((3, 0), (3, 2), (4, 1)):
+                for highest in (True, False):
+                    modifiers = DiceModifiers(explode=explode, reroll=reroll,
+                                              keep_highest=keep if highest else 0, keep_lowest=0 if highest else keep)
+                    expected = {}
+                    for values in itertools.product(die.items(), repeat=count):
+                        kept = sorted(value for value, ways in values)
+                        kept = kept[-keep:] if keep and highest else kept[:keep] if keep else kept
+                        ways = 1
+                        for value, value_ways in values:
+                            ways *= value_ways
+                        expected[sum(kept)] = expected.get(sum(kept), 0) + ways
+                    distribution = gurps_dice.get_modified_distribution(count, face, modifiers)
+                    total = sum(expected.values())
+                    for value in range(distribution.minimum - 1, distribution.maximum + 2):
+                        assert distribution.pmf(value) * total == expected.get(value, 0) or abs(distribution.pmf(value) - expected.get(value, 0) / total) < 1e-15, '{count}d{face}{modifiers} has wrong P({value})'.format(count=count, face=face, modifiers=modifiers, value=value)
+                    dice = Dice(count, face, **modifiers._asdict())
+                    assert (dice.min(), dice.max()) == (min(expected), max(expected)), '{dice!r} min and max should be {low}, {high}'.format(dice=dice, low=min(expected), high=max(expected))
+    finally:
+        gurps_dice.MAX_EXPLOSIONS = max_explosions
+        gurps_dice.clear_distribution_cache()
+    print('modified distributions are equal to enumeration, OK')
+
+    distribution = Dice("1d6!").distribution()
+    expected_mean = sum(3.5 / 6 ** i for i in range(gurps_dice.MAX_EXPLOSIONS + 1))
+    assert abs(distribution.mean() - expected_mean) < 1e-12, 'mean of 1d6! should be {expected_mean}'.format(expected_mean=expected_mean)
+    distribution = Dice("100d6kh3").distribution()
+    assert (distribution.minimum, distribution.maximum) == (3, 18) and distribution.total == 6 ** 100, '100d6kh3 distribution is wrong'
+    assert Dice("10d6kh3").distribution() is Dice("10d6kh3").distribution(), 'modified distribution should be cached'
+    print('keep distributions of big pools are computed without enumeration, OK')
+
+    n = 60000
+    for dice_str in ("4d6kh3", "3d6r3!kl2", "2d4!", "5d8r2"):
+        dice = Dice(dice_str)
+        distribution = dice.distribution()
+        for rng in (None, random.Random(5)):
+            results = dice.roll_many(n, rng=rng)
+            mean = sum(results) / n
+            deviation = (sum((value - distribution.mean()) ** 2 * probability for value, probability in distribution) / n) ** 0.5
+            assert abs(mean - distribution.mean()) < 5 * deviation, '{dice_str} rolls have mean {mean}, not {expected}'.format(dice_str=dice_str, mean=mean, expected=distribution.mean())
+            assert dice.min() <= min(results) and max(results) <= dice.max(), '{dice_str} rolls are out of range'.format(dice_str=dice_str)
+        rolls = [dice.roll(random.Random(i)) for i in range(200)]
+        assert all(dice.min() <= roll_result <= dice.max() for roll_result in rolls), '{dice_str}.roll() is out of range'.format(dice_str=dice_str)
+        assert dice.roll(RandomStream(3)) == dice.roll(RandomStream(3)), '{dice_str}.roll() with the same seed should repeat'.format(dice_str=dice_str)
+    print('modified rolls follow exact distributions, OK')
+
+    print("---"*20)
+    print("Modifiers test finished")
+    print("---"*20)
+
+
+def test_codec():
+    print("---"*20)
+    print("Codec test start")
+    print("---"*20)
+
+    dices = [Dice("3d8"), GurpsDice("3d6-2"), GurpsDice("10d6+30"), Dice("4d6r2!kl3"), Dice("10d10kh3"),
+             HandfulDice(Dice("2d6"), Dice("1d8"), GurpsDice("1d6+3")), HandfulDice(), FrozenDice(2, 10), FrozenGurpsDice(3, 1)]
+    for dice in dices:
+        binary = gurps_dice_codec.encode(dice)
+        copy = gurps_dice_codec.decode(binary)
+        assert copy.__class__ is dice.__class__ and str(copy) == str(dice), 'decode(encode({dice!r})) == {copy!r}'.format(dice=dice, copy=copy)
+        copy = pickle.loads(pickle.dumps(dice))
+        assert copy.__class__ is dice.__class__ and str(copy) == str(dice), 'pickled {dice!r} == {copy!r}'.format(dice=dice, copy=copy)
+    assert len(gurps_dice_codec.encode(GurpsDice("3d6+2"))) == gurps_dice_codec.RECORD_SIZE == 8, 'GurpsDice should be 8 bytes'
+    assert gurps_dice_codec.decode(gurps_dice_codec.encode(FrozenGurpsDice(3, 2))) is FrozenGurpsDice(3, 2), 'decoded FrozenGurpsDice should be interned'
+    print('dices are encoded, decoded and pickled by binary form, OK')
+
+    for dice in (GurpsDice(1, 40000), GurpsDice(2, -40000), Dice(1, 70000), Dice(70000, 6), Dice(70000, 6, keep_highest=3),
+                 HandfulDice(Dice(1, 70000)), HandfulDice(Dice("2d6"), bonus=1 << 40)):
+        try:
+            gurps_dice_codec.encode(dice)
+        except gurps_dice_codec.DiceCodecError:
+            pass
+        else:
+            assert False, 'encode({dice!r}) should raise DiceCodecError'.format(dice=dice)
+        for copy in (pickle.loads(pickle.dumps(dice)), deepcopy(dice)):
+            assert copy.__class__ is dice.__class__ and str(copy) == str(dice), 'pickled {dice!r} == {copy!r}'.format(dice=dice, copy=copy)
+    print('dices out of binary form are pickled by default, OK')
+
+    buffer = gurps_dice_codec.encode_many(dices * 3)
+    for view in (bytes(buffer), buffer, memoryview(buffer)):
+        copies = gurps_dice_codec.decode_many(view)
+        assert [str(dice) for dice in copies] == [str(dice) for dice in dices * 3], 'decode_many() of {view_type} is wrong'.format(view_type=type(view).__name__)
+    plain = [GurpsDice("3d6+2"), Dice("1d20"), FrozenDice(2, 10)] * 100
+    columns = gurps_dice_codec.decode_columns(memoryview(gurps_dice_codec.encode_many(plain)))
+    assert list(columns.rows())[:3] == [(3, 6, 2, 0), (1, 20, 0, 0), (2, 10, 0, 0)] and len(columns) == 300, 'decode_columns() is wrong'
+    for results in (array('q', [5, -3, 2 ** 40]), [7, 8], gurps_dice.roll_many(3, 6, 1000, bonus=2)):
+        binary = b'xyz' + gurps_dice_codec.encode_results(results) + gurps_dice_codec.encode(Dice("1d6"))
+        decoded, offset = gurps_dice_codec.decode_results(binary, 3)
+        assert list(decoded) == list(results), 'decode_results() != {results}'.format(results=list(results)[:5])
+        assert str(gurps_dice_codec.decode_from(binary, offset)[0]) == '1d6', 'decode_results() should return offset after results'
+    print('dices and roll results are decoded in bulk from buffers, OK')
+
+    for dice, error in ((Dice(70000, 6), gurps_dice_codec.DiceCodecError), (GurpsDice(1, 40000), gurps_dice_codec.DiceCodecError), ("3d6", TypeError)):
+        try:
+            gurps_dice_codec.encode(dice)
+        except error:
+            pass
+        else:
+            assert False, 'encode({dice!r}) should raise {error}'.format(dice=dice, error=error.__name__)
+    binary = gurps_dice_codec.encode(GurpsDice("3d6"))
+    for broken in (binary[:5], b'\x09' + binary[1:], binary + b'\x00'):
+        try:
+            gurps_dice_codec.decode(broken)
+        except gurps_dice_codec.DiceCodecError:
+            pass
+        else:
+            assert False, 'decode({broken!r}) should raise DiceCodecError'.format(broken=broken)
+    for broken in (gurps_dice_codec.encode(Dice("4d6kh3")), b'\x00' * 7):
+        try:
+            gurps_dice_codec.decode_columns(broken)
+        except gurps_dice_codec.DiceCodecError:
+            pass
+        else:
+            assert False, 'decode_columns({broken!r}) should raise DiceCodecError'.format(broken=broken)
+    print('wrong and broken binary dices raise error, OK')
+
+    print("---"*20)
+    print("Codec test finished")
+    print("---"*20)
+
+
+def test_journal():
+    print("---"*20)
+    print("Journal test start")
+    print("---"*20)
+
+    dices = [GurpsDice("3d6+2"), Dice("1d20"), Dice("4d6kh3"), Dice("3d6r2!")]
+    with tempfile.TemporaryDirectory() as directory:
+        journal = gurps_dice_journal.RollJournal(directory, segment_records=50, seed=7)
+        with gurps_dice_journal.journaled(journal):
+            assert gurps_dice_journal.is_enabled(), 'journal should be enabled inside journaled()'
+            results = [dices[i % 4].roll() for i in range(120)]
+            external = GurpsDice("2d6").roll(RandomStream(3))
+            assert 40002 <= GurpsDice(2, 40000).roll() <= 40012 and 1 <= Dice(1, 70000).roll() <= 70000, 'dices out of binary form should be rolled by journal'
+        assert not gurps_dice_journal.is_enabled(), 'journal should be disabled after journaled()'
+        Dice("1d6").roll()
+        journal.close()
+        assert len(gurps_dice_journal.segment_paths(directory)) == 3, 'journal of 121 records should have 3 segments of 50'
+        records = list(gurps_dice_journal.iter_records(directory))
+        assert [record.result for record in records] == results + [external], 'journal should record results of all rolls in order, but not of dices out of binary form'
+        assert [record.dice for record in records[:4]] == ['3d6+2', '1d20', '4d6kh3', '3d6r2!'] and records[-1].flags == gurps_dice_journal.EXTERNAL, 'journal records dices wrong'
+        assert gurps_dice_journal.replay(directory) == (120, 1, []), 'replay() should verify all rolls of the journal stream'
+        print('rolls are recorded to rotated segments and replayed from seeds, OK')
+
+        with gurps_dice_journal.journaled(directory):
+            more = [dices[0].roll() for i in range(10)]
+        records = list(gurps_dice_journal.iter_records(directory, dice="3d6+2"))
+        assert [record.result for record in records] == results[::4] + more, 'iter_records(dice="3d6+2") should filter records'
+        assert gurps_dice_journal.replay(directory).verified == 130, 'reopened journal should continue to be replayed'
+        since = records[-10].timestamp
+        assert [record.result for record in gurps_dice_journal.iter_records(directory, since=since)] == more, 'iter_records(since) should filter by timestamp'
+        if gurps_dice._import_numpy() is not None:
+            records_array = gurps_dice_journal.read_array(directory, dice=GurpsDice("3d6+2"))
+            assert list(records_array['result']) == [record.result for record in records], 'read_array() should filter like iter_records()'
+            assert len(gurps_dice_journal.read_array(directory, since=since, until=since)) == 0, 'read_array() of empty time range should be empty'
+        print('journal is read and filtered, OK')
+
+        path = gurps_dice_journal.segment_paths(directory)[0]
+        with open(path, 'r+b') as segment_file:
+            segment_file.seek(32 + 24)
+            segment_file.write((1000).to_bytes(8, 'little'))
+        report = gurps_dice_journal.replay(directory)
+        assert len(report.mismatches) == 1 and report.mismatches[0].result == 1000, 'replay() should find changed result'
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            status = gurps_dice_journal.main(['replay', directory])
+        assert status == 1 and 'MISMATCH' in output.getvalue(), 'journal replay should fail on changed result'
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            gurps_dice_journal.main(['show', directory, '--dice', '1d20'])
+        assert len(output.getvalue().splitlines()) == 30, 'journal show --dice 1d20 should print 30 records'
+        print('replay finds changed results, OK')
+
+        try:
+            journal.roll(Dice("1d6"))
+        except gurps_dice_journal.JournalError:
+            pass
+        else:
+            assert False, 'closed journal should raise JournalError'
+        not_journal = os.path.join(directory, 'rolls-00000009.journal')
+        with open(not_journal, 'wb') as segment_file:
+            segment_file.write(b'x' * 100)
+        try:
+            gurps_dice_journal.RollJournal(directory)
+        except gurps_dice_journal.JournalError:
+            pass
+        else:
+            assert False, 'wrong segment should raise JournalError'
+        print('closed journal and wrong segments raise error, OK')
+
+    print("---"*20)
+    print("Journal test finished")
+    print("---"*20)
+
 if run_test_dice:
     test_dice()
 if run_test_gurps_dice:
     test_gurps_dice()
+if run_test_distribution:
+    test_distribution()
+if run_test_roll_many:
+    test_roll_many()
+if run_test_success_roll:
+    test_success_roll()
+if run_test_parse_cache:
+    test_parse_cache()
+if run_test_frozen_dice:
+    test_frozen_dice()
+if run_test_handful_dice:
+    test_handful_dice()
+if run_test_random_stream:
+    test_random_stream()
+if run_test_simulation:
+    test_simulation()
+if run_test_rounding:
+    test_rounding()
+if run_test_bulk:
+    test_bulk()
+if run_test_expression:
+    test_expression()
+if run_test_service:
+    test_service()
+if run_test_instrumentation:
+    test_instrumentation()
+if run_test_damage:
+    test_damage()
+if run_test_roll_engine:
+    test_roll_engine()
+if run_test_alias:
+    test_alias()
+
+if run_test_approximate:
+    test_approximate()
+
+if run_test_table:
+    test_table()
+
+if run_test_cli:
+    test_cli()
+
+if run_test_contest:
+    test_contest()
+
+if run_test_modifiers:
+    test_modifiers()
+
+if run_test_codec:
+    test_codec()
+
+if run_test_journal:
+    test_journal()